@@ -0,0 +1,114 @@
+"""
+The benchmark of the content-defined chunking from core/chunking.py. It measures the throughput
+of the chunking of the random data and of the text, and the part of the chunks which the edited copy
+of the data (the inserted, the removed and the overwritten bytes) shares with the original.
+
+    $ python3 benchmarks/bench_chunking.py --size 256 --edits 100 --output chunking.json
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import typing as t
+
+ROOT_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_FOLDER)
+
+import config  # noqa: E402
+from core import chunking  # noqa: E402
+
+
+def edit_data(data: bytes, edits: int, rng: random.Random) -> bytes:
+    """
+    :param data: The original data.
+    :param edits: The number of the edits.
+    :param rng: The random generator.
+    :return: The copy of the data with the random inserted, removed and overwritten bytes.
+    """
+    edited = bytearray(data)
+    for _ in range(edits):
+        position = rng.randrange(len(edited))
+        size = rng.randint(1, 100)
+        edit = rng.choice(("insert", "remove", "overwrite"))
+        if edit == "insert":
+            edited[position:position] = rng.randbytes(size)
+        elif edit == "remove":
+            del edited[position:position + size]
+        else:
+            edited[position:position + size] = rng.randbytes(size)
+    return bytes(edited)
+
+
+def split(data: bytes) -> t.List[t.Tuple[bytes, int]]:
+    """
+    :param data: The data.
+    :return: The chunks of the data with the configured sizes.
+    """
+    return list(chunking.iter_chunks(io.BytesIO(data), config.CHUNK_WINDOW_SIZE, config.CHUNK_MAX_SIZE, config.HASH_BUFFER_SIZE))
+
+
+def measure(function: t.Callable[[], t.Any], repeat: int) -> float:
+    """
+    :param function: The measured function.
+    :param repeat: The number of the runs.
+    :return: The median of the durations in seconds.
+    """
+    durations = list()
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - started)
+    return statistics.median(durations)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=256, help="The size of the data in MiB.")
+    parser.add_argument("--edits", type=int, default=100, help="The number of the edits of the copy.")
+    parser.add_argument("--repeat", type=int, default=3, help="The number of the runs.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Save the results to the JSON file.")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    size = args.size * 1024 * 1024
+    # the text with the repeated lines like the logs
+    words = [rng.randbytes(rng.randint(2, 10)).hex().encode() for _ in range(5000)]
+    text = bytearray()
+    while len(text) < size:
+        text += b" ".join(rng.choices(words, k=rng.randint(5, 20))) + b"\n"
+
+    results = {
+        "benchmark": "chunking",
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "size_bytes": size,
+        "window": config.CHUNK_WINDOW_SIZE,
+        "max_size": config.CHUNK_MAX_SIZE,
+        "data": dict(),
+    }
+    for name, data in (("random", os.urandom(size)), ("text", bytes(text[:size]))):
+        chunks = split(data)
+        edited = split(edit_data(data, args.edits, rng))
+        original_digests = {digest for digest, _ in chunks}
+        results["data"][name] = {
+            "mb_per_second": size / measure(lambda: split(data), args.repeat) / 1024 / 1024,
+            "chunks": len(chunks),
+            "average_chunk_bytes": size / len(chunks),
+            "shared_bytes_ratio": sum(size for digest, size in edited if digest in original_digests) / size,
+        }
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""
+The benchmark of the hash algorithms from core/hashers.py. It measures the throughput of each algorithm
+in one thread (the speed of one core) and in the pool of the threads like the scan (hashlib releases the GIL),
+and the throughput of the function get_hash() reading the file from the page cache.
+
+    $ python3 benchmarks/bench_hash.py --size 256 --jobs 4 --output hash.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import typing as t
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_FOLDER)
+
+import config  # noqa: E402
+import core.sdfcore as sdf  # noqa: E402
+from core import hashers  # noqa: E402
+
+
+def hash_buffer(algorithm: str, data: memoryview) -> str:
+    """
+    Hashing the data in the blocks of the size config.HASH_BUFFER_SIZE like the function get_stream_hash().
+
+    :param algorithm: The name of the algorithm.
+    :param data: The hashed data.
+    :return: The hexadecimal hash.
+    """
+    file_hash = hashers.get_hasher(algorithm)()
+    for offset in range(0, len(data), config.HASH_BUFFER_SIZE):
+        file_hash.update(data[offset:offset + config.HASH_BUFFER_SIZE])
+    return file_hash.hexdigest()
+
+
+def measure(function: t.Callable[[], t.Any], repeat: int) -> float:
+    """
+    :param function: The measured function.
+    :param repeat: The number of the runs.
+    :return: The median of the durations in seconds.
+    """
+    durations = list()
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - started)
+    return statistics.median(durations)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=256, help="The size of the hashed data in MiB.")
+    parser.add_argument("--jobs", type=int, help="The number of the hashing threads (the number of CPUs by default).")
+    parser.add_argument("--repeat", type=int, default=3, help="The number of the runs.")
+    parser.add_argument("--algorithms", nargs="*", help="The measured algorithms (all available by default).")
+    parser.add_argument("--output", help="Save the results to the JSON file.")
+    args = parser.parse_args()
+
+    workers = sdf.get_workers(args.jobs)
+    size = args.size * 1024 * 1024
+    data = memoryview(os.urandom(size))
+    # each thread hashes its own part of the data
+    part = size // workers
+
+    results = {
+        "benchmark": "hash",
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "size_bytes": size,
+        "workers": workers,
+        "algorithms": dict(),
+    }
+    with tempfile.NamedTemporaryFile() as file, ThreadPoolExecutor(max_workers=workers) as executor:
+        file.write(data)
+        file.flush()
+        # the file is read once, so the page cache does not favour the algorithms measured later
+        sdf.get_hash(file.name, algorithm="md5")
+
+        for algorithm in args.algorithms or hashers.list_algorithms():
+            one_thread = measure(lambda: hash_buffer(algorithm, data), args.repeat)
+            threads = measure(lambda: list(executor.map(
+                lambda index: hash_buffer(algorithm, data[index * part:(index + 1) * part]), range(workers)
+            )), args.repeat)
+            get_hash = measure(lambda: sdf.get_hash(file.name, algorithm=algorithm), args.repeat)
+            results["algorithms"][algorithm] = {
+                "digest_bytes": len(hash_buffer(algorithm, data[:0])) // 2,
+                "mb_per_second": size / one_thread / 1024 / 1024,
+                "threads_mb_per_second": part * workers / threads / 1024 / 1024,
+                "get_hash_mb_per_second": size / get_hash / 1024 / 1024,
+            }
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""
+The benchmark of the deleting of the root folder. It creates the catalog with the synthetic files
+in one root folder (like benchmarks/bench_storage.py) and compares the deleting of the files loaded to the ORM
+session one by one (the cascade of the relationships without the passive deletes) with the function
+delete_root_folders() which deletes the root folder by one statement and the rows of the other tables
+by ON DELETE CASCADE of the database. The peak of the memory allocated by Python is measured in the separate run.
+
+    $ python3 benchmarks/bench_purge.py --files 1000000 --output purge.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import typing as t
+
+ROOT_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_FOLDER)
+
+import core.sdfcore as sdf  # noqa: E402
+from benchmarks.bench_storage import create_legacy_catalog  # noqa: E402
+from core import db  # noqa: E402
+
+
+def delete_loaded_objects(session) -> None:
+    """
+    Deleting the root folder like the ORM cascade, all files and directories are loaded before the delete.
+
+    :param session: The session of the catalog.
+    """
+    root_folder = session.query(db.RootFolder).one()
+    for item in [*root_folder.files, *root_folder.directories, *root_folder.scan_jobs]:
+        session.delete(item)
+    session.delete(root_folder)
+    session.commit()
+
+
+def delete_by_cascade(session) -> None:
+    """
+    :param session: The session of the catalog.
+    """
+    sdf.delete_root_folders(session, [session.query(db.RootFolder.id).scalar()])
+
+
+def run(path: str, delete: t.Callable[[t.Any], None], trace: bool) -> t.Dict[str, t.Any]:
+    """
+    :param path: Path to the copy of the catalog, it is deleted after the run.
+    :param delete: The function deleting the root folder.
+    :param trace: Measure the peak of the memory instead of the duration.
+    :return: The duration in seconds or the peak of the memory in bytes and the number of the remaining files.
+    """
+    sdf.catalog.open(f"sqlite:///{path}")
+    session = sdf.catalog.session
+    if trace:
+        tracemalloc.start()
+    started = time.perf_counter()
+    delete(session)
+    result = {"duration_s": time.perf_counter() - started}
+    if trace:
+        result = {"peak_memory_bytes": tracemalloc.get_traced_memory()[1]}
+        tracemalloc.stop()
+    result["remaining_files"] = session.query(db.File).count()
+    sdf.catalog.close()
+    os.remove(path)
+    return result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=200_000, help="The number of the files in the root folder.")
+    parser.add_argument("--files-per-directory", type=int, default=50, help="The average number of the files in one directory.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Save the results to the JSON file.")
+    args = parser.parse_args()
+
+    results = {
+        "benchmark": "purge",
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "files": args.files,
+    }
+    with tempfile.TemporaryDirectory() as working_folder:
+        catalog_path = os.path.join(working_folder, "catalog.sqlite")
+        create_legacy_catalog(catalog_path, args.files, args.files_per_directory, 0.2, args.seed)
+        # the catalog is upgraded once, each run deletes the root folder from its own copy
+        sdf.catalog.open(f"sqlite:///{catalog_path}")
+        sdf.catalog.close()
+        for name, delete in (("orm", delete_loaded_objects), ("cascade", delete_by_cascade)):
+            results[name] = dict()
+            for trace in (False, True):
+                copy_path = os.path.join(working_folder, f"{name}.sqlite")
+                shutil.copyfile(catalog_path, copy_path)
+                results[name].update(run(copy_path, delete, trace))
+    if results["orm"]["remaining_files"] or results["cascade"]["remaining_files"]:
+        print("The root folder was not deleted with its files.", file=sys.stderr)
+        return 1
+    results["speedup"] = results["orm"]["duration_s"] / results["cascade"]["duration_s"]
+    results["memory_reduction"] = 1 - results["cascade"]["peak_memory_bytes"] / results["orm"]["peak_memory_bytes"]
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,188 @@
+"""
+The benchmark of the scan on the synthetic tree. It measures the cold and the warm full scan to the new database,
+the rescan of the unchanged tree, the incremental rescan, the check of the changed files and the loading
+of the groups of the duplicate files. The results are printed as JSON and they can be compared with the results
+of another commit, the exit code is 1 if any stage is slower than the threshold.
+
+    $ python3 benchmarks/bench_scan.py --files 5000 --output new.json
+    $ python3 benchmarks/bench_scan.py --files 5000 --baseline old.json --threshold 0.2
+
+The cold scan evicts the files of the tree from the page cache by posix_fadvise(), it does not need the root.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import typing as t
+
+ROOT_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_FOLDER)
+
+import core.sdfcore as sdf  # noqa: E402
+from benchmarks.synthetic_tree import add_tree_arguments, generate_tree, spec_from_arguments  # noqa: E402
+
+STAGES = [
+    "cold_full_scan",
+    "warm_full_scan",
+    "rescan",
+    "incremental_rescan",
+    "check_changed_files",
+    "check_changed_files_paranoid",
+    "load_duplicate_files",
+    "iter_duplicate_groups",
+]
+""" The measured stages in the order of the run """
+
+
+def evict_page_cache(root_folder: str) -> bool:
+    """
+    Evicting the files of the tree from the page cache, so the next scan reads them from the disk.
+
+    :param root_folder: Full path to the root folder of the tree.
+    :return: False if the platform does not support posix_fadvise().
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return False
+    for directory, _, files in os.walk(root_folder):
+        for file in files:
+            fd = os.open(os.path.join(directory, file), os.O_RDONLY)
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            finally:
+                os.close(fd)
+    return True
+
+
+def measure(function: t.Callable[[], t.Any]) -> float:
+    """
+    :param function: The measured function.
+    :return: The duration of the function in seconds.
+    """
+    started = time.perf_counter()
+    function()
+    return time.perf_counter() - started
+
+
+def run_stages(root_folder: str, working_folder: str, run: int, workers: t.Optional[int]) -> t.Dict[str, float]:
+    """
+    Running all stages once, each run uses the new database.
+
+    :param root_folder: Full path to the root folder of the tree.
+    :param working_folder: The folder for the databases.
+    :param run: The number of the run.
+    :param workers: The number of the hashing threads.
+    :return: The durations of the stages in seconds.
+    """
+    durations = dict()
+
+    sdf.catalog.open(f"sqlite:///{os.path.join(working_folder, f'cold-{run}.sqlite')}")
+    evict_page_cache(root_folder)
+    durations["cold_full_scan"] = measure(lambda: sdf.save_files(sdf.catalog.session, root_folder, workers))
+
+    sdf.catalog.open(f"sqlite:///{os.path.join(working_folder, f'warm-{run}.sqlite')}")
+    session = sdf.catalog.session
+    durations["warm_full_scan"] = measure(lambda: sdf.save_files(session, root_folder, workers))
+    durations["rescan"] = measure(lambda: sdf.save_files(session, root_folder, workers))
+    durations["incremental_rescan"] = measure(lambda: sdf.save_files(session, root_folder, workers, incremental=True))
+    durations["check_changed_files"] = measure(lambda: sdf.check_changed_files(session))
+    durations["check_changed_files_paranoid"] = measure(lambda: sdf.check_changed_files(session, paranoid=True))
+    durations["load_duplicate_files"] = measure(lambda: sdf.load_duplicate_files(session))
+    durations["iter_duplicate_groups"] = measure(lambda: sum(1 for _ in sdf.iter_duplicate_groups(session)))
+    sdf.catalog.close()
+    return durations
+
+
+def git_commit() -> t.Optional[str]:
+    """
+    :return: The current commit of the repository or None outside the git repository.
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_FOLDER, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline: dict, threshold: float, min_delta: float) -> t.List[str]:
+    """
+    Comparing the results with the results of another commit.
+
+    :param results: The results of this run.
+    :param baseline: The results of the compared run.
+    :param threshold: The allowed relative slowdown of the median, for example 0.2 means 20 %.
+    :param min_delta: The allowed absolute slowdown of the median in seconds, so the short stages do not flap.
+    :return: The descriptions of the regressions.
+    """
+    regressions = list()
+    for stage, result in results["stages"].items():
+        if (baseline_result := baseline.get("stages", dict()).get(stage)) is None:
+            continue
+        old, new = baseline_result["median_s"], result["median_s"]
+        if new > old * (1 + threshold) and new - old > min_delta:
+            regressions.append(f"{stage}: {old:.3f} s -> {new:.3f} s (+{(new / old - 1) * 100 if old else 0:.0f} %)")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tree", help="Path to the existing tree (the synthetic tree is generated by default).")
+    parser.add_argument("--repeat", type=int, default=3, help="The number of the runs.")
+    parser.add_argument("--jobs", type=int, help="The number of the hashing threads.")
+    parser.add_argument("--output", help="Save the results to the JSON file.")
+    parser.add_argument("--baseline", help="The JSON file with the results of another commit.")
+    parser.add_argument("--threshold", type=float, default=0.2, help="The allowed relative slowdown.")
+    parser.add_argument("--min-delta", type=float, default=0.05, help="The allowed absolute slowdown in seconds.")
+    add_tree_arguments(parser)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as working_folder:
+        if args.tree:
+            root_folder = os.path.abspath(args.tree)
+            tree = {"path": root_folder}
+        else:
+            root_folder = os.path.join(working_folder, "tree")
+            spec = spec_from_arguments(args)
+            tree = {"spec": spec._asdict(), "summary": generate_tree(root_folder, spec)._asdict()}
+
+        runs = [run_stages(root_folder, working_folder, run, args.jobs) for run in range(args.repeat)]
+
+    results = {
+        "benchmark": "scan",
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cold_cache": hasattr(os, "posix_fadvise"),
+        "workers": sdf.get_workers(args.jobs),
+        "tree": tree,
+        "stages": {
+            stage: {
+                "median_s": statistics.median(run[stage] for run in runs),
+                "min_s": min(run[stage] for run in runs),
+                "runs_s": [run[stage] for run in runs]
+            }
+            for stage in STAGES
+        }
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold, args.min_delta)
+        for regression in regressions:
+            print(f"Regression {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""
+The benchmark of the search of the similar images from core/perceptual.py. It generates the synthetic
+perceptual hashes (the random images and their variants with a few changed bits like the resized copies)
+and compares the multi-index of the hashes with the comparing of all pairs.
+
+    $ python3 benchmarks/bench_similar.py --images 100000 --distance 6 --output similar.json
+
+The comparing of all pairs is quadratic, so it is skipped above --brute-force-limit images.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import typing as t
+
+ROOT_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_FOLDER)
+
+from core import perceptual  # noqa: E402
+
+
+def create_hashes(images: int, variant_ratio: float, max_flips: int, seed: int) -> t.List[int]:
+    """
+    :param images: The number of the hashes.
+    :param variant_ratio: The part of the hashes which are the variants of another hash.
+    :param max_flips: The maximal number of the changed bits of the variant.
+    :param seed: The seed of the random generator.
+    :return: The hashes.
+    """
+    rng = random.Random(seed)
+    hashes = list()
+    for index in range(images):
+        if index and rng.random() < variant_ratio:
+            value = rng.choice(hashes)
+            for bit in rng.sample(range(perceptual.HASH_BITS), rng.randint(0, max_flips)):
+                value ^= 1 << bit
+        else:
+            value = rng.getrandbits(perceptual.HASH_BITS)
+        hashes.append(value)
+    return hashes
+
+
+def brute_force_pairs(hashes: t.List[int], max_distance: int) -> t.List[t.Tuple[int, int, int]]:
+    """
+    :param hashes: The hashes.
+    :param max_distance: The maximal Hamming distance.
+    :return: All pairs of the indexes within the distance found by comparing all pairs.
+    """
+    pairs = list()
+    for second, second_hash in enumerate(hashes):
+        for first in range(second):
+            distance = perceptual.hamming_distance(hashes[first], second_hash)
+            if distance <= max_distance:
+                pairs.append((first, second, distance))
+    return pairs
+
+
+def measure(function: t.Callable[[], t.Any], repeat: int) -> float:
+    """
+    :param function: The measured function.
+    :param repeat: The number of the runs.
+    :return: The median of the durations in seconds.
+    """
+    durations = list()
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - started)
+    return statistics.median(durations)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=20_000, help="The number of the images.")
+    parser.add_argument("--distance", type=int, default=6, help="The maximal Hamming distance of the similar images.")
+    parser.add_argument("--variant-ratio", type=float, default=0.2, help="The part of the images which are variants.")
+    parser.add_argument("--brute-force-limit", type=int, default=10_000, help="The maximal number of the images for comparing all pairs.")
+    parser.add_argument("--repeat", type=int, default=3, help="The number of the runs.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Save the results to the JSON file.")
+    args = parser.parse_args()
+
+    hashes = create_hashes(args.images, args.variant_ratio, args.distance, args.seed)
+    index_pairs = list(perceptual.similar_pairs(enumerate(hashes), args.distance))
+    results = {
+        "benchmark": "similar",
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "images": args.images,
+        "distance": args.distance,
+        "pairs": len(index_pairs),
+        "index_s": measure(lambda: list(perceptual.similar_pairs(enumerate(hashes), args.distance)), args.repeat),
+        "brute_force_s": None,
+        "speedup": None,
+    }
+    if args.images <= args.brute_force_limit:
+        started = time.perf_counter()
+        brute_force = brute_force_pairs(hashes, args.distance)
+        results["brute_force_s"] = time.perf_counter() - started
+        if sorted(index_pairs) != sorted(brute_force):
+            print("The index found other pairs than the comparing of all pairs.", file=sys.stderr)
+            return 1
+        results["speedup"] = results["brute_force_s"] / results["index_s"]
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,69 @@
+"""
+The benchmark of the start of the application. It measures the import of core.sdfcore and the hashing of one file
+in the new Python process and checks that no database module is imported and no database file is created.
+
+    $ python3 benchmarks/bench_startup.py [--repeat 10]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the script runs in the empty working directory, so the created database file is visible
+STARTUP_SCRIPT = """
+import json, os, sys, time
+started = time.perf_counter()
+import core.sdfcore as sdf
+imported = time.perf_counter()
+sdf.get_hash(sys.argv[1])
+hashed = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "import_and_hash_ms": (hashed - started) * 1000,
+    "sqlalchemy_imported": "sqlalchemy.orm" in sys.modules,
+    "database_files": [name for name in os.listdir(".") if name.endswith(".sqlite")]
+}))
+"""
+
+
+def run_startup(file: str) -> dict:
+    """
+    Running the startup script in the new Python process.
+
+    :param file: The file for hashing.
+    :return: The measured values of the run.
+    """
+    with tempfile.TemporaryDirectory() as working_folder:
+        environment = dict(os.environ, PYTHONPATH=ROOT_FOLDER)
+        output = subprocess.run(
+            [sys.executable, "-c", STARTUP_SCRIPT, file],
+            cwd=working_folder, env=environment, capture_output=True, text=True, check=True
+        ).stdout
+    return json.loads(output)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=10, help="The number of the runs.")
+    parser.add_argument("--file", default=os.path.join(ROOT_FOLDER, "README.md"), help="The file for hashing.")
+    args = parser.parse_args()
+
+    runs = [run_startup(os.path.abspath(args.file)) for _ in range(args.repeat)]
+    print(json.dumps({
+        "benchmark": "startup",
+        "runs": args.repeat,
+        "import_ms_median": statistics.median(run["import_ms"] for run in runs),
+        "import_and_hash_ms_median": statistics.median(run["import_and_hash_ms"] for run in runs),
+        "sqlalchemy_imported": any(run["sqlalchemy_imported"] for run in runs),
+        "database_files": sorted({name for run in runs for name in run["database_files"]})
+    }, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,205 @@
+"""
+The benchmark of the storage of the catalog. It creates the catalog with the synthetic rows in the schema
+of the older version (the full path and the hexadecimal hashes in each row of the table file), upgrades it
+to the actual schema (the table directory, the name of the file and the binary hashes) and compares the size
+of the database file, the size of the tables and the indexes and the time of loading the duplicate files.
+
+    $ python3 benchmarks/bench_storage.py --files 1000000 --output storage.json
+
+The sizes of the tables and the indexes need SQLite with the dbstat virtual table, otherwise they are null.
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import typing as t
+
+ROOT_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_FOLDER)
+
+import sqlalchemy as sa  # noqa: E402
+
+import core.sdfcore as sdf  # noqa: E402
+from core import db  # noqa: E402
+
+# the schema of the older version of the application with the full path in each row
+LEGACY_SCHEMA = """
+CREATE TABLE root_folder (id INTEGER NOT NULL, name VARCHAR(50) NOT NULL, path VARCHAR(1000) NOT NULL, PRIMARY KEY (id));
+CREATE TABLE directory (
+    id INTEGER NOT NULL, path VARCHAR(1000) NOT NULL, mtime_ns BIGINT NOT NULL, entry_count INTEGER NOT NULL,
+    root_folder_id INTEGER, PRIMARY KEY (id), FOREIGN KEY(root_folder_id) REFERENCES root_folder (id) ON DELETE CASCADE
+);
+CREATE INDEX ix_directory_path ON directory (path);
+CREATE INDEX ix_directory_root_folder_id ON directory (root_folder_id);
+CREATE TABLE file (
+    id INTEGER NOT NULL, filehash VARCHAR(255), filesize BIGINT, mtime_ns BIGINT, inode BIGINT, device BIGINT,
+    partial_hash VARCHAR(255), hash_stage INTEGER NOT NULL, filename VARCHAR(1000) NOT NULL,
+    root_folder_id INTEGER, PRIMARY KEY (id), FOREIGN KEY(root_folder_id) REFERENCES root_folder (id) ON DELETE CASCADE
+);
+CREATE INDEX ix_file_filehash ON file (filehash);
+CREATE INDEX ix_file_filename ON file (filename);
+CREATE INDEX ix_file_root_folder_id ON file (root_folder_id);
+CREATE INDEX ix_file_filesize_partial_hash ON file (filesize, partial_hash);
+CREATE INDEX ix_file_device_inode ON file (device, inode);
+"""
+
+# the duplicate files in the older version of the application
+LEGACY_DUPLICATES_QUERY = """
+SELECT file.id, file.filename, file.filehash, file.filesize FROM file JOIN (
+    SELECT filehash FROM file WHERE filehash IS NOT NULL GROUP BY filehash
+    HAVING count(DISTINCT coalesce(CAST(device AS VARCHAR) || ':' || CAST(inode AS VARCHAR), 'id:' || CAST(id AS VARCHAR))) > 1
+) AS duplicate_hashes ON file.filehash = duplicate_hashes.filehash ORDER BY file.filehash, file.id
+"""
+
+
+def create_legacy_catalog(path: str, files: int, files_per_directory: int, duplicate_ratio: float, seed: int) -> None:
+    """
+    Creating the catalog in the schema of the older version. The files are in the tree of the directories
+    under one root folder like the photos sorted by the dates, every file has all hashes.
+
+    :param path: Path to the new SQLite file.
+    :param files: The number of the files.
+    :param files_per_directory: The average number of the files in one directory.
+    :param duplicate_ratio: The part of the files which are the copies of another file.
+    :param seed: The seed of the random generator.
+    """
+    rng = random.Random(seed)
+    root_folder = "/mnt/storage/archive/photos"
+    connection = sqlite3.connect(path)
+    connection.executescript(LEGACY_SCHEMA)
+    connection.execute("INSERT INTO root_folder (id, name, path) VALUES (1, 'photos', ?)", (root_folder,))
+
+    directories = [
+        f"{root_folder}/{2000 + index // 120}/{index // 10 % 12 + 1:02d}/event-{index:06d}"
+        for index in range(max(1, files // files_per_directory))
+    ]
+    connection.executemany(
+        "INSERT INTO directory (path, mtime_ns, entry_count, root_folder_id) VALUES (?, ?, ?, 1)",
+        ((directory, 1_600_000_000_000_000_000, files_per_directory) for directory in directories)
+    )
+
+    def rows() -> t.Iterator[t.Tuple]:
+        for index in range(files):
+            original = rng.randrange(index) if index and rng.random() < duplicate_ratio else index
+            size = 1024 + original * 7919 % 10_000_000
+            filehash = hashlib.md5(str(original).encode()).hexdigest()
+            yield (
+                filehash, size, 1_600_000_000_000_000_000 + index, index + 1, 2049,
+                hashlib.md5(f"partial {original}".encode()).hexdigest(), db.HASH_STAGE_FULL,
+                f"{rng.choice(directories)}/IMG_{index:08d}.JPG"
+            )
+
+    connection.executemany(
+        "INSERT INTO file (filehash, filesize, mtime_ns, inode, device, partial_hash, hash_stage, filename, root_folder_id)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?, ?, 1)",
+        rows()
+    )
+    connection.commit()
+    connection.close()
+
+
+def duplicates_query() -> sa.Select:
+    """
+    :return: The query of the function load_duplicate_files() with the columns of the legacy query.
+    """
+    duplicate_hashes = sa.select(db.File.filehash).where(db.File.filehash.is_not(None)).group_by(
+        db.File.filehash
+    ).having(sa.func.count(sa.distinct(db.inode_key())) > 1).subquery("duplicate_hashes")
+    return sa.select(db.File.id, db.File.filename, db.File.filehash, db.File.filesize).join(
+        duplicate_hashes, db.File.filehash == duplicate_hashes.c.filehash
+    ).order_by(db.File.filehash, db.File.id)
+
+
+def measure_catalog(path: str) -> t.Dict[str, t.Any]:
+    """
+    :param path: Path to the SQLite file.
+    :return: The size of the file after VACUUM and the sizes of the tables and the indexes of the table file.
+    """
+    connection = sqlite3.connect(path)
+    connection.execute("VACUUM")
+    try:
+        objects = dict(connection.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name"))
+        indexes = {name for name, in connection.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    except sqlite3.OperationalError:
+        objects, indexes = None, set()
+    connection.close()
+    result = {"database_bytes": os.path.getsize(path), "tables_bytes": None, "indexes_bytes": None, "objects_bytes": objects}
+    if objects is not None:
+        result["indexes_bytes"] = sum(size for name, size in objects.items() if name in indexes or name.startswith("sqlite_autoindex"))
+        result["tables_bytes"] = sum(size for name, size in objects.items() if name not in indexes)
+    return result
+
+
+def measure(function: t.Callable[[], t.Any], repeat: int) -> float:
+    """
+    :param function: The measured function.
+    :param repeat: The number of the runs.
+    :return: The median of the durations in seconds.
+    """
+    durations = list()
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - started)
+    return statistics.median(durations)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=200_000, help="The number of the files in the catalog.")
+    parser.add_argument("--files-per-directory", type=int, default=50, help="The average number of the files in one directory.")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.2, help="The part of the files which are copies.")
+    parser.add_argument("--repeat", type=int, default=3, help="The number of the runs of the queries.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Save the results to the JSON file.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as working_folder:
+        legacy_path = os.path.join(working_folder, "legacy.sqlite")
+        create_legacy_catalog(legacy_path, args.files, args.files_per_directory, args.duplicate_ratio, args.seed)
+        legacy = measure_catalog(legacy_path)
+        engine = sa.create_engine(f"sqlite:///{legacy_path}")
+        with engine.connect() as connection:
+            legacy["load_duplicate_files_s"] = measure(
+                lambda: connection.execute(sa.text(LEGACY_DUPLICATES_QUERY)).all(), args.repeat
+            )
+        engine.dispose()
+
+        # the upgrade of the legacy catalog is the same as the start of the new version with the old database
+        started = time.perf_counter()
+        sdf.catalog.open(f"sqlite:///{legacy_path}")
+        session = sdf.catalog.session
+        actual = {"upgrade_s": time.perf_counter() - started}
+        actual["load_duplicate_files_s"] = measure(lambda: session.execute(duplicates_query()).all(), args.repeat)
+        actual["load_duplicate_files_orm_s"] = measure(lambda: sdf.load_duplicate_files(session), args.repeat)
+        groups = len(sdf.load_duplicate_files(session))
+        sdf.catalog.close()
+        actual.update(measure_catalog(legacy_path))
+
+    results = {
+        "benchmark": "storage",
+        "files": args.files,
+        "duplicate_groups": groups,
+        "legacy": legacy,
+        "actual": actual,
+        "database_reduction": 1 - actual["database_bytes"] / legacy["database_bytes"],
+        "indexes_reduction": (
+            1 - actual["indexes_bytes"] / legacy["indexes_bytes"] if legacy["indexes_bytes"] else None
+        ),
+        "load_duplicate_files_speedup": legacy["load_duplicate_files_s"] / actual["load_duplicate_files_s"],
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
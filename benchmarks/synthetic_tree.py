@@ -0,0 +1,181 @@
+"""
+The generator of the synthetic directory trees for the benchmarks. The same parameters and the same seed
+always generate the same tree, so the results of the benchmarks can be compared across commits.
+
+    $ python3 benchmarks/synthetic_tree.py /tmp/tree --files 10000 --duplicate-ratio 0.2 --hardlink-ratio 0.05
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import typing as t
+
+
+class TreeSpec(t.NamedTuple):
+    """
+    The parameters of the synthetic tree.
+    """
+
+    files: int = 1000
+    """ The number of the files including the duplicates and the hardlinks """
+
+    median_size: int = 16 * 1024
+    """ The median size of the file in bytes, the sizes have the log-normal distribution """
+
+    size_sigma: float = 1.5
+    """ The spread of the log-normal distribution of the sizes """
+
+    max_size: int = 16 * 1024 * 1024
+    """ The maximal size of the file in bytes """
+
+    duplicate_ratio: float = 0.2
+    """ The part of the files which are the copies of another file """
+
+    near_duplicate_ratio: float = 0.05
+    """ The part of the files with the same size and the same beginning as another file, but different content """
+
+    hardlink_ratio: float = 0.0
+    """ The part of the files which are the hardlinks of another file """
+
+    depth: int = 3
+    """ The depth of the directory tree """
+
+    fanout: int = 4
+    """ The number of the sub-folders in each directory """
+
+    seed: int = 0
+    """ The seed of the random generator """
+
+
+class TreeSummary(t.NamedTuple):
+    """
+    The summary of the generated tree.
+    """
+
+    files: int
+    """ The number of the generated files """
+
+    bytes: int
+    """ The size of all files (the hardlinks are counted once) """
+
+    duplicates: int
+    """ The number of the copies """
+
+    near_duplicates: int
+    """ The number of the files with the same size and beginning as another file """
+
+    hardlinks: int
+    """ The number of the hardlinks """
+
+    directories: int
+    """ The number of the directories """
+
+
+def list_directories(root_folder: str, depth: int, fanout: int) -> t.List[str]:
+    """
+    :param root_folder: Full path to the root folder of the tree.
+    :param depth: The depth of the directory tree.
+    :param fanout: The number of the sub-folders in each directory.
+    :return: Full paths to all directories of the tree including the root folder.
+    """
+    directories = [root_folder]
+    level = [root_folder]
+    for _ in range(depth):
+        level = [os.path.join(parent, f"d{index:02d}") for parent in level for index in range(fanout)]
+        directories.extend(level)
+    return directories
+
+
+def random_size(rng: random.Random, spec: TreeSpec) -> int:
+    return max(1, min(spec.max_size, int(rng.lognormvariate(math.log(spec.median_size), spec.size_sigma))))
+
+
+def generate_tree(root_folder: str, spec: TreeSpec = TreeSpec()) -> TreeSummary:
+    """
+    Generating the synthetic tree. The root folder must not exist or it must be empty.
+
+    :param root_folder: Full path to the root folder of the tree.
+    :param spec: The parameters of the tree.
+    :return: The summary of the generated tree.
+    """
+    rng = random.Random(spec.seed)
+    directories = list_directories(root_folder, spec.depth, spec.fanout)
+    for directory in directories:
+        os.makedirs(directory, exist_ok=True)
+
+    # the original files (path, size, seed of the content) for the copies and the hardlinks
+    originals: t.List[t.Tuple[str, int, int]] = list()
+    total_bytes = duplicates = near_duplicates = hardlinks = 0
+    for index in range(spec.files):
+        path = os.path.join(rng.choice(directories), f"f{index:07d}.bin")
+        kind = rng.random()
+        if originals and kind < spec.hardlink_ratio:
+            os.link(rng.choice(originals)[0], path)
+            hardlinks += 1
+            continue
+
+        if originals and kind < spec.hardlink_ratio + spec.duplicate_ratio:
+            _, size, content_seed = rng.choice(originals)
+            duplicates += 1
+            content = random.Random(content_seed).randbytes(size)
+        elif originals and kind < spec.hardlink_ratio + spec.duplicate_ratio + spec.near_duplicate_ratio:
+            # the same size and the same beginning, the last byte differs, so only the full hash tells them apart
+            _, size, content_seed = rng.choice(originals)
+            near_duplicates += 1
+            content = bytearray(random.Random(content_seed).randbytes(size))
+            content[-1] ^= rng.randrange(1, 256)
+        else:
+            size = random_size(rng, spec)
+            content_seed = rng.getrandbits(64)
+            content = random.Random(content_seed).randbytes(size)
+            originals.append((path, size, content_seed))
+
+        with open(path, "wb") as f:
+            f.write(content)
+        total_bytes += len(content)
+
+    return TreeSummary(spec.files, total_bytes, duplicates, near_duplicates, hardlinks, len(directories))
+
+
+def add_tree_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Adding the parameters of the tree to the command-line arguments.
+
+    :param parser: The parser of the command-line arguments.
+    """
+    defaults = TreeSpec()
+    parser.add_argument("--files", type=int, default=defaults.files)
+    parser.add_argument("--median-size", type=int, default=defaults.median_size)
+    parser.add_argument("--size-sigma", type=float, default=defaults.size_sigma)
+    parser.add_argument("--max-size", type=int, default=defaults.max_size)
+    parser.add_argument("--duplicate-ratio", type=float, default=defaults.duplicate_ratio)
+    parser.add_argument("--near-duplicate-ratio", type=float, default=defaults.near_duplicate_ratio)
+    parser.add_argument("--hardlink-ratio", type=float, default=defaults.hardlink_ratio)
+    parser.add_argument("--depth", type=int, default=defaults.depth)
+    parser.add_argument("--fanout", type=int, default=defaults.fanout)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+
+
+def spec_from_arguments(args: argparse.Namespace) -> TreeSpec:
+    """
+    :param args: The command-line arguments from the function add_tree_arguments().
+    :return: The parameters of the tree.
+    """
+    return TreeSpec(**{field: getattr(args, field) for field in TreeSpec._fields})
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("root_folder", help="Path to the new root folder of the tree.")
+    add_tree_arguments(parser)
+    args = parser.parse_args()
+
+    summary = generate_tree(os.path.abspath(args.root_folder), spec_from_arguments(args))
+    print(json.dumps(summary._asdict(), indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
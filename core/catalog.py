@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import typing as t
+
+from core.lazy import lazy_import
+
+db = lazy_import("core.db")
+db_writer = lazy_import("core.writer")
+
+if t.TYPE_CHECKING:
+    from sqlalchemy import Engine
+    from sqlalchemy.orm import Session, scoped_session
+
+
+class Catalog:
+    """
+    The database of the application. The engine, the tables and the session are created at the first use,
+    so the import of the application does not touch the database.
+    """
+
+    def __init__(self, connection_string: t.Optional[str] = None) -> None:
+        """
+        :param connection_string: SQLAlchemy connection string. The value None means config.CONNECTION_STRING.
+        """
+        self.connection_string = connection_string
+        self._engine: t.Optional[Engine] = None
+        self._sessions: t.Optional[scoped_session] = None
+
+    def open(self, connection_string: t.Optional[str] = None) -> None:
+        """
+        Using another database. The opened database is closed.
+
+        :param connection_string: SQLAlchemy connection string. The value None means config.CONNECTION_STRING.
+        """
+        self.close()
+        self.connection_string = connection_string
+
+    @property
+    def engine(self) -> Engine:
+        """
+        The database engine, the tables are created at the first use.
+        """
+        if self._engine is None:
+            engine = db.load_engine(self.connection_string)
+            db.create_db_structure(engine)
+            self._engine = engine
+        return self._engine
+
+    @property
+    def session(self) -> Session:
+        """
+        The session of the current thread, each thread gets its own session.
+        """
+        if self._sessions is None:
+            self._sessions = db.create_scoped_session(self.engine)
+        return self._sessions()
+
+    def create_session(self) -> Session:
+        """
+        Creating the new session, for example for the background thread.
+
+        :return: The new database session.
+        """
+        return db.create_session(self.engine)
+
+    def close(self) -> None:
+        """
+        Closing the session of the current thread and the engine, the waiting batches of the database writer
+        are written before. The next use opens them again.
+        """
+        if self._sessions is not None:
+            self._sessions.remove()
+            self._sessions = None
+        if self._engine is not None:
+            db_writer.close_writer(self._engine)
+            self._engine.dispose()
+            self._engine = None
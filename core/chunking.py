@@ -0,0 +1,119 @@
+"""
+The content-defined chunking of the files for the block-level duplicate analysis. The boundaries of the chunks
+depend only on the content near them, so the inserted or the removed bytes move only the nearby boundaries
+and two files with mostly the same content (the disk images, the archives of the logs) share most
+of their chunks even if the shared data are at different offsets.
+
+The boundaries are found by the asymmetric extremum algorithm (AE): the chunk ends window bytes after
+the largest value of the chunk which is not exceeded by the next window bytes. The values are the sequences
+of GRAM_SIZE bytes compared as the big-endian numbers, the single bytes would reach their maximum
+in the first bytes of the text and the chunks would not be content-defined. The rolling hashes (Rabin, Gear)
+need the loop over each byte, which is about 4 MB/s in Python, but the next larger value is found
+by the regular expression in C. The chunks have at least window bytes (except the last chunk of the file),
+about 1.7 * window bytes on average and at most max_size bytes.
+
+Each chunk is identified by the first DIGEST_SIZE bytes of its SHA-256 digest.
+"""
+import functools
+import hashlib
+import re
+import typing as t
+
+DIGEST_SIZE = 16
+""" The size of the digest of the chunk in bytes """
+
+GRAM_SIZE = 4
+""" The number of the bytes of the compared values """
+
+
+@functools.lru_cache(maxsize=4096)
+def larger_pattern(gram: bytes) -> t.Optional[t.Pattern[bytes]]:
+    """
+    :param gram: The largest value found so far.
+    :return: The pattern finding the larger value or None if no value is larger.
+    """
+    pattern = b""
+    for value in reversed(gram):
+        options = list()
+        if value < 255:
+            options.append(b"[" + re.escape(bytes([value + 1])) + b"-\xff]")
+        if pattern:
+            options.append(re.escape(bytes([value])) + b"(?:" + pattern + b")")
+        pattern = b"|".join(options)
+    return re.compile(pattern, re.DOTALL) if pattern else None
+
+
+def find_boundary(data: t.Union[bytes, bytearray], start: int, end: int, window: int, max_size: int) -> int:
+    """
+    :param data: The buffer with the data.
+    :param start: The start of the chunk in the buffer.
+    :param end: The end of the data in the buffer, the data after it are not known yet.
+    :param window: The number of the bytes after the largest value which end the chunk.
+    :param max_size: The maximal size of the chunk.
+    :return: The end of the chunk in the buffer.
+    """
+    end = min(end, start + max_size)
+    if end - start <= window:
+        return end
+    position = start
+    while True:
+        pattern = larger_pattern(bytes(data[position:position + GRAM_SIZE]))
+        larger = pattern.search(data, position + 1, min(position + window, end)) if pattern is not None else None
+        if larger is None:
+            return min(position + window, end)
+        position = larger.start()
+
+
+def iter_chunks(
+        stream: t.BinaryIO,
+        window: int,
+        max_size: int,
+        buffer_size: int = 1024 * 1024
+) -> t.Iterator[t.Tuple[bytes, int]]:
+    """
+    Generator splitting the stream to the chunks. Only the buffer of the given size is kept in memory.
+
+    :param stream: The file opened in the binary mode.
+    :param window: The number of the bytes after the largest value which end the chunk.
+    :param max_size: The maximal size of the chunk.
+    :param buffer_size: The size of the reads, it is increased to max_size.
+    :return: The pairs of the digest and the size of the chunk in the order of the file.
+    :raise ValueError: The sizes are not valid.
+    """
+    if not 0 < window < max_size:
+        raise ValueError("The window of the chunking must be greater than 0 and less than the maximal size of the chunk.")
+    buffer_size = max(buffer_size, max_size)
+    buffer = bytearray()
+    eof = False
+    while not eof or buffer:
+        # the buffer has at least the maximal chunk unless the stream ended
+        if not eof and len(buffer) < max_size:
+            data = stream.read(buffer_size)
+            eof = not data
+            buffer += data
+            continue
+        start = 0
+        with memoryview(buffer) as view:
+            while len(buffer) - start >= max_size or eof and start < len(buffer):
+                end = find_boundary(buffer, start, len(buffer), window, max_size)
+                yield hashlib.sha256(view[start:end]).digest()[:DIGEST_SIZE], end - start
+                start = end
+        del buffer[:start]
+
+
+def chunk_file(
+        path_file: str,
+        window: int,
+        max_size: int,
+        buffer_size: int = 1024 * 1024
+) -> t.Iterator[t.Tuple[bytes, int]]:
+    """
+    :param path_file: Full path to the file.
+    :param window: The number of the bytes after the largest value which end the chunk.
+    :param max_size: The maximal size of the chunk.
+    :param buffer_size: The size of the reads.
+    :return: The pairs of the digest and the size of the chunk in the order of the file.
+    :raise OSError: The file can not be read.
+    """
+    with open(path_file, "rb", buffering=0) as f:
+        yield from iter_chunks(f, window, max_size, buffer_size)
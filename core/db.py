@@ -1,9 +1,37 @@
 # import configure constants
 import config
 
-from sqlalchemy.orm import DeclarativeBase, sessionmaker, Mapped, mapped_column, relationship
-from sqlalchemy import Integer, String, create_engine, Engine, ForeignKey
+from sqlalchemy.orm import DeclarativeBase, column_property, scoped_session, sessionmaker, Mapped, mapped_column, relationship
+from sqlalchemy import BigInteger, DateTime, Float, Integer, JSON, LargeBinary, String, create_engine, Engine, ForeignKey, Index, inspect
+from sqlalchemy import MetaData, Table, TypeDecorator, case, cast, event, func, insert, literal, literal_column, select, text
 from sqlalchemy.orm import Session
+from sqlalchemy.sql import ColumnElement, Select
+import datetime
+import os
+import typing as t
+
+# stages of the duplicate detection stored in the column File.hash_stage
+HASH_STAGE_SIZE = 1
+""" Only the size of the file is known. No other file has the same size. """
+
+HASH_STAGE_PARTIAL = 2
+""" The hash of the first and the last block of the file is known. """
+
+HASH_STAGE_FULL = 3
+""" The hash of the whole file is known. """
+
+# states of the scan stored in the column ScanJob.status
+SCAN_JOB_RUNNING = "running"
+""" The scan is running or the application was killed during the scan. """
+
+SCAN_JOB_INTERRUPTED = "interrupted"
+""" The scan was cancelled by the user or by Ctrl-C. """
+
+SCAN_JOB_FAILED = "failed"
+""" The scan stopped on the error, for example the disk was unmounted. """
+
+SCAN_JOB_DONE = "done"
+""" The scan finished. The jobs in other states are resumed by the next scan of the same folder. """
 
 
 class Base(DeclarativeBase):
@@ -13,23 +41,95 @@ class Base(DeclarativeBase):
     pass
 
 
+class HexDigest(TypeDecorator):
+    """
+    The hash saved as the raw bytes. The application works with the hexadecimal strings from hashlib,
+    the database stores the half of the size and the indexes of the hashes are smaller.
+    """
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value: t.Optional[str], dialect) -> t.Optional[bytes]:
+        return bytes.fromhex(value) if isinstance(value, str) else value
+
+    def process_result_value(self, value: t.Optional[bytes], dialect) -> t.Optional[str]:
+        return value.hex() if isinstance(value, bytes) else value
+
+
+class Unsigned64(TypeDecorator):
+    """
+    The unsigned 64-bit integer (the perceptual hash) saved as the signed BIGINT of the database.
+    """
+
+    impl = BigInteger
+    cache_ok = True
+
+    def process_bind_param(self, value: t.Optional[int], dialect) -> t.Optional[int]:
+        return value - (1 << 64) if value is not None and value >= 1 << 63 else value
+
+    def process_result_value(self, value: t.Optional[int], dialect) -> t.Optional[int]:
+        return value + (1 << 64) if value is not None and value < 0 else value
+
+
 class File(Base):
     """
     Class represents the list of the mapped files in the database.
     """
 
     __tablename__ = "file"
+    __table_args__ = (
+        # the files are found by the directory and the name
+        Index("ix_file_directory_id_name", "directory_id", "name"),
+        # the staged duplicate detection groups the files by the size and the partial hash
+        Index("ix_file_filesize_partial_hash", "filesize", "partial_hash"),
+        # the hardlinks of the same file have the same device and inode
+        Index("ix_file_device_inode", "device", "inode"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, comment="ID of the file record")
     """ ID of the record in the database table """
 
-    filehash: Mapped[str] = mapped_column(String(255), nullable=False, comment="Hash string of the file.")
-    """ The hash of the file """
+    filehash: Mapped[t.Optional[str]] = mapped_column(HexDigest(64), nullable=True, index=True, comment="Hash of the file.")
+    """ The hash of the file. It is computed only for the files with colliding partial hashes. """
+
+    filesize: Mapped[t.Optional[int]] = mapped_column(BigInteger, nullable=True, comment="Size of the file in bytes.")
+    """ The size of the file """
+
+    mtime_ns: Mapped[t.Optional[int]] = mapped_column(BigInteger, nullable=True, comment="Time of the last modification of the file in nanoseconds.")
+    """ The time of the last modification of the file (st_mtime_ns) """
 
-    filename: Mapped[str] = mapped_column(String(1000), nullable=False, comment="Full path to the file.")
-    """ The name of the file """
+    inode: Mapped[t.Optional[int]] = mapped_column(BigInteger, nullable=True, comment="Inode number of the file.")
+    """ The inode number of the file (st_ino) """
 
-    root_folder_id: Mapped[int] = mapped_column(Integer, ForeignKey("root_folder.id", ondelete='CASCADE'), comment="Folder for searching duplicate files.")
+    device: Mapped[t.Optional[int]] = mapped_column(BigInteger, nullable=True, comment="Device of the file.")
+    """ The identifier of the device with the file (st_dev) """
+
+    partial_hash: Mapped[t.Optional[str]] = mapped_column(HexDigest(64), nullable=True, comment="Hash of the first and the last block of the file.")
+    """ The hash of the first and the last block of the file. It is computed only for the files with the same size. """
+
+    hash_algorithm: Mapped[t.Optional[str]] = mapped_column(String(20), nullable=True, comment="Algorithm of the hashes.")
+    """ The algorithm of the partial hash and the hash from the file core/hashers.py, for example "blake2b-256" """
+
+    perceptual_hash: Mapped[t.Optional[int]] = mapped_column(Unsigned64, nullable=True, comment="Perceptual hash of the image.")
+    """ The perceptual hash of the image from the file core/perceptual.py, None for the image which can not be decoded """
+
+    perceptual_algorithm: Mapped[t.Optional[str]] = mapped_column(String(10), nullable=True, comment="Algorithm of the perceptual hash.")
+    """ The algorithm of the perceptual hash (ahash, dhash or phash), None if the image was not hashed yet """
+
+    chunk_count: Mapped[t.Optional[int]] = mapped_column(BigInteger, nullable=True, comment="Number of the chunks of the file.")
+    """ The number of the content-defined chunks from the file core/chunking.py, None if the file was not split yet """
+
+    hash_stage: Mapped[int] = mapped_column(Integer, nullable=False, default=HASH_STAGE_SIZE, comment="The last stage of the duplicate detection.")
+    """ The last stage of the duplicate detection (HASH_STAGE_SIZE, HASH_STAGE_PARTIAL or HASH_STAGE_FULL) """
+
+    name: Mapped[str] = mapped_column(String(255), nullable=False, comment="Name of the file in the directory.")
+    """ The name of the file without the directory """
+
+    directory_id: Mapped[int] = mapped_column(Integer, ForeignKey("directory.id", ondelete='CASCADE'), nullable=False, comment="Directory of the file.")
+    """ ID of the directory with the file, the full path is saved only once for all files in the directory """
+
+    root_folder_id: Mapped[int] = mapped_column(Integer, ForeignKey("root_folder.id", ondelete='CASCADE'), index=True, comment="Folder for searching duplicate files.")
     """ ID mapped folder """
 
     root_folder = relationship(
@@ -37,6 +137,162 @@ class File(Base):
         back_populates="files"
     )
 
+    directory = relationship(
+        "Directory",
+        back_populates="files"
+    )
+
+
+class Directory(Base):
+    """
+    Class represents the directory in the root folder. The modification time of the directory is used
+    for skipping the unchanged directories during the incremental scan.
+    """
+
+    __tablename__ = "directory"
+
+    id: Mapped[int] = mapped_column(primary_key=True, comment="ID of the directory record")
+    """ ID of the record in the database table """
+
+    path: Mapped[str] = mapped_column(String(1000), nullable=False, index=True, comment="Full path to the directory.")
+    """ The full path to the directory """
+
+    mtime_ns: Mapped[t.Optional[int]] = mapped_column(BigInteger, nullable=True, comment="Time of the last modification of the directory in nanoseconds.")
+    """ The time of the last modification of the directory (st_mtime_ns), it changes after adding or removing the entry.
+    It is None for the directory whose listing was not finished, so the incremental scan lists it again. """
+
+    entry_count: Mapped[t.Optional[int]] = mapped_column(Integer, nullable=True, comment="Number of the entries in the directory.")
+    """ The number of the files and sub-folders in the directory """
+
+    root_folder_id: Mapped[int] = mapped_column(Integer, ForeignKey("root_folder.id", ondelete='CASCADE'), index=True, comment="Folder for searching duplicate files.")
+    """ ID mapped folder """
+
+    scan_job_id: Mapped[t.Optional[int]] = mapped_column(Integer, ForeignKey("scan_job.id", ondelete='SET NULL'), nullable=True, comment="The last scan which listed the directory.")
+    """ ID of the last scan job which listed the directory, the resumed scan does not list these directories again """
+
+    root_folder = relationship(
+        "RootFolder",
+        back_populates="directories"
+    )
+
+    files = relationship(
+        "File",
+        back_populates="directory",
+        passive_deletes=True
+    )
+
+
+def join_path(directory: t.Any, name: t.Any) -> t.Any:
+    """
+    The SQL expression of the full path to the file like os.path.join().
+
+    :param directory: The column or the expression with the path to the directory.
+    :param name: The column or the expression with the name of the file.
+    :return: The expression with the full path.
+    """
+    return case((directory.endswith(os.sep), directory), else_=directory + os.sep) + name
+
+
+# the full path to the file is composed from the directory, so it can be selected and filtered like the column
+File.filename = column_property(
+    select(join_path(Directory.path, File.name)).where(Directory.id == File.directory_id).scalar_subquery(),
+    doc="Full path to the file"
+)
+
+
+class Chunk(Base):
+    """
+    Class represents the content-defined chunk of the files. Each chunk is saved once with the number of its
+    references from the files, so the bytes which the block-level deduplication could release are
+    the sum of size * (refcount - 1). The reference counts are kept by the triggers SQLITE_TRIGGERS.
+    """
+
+    __tablename__ = "chunk"
+    __table_args__ = {"sqlite_with_rowid": False}
+
+    digest: Mapped[bytes] = mapped_column(LargeBinary(16), primary_key=True, comment="Digest of the chunk.")
+    """ The digest of the chunk from the file core/chunking.py """
+
+    size: Mapped[int] = mapped_column(Integer, nullable=False, comment="Size of the chunk in bytes.")
+    """ The size of the chunk """
+
+    refcount: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0, comment="Number of the references from the files.")
+    """ The number of the occurrences of the chunk in all files, the chunk with 0 is removed by the next chunking """
+
+
+class FileChunk(Base):
+    """
+    Class represents the chunks of the file. The order of the chunks is not saved, only the number
+    of the occurrences of each chunk in the file.
+    """
+
+    __tablename__ = "file_chunk"
+    __table_args__ = (
+        # the files sharing the chunk are found by the digest
+        Index("ix_file_chunk_digest", "digest"),
+        {"sqlite_with_rowid": False}
+    )
+
+    file_id: Mapped[int] = mapped_column(Integer, ForeignKey("file.id", ondelete='CASCADE'), primary_key=True, comment="The file.")
+    """ ID of the file """
+
+    digest: Mapped[bytes] = mapped_column(LargeBinary(16), ForeignKey("chunk.digest"), primary_key=True, comment="The chunk of the file.")
+    """ The digest of the chunk """
+
+    count: Mapped[int] = mapped_column(BigInteger, nullable=False, comment="Number of the occurrences of the chunk in the file.")
+    """ The number of the occurrences of the chunk in the file """
+
+
+class DuplicateGroup(Base):
+    """
+    Class represents the group of the duplicate files confirmed by the full hash. The groups are saved
+    after the duplicate detection, so the groups sorted by the wasted bytes are loaded by the index
+    without grouping all files of the table file for each page.
+    """
+
+    __tablename__ = "duplicate_group"
+
+    filehash: Mapped[str] = mapped_column(HexDigest(64), primary_key=True, comment="Hash of the files.")
+    """ The hash of the files in the group """
+
+    filesize: Mapped[t.Optional[int]] = mapped_column(BigInteger, nullable=True, comment="Size of one file.")
+    """ The size of one file of the group """
+
+    wasted: Mapped[int] = mapped_column(BigInteger, nullable=False, comment="Bytes used by the copies.")
+    """ The size of the files except one file of each inode, the hardlinks do not waste the space """
+
+
+# the pages of the groups sorted by the wasted bytes (the largest first) and by the hash
+Index("ix_duplicate_group_wasted_filehash", DuplicateGroup.wasted.desc(), DuplicateGroup.filehash)
+
+
+def inode_key() -> ColumnElement:
+    """
+    The SQL expression identifying the inode of the file. The hardlinks of the same file have the same value.
+    The files saved by the older version of the application without the inode are identified by their ID.
+
+    :return: The expression "device:inode" or "id:ID" for the files without the inode.
+    """
+    return func.coalesce(
+        cast(File.device, String) + ":" + cast(File.inode, String),
+        "id:" + cast(File.id, String)
+    )
+
+
+def duplicate_groups_select() -> Select:
+    """
+    The query of the groups of the duplicate files with at least two different inodes. The query can be
+    restricted by another condition of the table file and sorted, the groups are read in the order
+    of the index of the hashes.
+
+    :return: The query select() with the columns filehash, filesize and wasted.
+    """
+    return select(
+        File.filehash.label("filehash"),
+        func.max(File.filesize).label("filesize"),
+        ((func.count(func.distinct(inode_key())) - 1) * func.coalesce(func.max(File.filesize), 0)).label("wasted")
+    ).where(File.filehash.is_not(None)).group_by(File.filehash).having(func.count(func.distinct(inode_key())) > 1)
+
 
 class RootFolder(Base):
     """
@@ -54,20 +310,158 @@ class RootFolder(Base):
     path: Mapped[str] = mapped_column(String(1000), nullable=False, comment="Full path to the folder")
     """ The full path to the folder """
 
+    device: Mapped[t.Optional[int]] = mapped_column(BigInteger, nullable=True, comment="Device of the folder.")
+    """ The identifier of the device with the folder (st_dev) from the last scan, the other device means the unmounted disk """
+
     files = relationship(
         "File",
         back_populates="root_folder",
-        cascade="all, delete"
+        cascade="all, delete",
+        # the rows are deleted by ON DELETE CASCADE of the database, they are not loaded before the delete
+        passive_deletes=True
+    )
+
+    directories = relationship(
+        "Directory",
+        back_populates="root_folder",
+        cascade="all, delete",
+        passive_deletes=True
+    )
+
+    scan_jobs = relationship(
+        "ScanJob",
+        back_populates="root_folder",
+        cascade="all, delete",
+        passive_deletes=True
     )
 
 
-def load_engine() -> Engine:
+class ScanJob(Base):
+    """
+    Class represents the scan of the folder which can be resumed. The scan saves the checkpoint
+    (the directories waiting for the walk and the number of the pending, done and failed items of the stage)
+    after each config.SCAN_CHECKPOINT_FILES files, so the next scan continues from the last checkpoint.
+    """
+
+    __tablename__ = "scan_job"
+    # the IDs are not reused after deleting the old jobs, the directories keep the ID of the job which listed them
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    id: Mapped[int] = mapped_column(primary_key=True, comment="ID of the scan job record")
+    """ ID of the record in the database table """
+
+    root_folder_id: Mapped[int] = mapped_column(Integer, ForeignKey("root_folder.id", ondelete='CASCADE'), index=True, comment="Folder for searching duplicate files.")
+    """ ID mapped folder """
+
+    path: Mapped[str] = mapped_column(String(1000), nullable=False, comment="Full path to the scanned folder.")
+    """ The full path to the scanned folder, the root folder or its sub-folder """
+
+    status: Mapped[str] = mapped_column(String(20), nullable=False, default=SCAN_JOB_RUNNING, comment="State of the scan.")
+    """ The state of the scan (SCAN_JOB_RUNNING, SCAN_JOB_INTERRUPTED, SCAN_JOB_FAILED or SCAN_JOB_DONE) """
+
+    stage: Mapped[str] = mapped_column(String(50), nullable=False, comment="The stage of the scan at the last checkpoint.")
+    """ The stage of the scan at the last checkpoint, for example "Reading metadata" or "Full hash" """
+
+    pending_directories: Mapped[t.List[str]] = mapped_column(JSON, nullable=False, default=list, comment="The directories waiting for the walk.")
+    """ Full paths to the directories which were not listed yet at the last checkpoint """
+
+    pending: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0, comment="Number of the waiting items of the stage.")
+    """ The number of the directories (the walk) or the files (the hashing) waiting in the stage """
+
+    done: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0, comment="Number of the finished items of the stage.")
+    """ The number of the listed directories (the walk) or the hashed files (the hashing) in the stage """
+
+    failed: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0, comment="Number of the unreadable items.")
+    """ The number of the unreadable directories and files of the whole job """
+
+    error: Mapped[t.Optional[str]] = mapped_column(String(1000), nullable=True, comment="The error which stopped the scan.")
+    """ The description of the error for the state SCAN_JOB_FAILED """
+
+    started: Mapped[datetime.datetime] = mapped_column(DateTime, nullable=False, comment="The start of the scan.")
+    """ The start of the first run of the scan (UTC) """
+
+    updated: Mapped[datetime.datetime] = mapped_column(DateTime, nullable=False, comment="The last checkpoint of the scan.")
+    """ The time of the last checkpoint or the last change of the state (UTC) """
+
+    root_folder = relationship(
+        "RootFolder",
+        back_populates="scan_jobs"
+    )
+
+
+class ScanRun(Base):
+    """
+    Class represents the summary of one scan. The summaries are kept for tracking the throughput over time.
+    """
+
+    __tablename__ = "scan_run"
+
+    id: Mapped[int] = mapped_column(primary_key=True, comment="ID of the scan record")
+    """ ID of the record in the database table """
+
+    command: Mapped[str] = mapped_column(String(50), nullable=False, comment="The scan command.")
+    """ The name of the scan, for example "scan" or "check" """
+
+    root_folder: Mapped[t.Optional[str]] = mapped_column(String(1000), nullable=True, comment="Full path to the scanned folder.")
+    """ The full path to the scanned root folder, None for the scan of all files """
+
+    started: Mapped[datetime.datetime] = mapped_column(DateTime, nullable=False, index=True, comment="The start of the scan.")
+    """ The start of the scan (UTC) """
+
+    duration: Mapped[float] = mapped_column(Float, nullable=False, comment="The duration of the scan in seconds.")
+    """ The duration of the scan in seconds """
+
+    files_walked: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0, comment="Number of the listed files.")
+    """ The number of the files found by the walk """
+
+    bytes_read: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0, comment="Number of the read bytes.")
+    """ The number of the bytes read for the hashing """
+
+    bytes_hashed: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0, comment="Number of the hashed bytes.")
+    """ The number of the bytes passed to the hash functions """
+
+    rows_written: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0, comment="Number of the written rows.")
+    """ The number of the inserted, updated and deleted rows """
+
+    commits: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0, comment="Number of the commits.")
+    """ The number of the committed transactions """
+
+    stats: Mapped[t.Dict[str, t.Any]] = mapped_column(JSON, nullable=False, comment="The summary of the scan.")
+    """ The summary from the method ScanStats.summary() from the file core/stats.py """
+
+
+def load_engine(connection_string: t.Optional[str] = None) -> Engine:
     """
     Loading the database engine
 
+    :param connection_string: SQLAlchemy connection string. The value None means config.CONNECTION_STRING.
     :return: sqlalchemy.engine.base.Engine
     """
-    return create_engine(config.CONNECTION_STRING, echo=config.DEVELOP_MODE)
+    engine = create_engine(connection_string or config.CONNECTION_STRING, echo=config.DEVELOP_MODE)
+    if engine.dialect.name == "sqlite":
+        event.listen(engine, "connect", set_sqlite_pragmas)
+    return engine
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    """
+    Configuring each new SQLite connection for the concurrent work. In the WAL mode the readers do not wait
+    for the writer, so the list of the duplicate files can be loaded during the scan.
+    The foreign keys are enforced, so the deleted root folder deletes its rows in the other tables.
+
+    :param dbapi_connection: The connection of the sqlite3 module.
+    :param connection_record: The record of the connection pool.
+    """
+    cursor = dbapi_connection.cursor()
+    # the in-memory database does not support WAL, it keeps the memory journal
+    cursor.execute(f"PRAGMA journal_mode = {config.SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous = {config.SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA cache_size = {int(config.SQLITE_CACHE_SIZE)}")
+    cursor.execute(f"PRAGMA mmap_size = {int(config.SQLITE_MMAP_SIZE)}")
+    cursor.execute(f"PRAGMA busy_timeout = {int(config.SQLITE_BUSY_TIMEOUT)}")
+    # SQLite ignores ON DELETE CASCADE of the foreign keys without this pragma
+    cursor.execute("PRAGMA foreign_keys = ON")
+    cursor.close()
 
 
 def create_db_structure(engine: Engine) -> None:
@@ -76,7 +470,175 @@ def create_db_structure(engine: Engine) -> None:
 
     :param engine: sqlalchemy.engine.base.Engine
     """
+    new_duplicate_groups = not inspect(engine).has_table(DuplicateGroup.__tablename__)
     Base.metadata.create_all(bind=engine)
+    upgrade_db_structure(engine)
+    if new_duplicate_groups:
+        # the catalog of the older version has the hashes, but it does not have the saved groups
+        with engine.begin() as connection:
+            connection.execute(
+                insert(DuplicateGroup).from_select(["filehash", "filesize", "wasted"], duplicate_groups_select())
+            )
+    if engine.dialect.name == "sqlite":
+        with engine.begin() as connection:
+            for trigger in SQLITE_TRIGGERS:
+                connection.exec_driver_sql(trigger)
+
+
+# triggers keeping the reference counts of the chunks, they are created again after the upgrade of the table file
+SQLITE_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS file_chunk_insert AFTER INSERT ON file_chunk BEGIN
+        UPDATE chunk SET refcount = refcount + NEW.count WHERE digest = NEW.digest;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS file_chunk_update AFTER UPDATE OF count ON file_chunk BEGIN
+        UPDATE chunk SET refcount = refcount + NEW.count - OLD.count WHERE digest = NEW.digest;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS file_chunk_delete AFTER DELETE ON file_chunk BEGIN
+        UPDATE chunk SET refcount = refcount - OLD.count WHERE digest = OLD.digest;
+    END""",
+    # the chunks of the removed file and of the changed file (chunk_count set to NULL)
+    """CREATE TRIGGER IF NOT EXISTS file_delete_chunks AFTER DELETE ON file BEGIN
+        DELETE FROM file_chunk WHERE file_id = OLD.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS file_reset_chunks AFTER UPDATE OF chunk_count ON file
+    WHEN NEW.chunk_count IS NULL BEGIN
+        DELETE FROM file_chunk WHERE file_id = NEW.id;
+    END""",
+]
+
+
+def upgrade_db_structure(engine: Engine) -> None:
+    """
+    Upgrade the tables created by an older version of the application.
+    SQLite can not change the columns of the table, so the changed table is created again and the rows are copied.
+
+    :param engine: sqlalchemy.engine.base.Engine
+    """
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        existing_columns = {column["name"]: column for column in inspector.get_columns(table.name)}
+        table_changed = any(
+            column.name not in existing_columns or existing_columns[column.name]["nullable"] != column.nullable
+            for column in table.columns if not column.primary_key
+        )
+        if table_changed:
+            rebuild_table(engine, table, list(existing_columns))
+        # the indexes added in the newer version of the application
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+
+
+# values for the columns which are missing in the tables of the older version of the application
+UPGRADE_VALUES = {
+    "file": {
+        # the older version of the application saved the full hash of each file
+        "hash_stage": HASH_STAGE_FULL,
+        # the older version of the application hashed the files only by MD5
+        "hash_algorithm": "md5"
+    }
+}
+
+
+def upgrade_file_rows(connection, existing_columns: t.List[str]) -> t.Optional[t.Callable[[t.Any], t.Dict[str, t.Any]]]:
+    """
+    The older version of the application saved the full path of each file in the column filename.
+    The path is split to the directory (saved once in the table directory) and the name of the file.
+    The hexadecimal hashes are converted to the bytes by the type HexDigest of the new table.
+
+    :param connection: The connection with the open transaction of the upgrade.
+    :param existing_columns: The names of the columns of the old table.
+    :return: The function returning the new columns name and directory_id for the row of the old table
+        or None if the old table already has these columns.
+    """
+    if "filename" not in existing_columns:
+        return None
+    directories = {
+        (directory.root_folder_id, directory.path): directory.id
+        for directory in connection.execute(select(Directory.id, Directory.root_folder_id, Directory.path))
+    }
+
+    def upgrade_row(row: t.Any) -> t.Dict[str, t.Any]:
+        directory, name = os.path.split(row.filename)
+        key = (row.root_folder_id, directory)
+        if key not in directories:
+            directories[key] = connection.execute(
+                insert(Directory).values(path=directory, root_folder_id=row.root_folder_id)
+            ).inserted_primary_key[0]
+        return {"name": name, "directory_id": directories[key]}
+
+    return upgrade_row
+
+
+# conversions of the rows of the tables from the older version of the application which can not be done in SQL
+UPGRADE_TRANSFORMS = {
+    "file": upgrade_file_rows
+}
+
+
+def rebuild_table(engine: Engine, table: Table, existing_columns: t.List[str]) -> None:
+    """
+    Create the table again with the actual structure and copy the rows from the old table.
+
+    :param engine: sqlalchemy.engine.base.Engine
+    :param table: The table with the actual structure.
+    :param existing_columns: The names of the columns in the old table.
+    """
+    # the copy of the metadata resolves foreign keys of the new table
+    metadata = MetaData()
+    for metadata_table in Base.metadata.sorted_tables:
+        metadata_table.to_metadata(metadata)
+    new_table = table.to_metadata(metadata, name=f"{table.name}_new")
+    new_table.indexes.clear()
+
+    copied_columns = [column.name for column in table.columns if column.name in existing_columns]
+    filled_values = {
+        name: value for name, value in UPGRADE_VALUES.get(table.name, dict()).items() if name not in existing_columns
+    }
+
+    with engine.connect() as connection:
+        sqlite = engine.dialect.name == "sqlite"
+        if sqlite:
+            # DROP TABLE deletes the rows first, ON DELETE CASCADE would delete the rows of the other tables,
+            # the pragma can not be changed inside the transaction
+            connection.exec_driver_sql("PRAGMA foreign_keys = OFF")
+            connection.commit()
+        try:
+            with connection.begin():
+                new_table.create(connection)
+                upgrade_rows = UPGRADE_TRANSFORMS.get(table.name)
+                upgrade_row = upgrade_rows(connection, existing_columns) if upgrade_rows is not None else None
+                if upgrade_row is not None:
+                    # the rows are converted in Python in the batches, the values go through the types of the new table
+                    rows = connection.execute(
+                        select(*[literal_column(name) for name in existing_columns]).select_from(text(table.name))
+                    )
+                    for batch in rows.partitions(config.DB_BATCH_SIZE):
+                        connection.execute(new_table.insert(), [
+                            {
+                                **filled_values,
+                                **{name: getattr(row, name) for name in copied_columns},
+                                **upgrade_row(row)
+                            }
+                            for row in batch
+                        ])
+                else:
+                    connection.execute(
+                        new_table.insert().from_select(
+                            copied_columns + list(filled_values),
+                            select(
+                                *[literal_column(name) for name in copied_columns],
+                                *[literal(value).label(name) for name, value in filled_values.items()]
+                            ).select_from(text(table.name))
+                        )
+                    )
+                connection.exec_driver_sql(f"DROP TABLE {table.name}")
+                connection.exec_driver_sql(f"ALTER TABLE {new_table.name} RENAME TO {table.name}")
+                for index in table.indexes:
+                    index.create(connection)
+        finally:
+            if sqlite:
+                connection.exec_driver_sql("PRAGMA foreign_keys = ON")
+                connection.commit()
 
 
 def create_session(engine: Engine) -> Session:
@@ -88,3 +650,13 @@ def create_session(engine: Engine) -> Session:
     """
     Session = sessionmaker(bind=engine)
     return Session()
+
+
+def create_scoped_session(engine: Engine) -> scoped_session:
+    """
+    Creating the registry of the sessions, each thread gets its own session.
+
+    :param engine: sqlalchemy.engine.base.Engine
+    :return: The registry, calling it returns the session of the current thread.
+    """
+    return scoped_session(sessionmaker(bind=engine))
@@ -0,0 +1,106 @@
+"""
+The registry of the hash algorithms of the files. The algorithm is selected by config.HASH_ALGORITHM
+and its name is saved with the hashes of each file (db.File.hash_algorithm), so the catalog stays valid
+after the change of the configuration: the saved files are compared by their own algorithm
+and the duplicate detection hashes them again only if they have to be compared with the new hashes.
+
+The name of the algorithm with the variable digest size ends with the size in bits, for example "blake2b-256".
+The algorithms xxh64, xxh3 and blake3 are available only if the packages xxhash and blake3 are installed.
+"""
+import functools
+import hashlib
+import typing as t
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+
+class HashObject(t.Protocol):
+    """
+    The interface of the hash objects from hashlib, xxhash and blake3.
+    """
+
+    def update(self, data: bytes) -> None:
+        ...
+
+    def hexdigest(self) -> str:
+        ...
+
+
+def fixed_size(new: t.Callable[[], HashObject]) -> t.Callable[[t.Optional[int]], HashObject]:
+    """
+    :param new: The constructor of the hash object with the fixed digest size, for example hashlib.md5
+    :return: The constructor of the hash object for the registry, the digest size must not be given.
+    """
+    def new_hash(digest_size: t.Optional[int]) -> HashObject:
+        if digest_size is not None:
+            raise ValueError(f"The hash algorithm {new.__name__} does not support the digest size.")
+        return new()
+
+    return new_hash
+
+
+def xxh3(digest_size: t.Optional[int]) -> HashObject:
+    """
+    :param digest_size: The digest size in bytes, 8 or 16 (the default).
+    :return: The hash object of xxh3_64 or xxh3_128
+    """
+    if digest_size not in (None, 8, 16):
+        raise ValueError("The hash algorithm xxh3 supports only the digest size 64 or 128 bits.")
+    return xxhash.xxh3_64() if digest_size == 8 else xxhash.xxh3_128()
+
+
+HASHERS: t.Dict[str, t.Callable[[t.Optional[int]], HashObject]] = {
+    "md5": fixed_size(hashlib.md5),
+    "sha1": fixed_size(hashlib.sha1),
+    "sha256": fixed_size(hashlib.sha256),
+    "blake2b": lambda digest_size: hashlib.blake2b(digest_size=digest_size or hashlib.blake2b.MAX_DIGEST_SIZE),
+    "blake2s": lambda digest_size: hashlib.blake2s(digest_size=digest_size or hashlib.blake2s.MAX_DIGEST_SIZE),
+}
+""" The hash algorithms (name: the constructor of the hash object from the digest size in bytes or None) """
+
+if xxhash is not None:
+    HASHERS["xxh64"] = fixed_size(xxhash.xxh64)
+    HASHERS["xxh3"] = xxh3
+
+if blake3 is not None:
+    HASHERS["blake3"] = fixed_size(blake3.blake3)
+
+
+@functools.lru_cache(maxsize=None)
+def get_hasher(algorithm: str) -> t.Callable[[], HashObject]:
+    """
+    Getting the constructor of the hash object for the name of the algorithm.
+
+    :param algorithm: The name of the algorithm, for example "md5" or "blake2b-256".
+    :return: The function creating the new hash object.
+    :raise ValueError: The algorithm is unknown (or its package is not installed) or the digest size is not valid.
+    """
+    name, _, bits = algorithm.partition("-")
+    if name not in HASHERS:
+        raise ValueError(f"Unknown hash algorithm {algorithm}, the algorithms are {', '.join(HASHERS)}.")
+    if bits and (not bits.isdigit() or int(bits) % 8):
+        raise ValueError(f"The digest size of the hash algorithm {algorithm} must be the number of bytes in bits.")
+    digest_size = int(bits) // 8 if bits else None
+    # the digest size is checked before the first file
+    HASHERS[name](digest_size)
+    return functools.partial(HASHERS[name], digest_size)
+
+
+def list_algorithms() -> t.List[str]:
+    """
+    :return: The names of the available algorithms with the usual digest sizes, for example for the benchmark.
+    """
+    algorithms = ["md5", "sha1", "sha256", "blake2b-128", "blake2b-256", "blake2b", "blake2s-128", "blake2s"]
+    if xxhash is not None:
+        algorithms.extend(["xxh64", "xxh3-128"])
+    if blake3 is not None:
+        algorithms.append("blake3")
+    return algorithms
@@ -0,0 +1,22 @@
+import importlib.util
+import sys
+import types
+
+
+def lazy_import(name: str) -> types.ModuleType:
+    """
+    Importing the module at the first access to its attribute.
+    The heavy modules (for example sqlalchemy) are not imported by the tools which do not use them.
+
+    :param name: The full name of the module, for example "core.db".
+    :return: The module, it is loaded at the first access to its attribute.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
@@ -0,0 +1,219 @@
+"""
+The perceptual hashes of the images. The similar images (another resolution, compression or metadata) have
+different bytes, so they are never found by the hash of the file, but their perceptual hashes differ only
+in a few bits. The hash has 64 bits and the similarity is the Hamming distance of two hashes.
+
+    ahash - the pixels of the image 8x8 brighter than the mean
+    dhash - the pixels of the image 9x8 brighter than their left neighbour
+    phash - the low frequencies of the discrete cosine transform of the image 32x32 greater than their median
+
+The hashes are computed from the grayscale pixels in Python, only the decoding and the scaling
+of the image needs the package Pillow. Without Pillow the function available() returns False.
+"""
+import itertools
+import math
+import statistics
+import typing as t
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+HASH_BITS = 64
+""" The number of the bits of the perceptual hash """
+
+
+def available() -> bool:
+    """
+    :return: True if the images can be decoded (the package Pillow is installed).
+    """
+    return Image is not None
+
+
+def bits_to_int(bits: t.Iterable[bool]) -> int:
+    """
+    :param bits: The bits of the hash from the most significant one.
+    :return: The hash as the unsigned integer.
+    """
+    value = 0
+    for bit in bits:
+        value = value << 1 | bool(bit)
+    return value
+
+
+def average_hash(pixels: t.Sequence[float]) -> int:
+    """
+    :param pixels: The grayscale pixels of the image 8x8 by the rows.
+    :return: The hash with the bits of the pixels brighter than the mean.
+    """
+    mean = sum(pixels) / len(pixels)
+    return bits_to_int(pixel > mean for pixel in pixels)
+
+
+def difference_hash(pixels: t.Sequence[float]) -> int:
+    """
+    :param pixels: The grayscale pixels of the image 9x8 by the rows.
+    :return: The hash with the bits of the pixels brighter than their left neighbour.
+    """
+    return bits_to_int(
+        pixels[row * 9 + column + 1] > pixels[row * 9 + column] for row in range(8) for column in range(8)
+    )
+
+
+# the cosines of the discrete cosine transform of 32 pixels to the 8 lowest frequencies (frequency: pixel)
+DCT_COSINES = [[math.cos((2 * x + 1) * u * math.pi / 64) for x in range(32)] for u in range(8)]
+
+
+def dct_hash(pixels: t.Sequence[float]) -> int:
+    """
+    Only the 8x8 lowest frequencies of the transform are computed, first for the rows and then for the columns.
+
+    :param pixels: The grayscale pixels of the image 32x32 by the rows.
+    :return: The hash with the bits of the lowest frequencies greater than their median.
+    """
+    rows = [
+        [sum(cosine * pixel for cosine, pixel in zip(cosines, pixels[y * 32:(y + 1) * 32])) for cosines in DCT_COSINES]
+        for y in range(32)
+    ]
+    frequencies = [
+        sum(cosine * row[u] for cosine, row in zip(cosines, rows)) for cosines in DCT_COSINES for u in range(8)
+    ]
+    median = statistics.median(frequencies)
+    return bits_to_int(frequency > median for frequency in frequencies)
+
+
+ALGORITHMS: t.Dict[str, t.Tuple[int, int, t.Callable[[t.Sequence[float]], int]]] = {
+    "ahash": (8, 8, average_hash),
+    "dhash": (9, 8, difference_hash),
+    "phash": (32, 32, dct_hash),
+}
+""" The perceptual hashes (name: the width and the height of the scaled image and the function of the hash) """
+
+
+def load_pixels(path_file: str, width: int, height: int) -> t.List[int]:
+    """
+    Decoding the image to the grayscale pixels of the given size. The JPEG image is decoded
+    in the reduced size (the draft mode of Pillow), so the large photos are not decoded in the full resolution.
+
+    :param path_file: Full path to the image.
+    :param width: The width of the scaled image.
+    :param height: The height of the scaled image.
+    :return: The pixels by the rows.
+    """
+    with Image.open(path_file) as image:
+        image.draft("L", (width * 4, height * 4))
+        return list(image.convert("L").resize((width, height), Image.LANCZOS).getdata())
+
+
+def image_hash(path_file: str, algorithm: str) -> t.Optional[int]:
+    """
+    :param path_file: Full path to the image.
+    :param algorithm: The name of the perceptual hash (ahash, dhash or phash).
+    :return: The hash or None if the file is not the image or it can not be decoded.
+    :raise ValueError: The algorithm is unknown.
+    :raise RuntimeError: The package Pillow is not installed.
+    """
+    if algorithm not in ALGORITHMS:
+        raise ValueError(f"Unknown perceptual hash {algorithm}, the algorithms are {', '.join(ALGORITHMS)}.")
+    if not available():
+        raise RuntimeError("The perceptual hash needs the package Pillow.")
+    width, height, hash_function = ALGORITHMS[algorithm]
+    try:
+        return hash_function(load_pixels(path_file, width, height))
+    except (OSError, ValueError, SyntaxError, Image.DecompressionBombError):
+        # the damaged image or another file with the extension of the image
+        return None
+
+
+def hamming_distance(first: int, second: int) -> int:
+    """
+    :return: The number of the different bits of two hashes.
+    """
+    return bin(first ^ second).count("1")
+
+
+class HammingIndex:
+    """
+    The multi-index of the hashes for finding the hashes within the Hamming distance without comparing all pairs.
+    The hash is split to SEGMENTS segments of 16 bits and each segment has its own index. Two hashes
+    with the distance at most max_distance have at least one segment with the distance
+    at most max_distance // SEGMENTS, so only the buckets of the segments within this radius are searched.
+    """
+
+    SEGMENTS = 4
+    """ The number of the segments of the hash """
+
+    def __init__(self, max_distance: int) -> None:
+        """
+        :param max_distance: The maximal Hamming distance of the found hashes.
+        :raise ValueError: The distance is not less than the number of the bits of the hash.
+        """
+        if not 0 <= max_distance < HASH_BITS:
+            raise ValueError(f"The distance of the perceptual hashes must be from 0 to {HASH_BITS - 1}.")
+        self.max_distance = max_distance
+        self.width = HASH_BITS // self.SEGMENTS
+        # the masks of the bits of one segment changed within the radius (0 is the segment itself)
+        radius = max_distance // self.SEGMENTS
+        self.flips = [
+            sum(1 << bit for bit in bits)
+            for distance in range(radius + 1)
+            for bits in itertools.combinations(range(self.width), distance)
+        ]
+        self.buckets: t.List[t.Dict[int, t.List[int]]] = [dict() for _ in range(self.SEGMENTS)]
+        self.keys: t.List[t.Any] = list()
+        self.hashes: t.List[int] = list()
+
+    def split(self, value: int) -> t.List[int]:
+        """
+        :param value: The hash.
+        :return: The segments of the hash from the lowest bits.
+        """
+        mask = (1 << self.width) - 1
+        return [value >> self.width * index & mask for index in range(self.SEGMENTS)]
+
+    def add(self, key: t.Any, value: int) -> None:
+        """
+        :param key: The item of the hash, for example the file.
+        :param value: The hash.
+        """
+        index = len(self.hashes)
+        self.keys.append(key)
+        self.hashes.append(value)
+        for segment, buckets in zip(self.split(value), self.buckets):
+            buckets.setdefault(segment, list()).append(index)
+
+    def search(self, value: int) -> t.List[t.Tuple[t.Any, int]]:
+        """
+        :param value: The hash.
+        :return: The items of the added hashes within the distance with the distance.
+        """
+        candidates = set()
+        for segment, buckets in zip(self.split(value), self.buckets):
+            for flip in self.flips:
+                candidates.update(buckets.get(segment ^ flip, ()))
+        found = list()
+        for index in sorted(candidates):
+            distance = hamming_distance(value, self.hashes[index])
+            if distance <= self.max_distance:
+                found.append((self.keys[index], distance))
+        return found
+
+
+def similar_pairs(
+        items: t.Iterable[t.Tuple[t.Any, int]],
+        max_distance: int
+) -> t.Iterator[t.Tuple[t.Any, t.Any, int]]:
+    """
+    Finding all pairs of the hashes within the distance. Each item is searched in the index
+    of the previous items and then added to it, so each pair is found once.
+
+    :param items: The pairs of the item (for example the file) and its hash.
+    :param max_distance: The maximal Hamming distance.
+    :return: The triples of the earlier item, the later item and their distance.
+    """
+    index = HammingIndex(max_distance)
+    for key, value in items:
+        for found, distance in index.search(value):
+            yield found, key, distance
+        index.add(key, value)
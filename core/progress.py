@@ -0,0 +1,181 @@
+import threading
+import time
+import typing as t
+
+from core.stats import ScanStats
+
+T = t.TypeVar("T")
+
+
+class ScanCancelled(Exception):
+    """
+    The exception is raised in the scan after the user cancels the scan.
+    The database contains only the committed batches, so it stays consistent.
+    """
+    pass
+
+
+class ProgressReport(t.NamedTuple):
+    """
+    The snapshot of the progress of the scan. It can be sent to another thread.
+    """
+
+    stage: str
+    """ The name of the stage of the scan """
+
+    files_done: int
+    """ The number of the processed files in the stage """
+
+    files_total: int
+    """ The number of all files in the stage """
+
+    bytes_done: int
+    """ The number of the read bytes in the stage """
+
+    bytes_total: int
+    """ The number of all bytes for reading in the stage """
+
+    current_path: str
+    """ Full path to the last processed file """
+
+    elapsed: float
+    """ The duration of the stage in seconds """
+
+    @property
+    def files_per_second(self) -> float:
+        return self.files_done / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def mb_per_second(self) -> float:
+        return self.bytes_done / self.elapsed / 1024 / 1024 if self.elapsed else 0.0
+
+    @property
+    def eta(self) -> t.Optional[float]:
+        """
+        Estimated time to the end of the stage in seconds. It is computed from the bytes if they are known.
+
+        :return: The number of seconds or None if the estimate is not known yet.
+        """
+        if self.bytes_total and self.bytes_done:
+            return (self.bytes_total - self.bytes_done) * self.elapsed / self.bytes_done
+        if self.files_total and self.files_done:
+            return (self.files_total - self.files_done) * self.elapsed / self.files_done
+        return None
+
+
+class ScanProgress:
+    """
+    The progress of the scan. The scan functions from sdfcore.py call the method advance() for each file.
+    The reports are sent to the callback at most once per interval and the scan is stopped after cancel is set.
+    """
+
+    def __init__(
+            self,
+            callback: t.Optional[t.Callable[[ProgressReport], None]] = None,
+            cancel: t.Optional[threading.Event] = None,
+            interval: float = 0.1,
+            stats: t.Optional[ScanStats] = None
+    ) -> None:
+        """
+        :param callback: The function receiving the reports. It is called in the thread of the scan.
+        :param cancel: The event for cancelling the scan from another thread.
+        :param interval: The minimal time between two reports in seconds.
+        :param stats: The timers and the counters of the scan. The value None means the new ScanStats.
+        """
+        self.callback = callback
+        self.stats = stats or ScanStats()
+        self.cancel = cancel
+        self.interval = interval
+        self.stage = ""
+        self.files_done = 0
+        self.files_total = 0
+        self.bytes_done = 0
+        self.bytes_total = 0
+        self.current_path = ""
+        self.started = time.monotonic()
+        self.reported = 0.0
+
+    def start_stage(self, stage: str, files_total: int = 0, bytes_total: int = 0) -> None:
+        """
+        Start the new stage of the scan and report it.
+
+        :param stage: The name of the stage.
+        :param files_total: The number of all files in the stage.
+        :param bytes_total: The number of all bytes for reading in the stage.
+        """
+        # the final state of the previous stage
+        if self.stage:
+            self.report(force=True)
+        self.stage = stage
+        self.files_done = 0
+        self.files_total = files_total
+        self.bytes_done = 0
+        self.bytes_total = bytes_total
+        self.current_path = ""
+        self.started = time.monotonic()
+        self.stats.start_stage(stage)
+        self.report(force=True)
+
+    def advance(self, path: str, bytes_read: int = 0) -> None:
+        """
+        Add the processed file to the progress.
+
+        :param path: Full path to the processed file.
+        :param bytes_read: The number of the bytes read from the file.
+        :raise ScanCancelled: The scan was cancelled.
+        """
+        self.check_cancelled()
+        self.files_done += 1
+        self.bytes_done += bytes_read
+        self.current_path = path
+        self.report()
+
+    def track(
+            self,
+            items: t.Iterable[T],
+            path: t.Callable[[T], str],
+            bytes_read: t.Callable[[T], int] = lambda item: 0
+    ) -> t.Iterator[T]:
+        """
+        Generator adding each item to the progress.
+
+        :param items: The processed items (for example the results of the function hash_files() from sdfcore.py).
+        :param path: The function getting full path to the file from the item.
+        :param bytes_read: The function getting the number of the bytes read from the file.
+        :return: The same items.
+        :raise ScanCancelled: The scan was cancelled.
+        """
+        for item in items:
+            self.advance(path(item), bytes_read(item))
+            yield item
+
+    def check_cancelled(self) -> None:
+        """
+        :raise ScanCancelled: The scan was cancelled.
+        """
+        if self.cancel is not None and self.cancel.is_set():
+            raise ScanCancelled()
+
+    def report(self, force: bool = False) -> None:
+        """
+        Send the snapshot of the progress to the callback.
+
+        :param force: The report is sent regardless of the interval.
+        """
+        if self.callback is None:
+            return
+        now = time.monotonic()
+        if force or now - self.reported >= self.interval:
+            self.reported = now
+            self.callback(self.snapshot())
+
+    def snapshot(self) -> ProgressReport:
+        return ProgressReport(
+            stage=self.stage,
+            files_done=self.files_done,
+            files_total=self.files_total,
+            bytes_done=self.bytes_done,
+            bytes_total=self.bytes_total,
+            current_path=self.current_path,
+            elapsed=time.monotonic() - self.started
+        )
@@ -0,0 +1,127 @@
+"""
+The scheduler of the reading of the files by the devices. The root folders can be on several disks,
+but the files in the order of the walk are read from one disk after another and the parallel reads
+of one rotational disk (HDD) move its heads between the files. The files are grouped by the device (st_dev),
+each device is read by its own threads (usually one thread for the rotational disk and more threads for SSD),
+so all devices are read at the same time. The files of one device are read in the order of the inodes,
+on most file systems (ext4, XFS) the inodes of the files near each other have the data near each other.
+
+The rotational disks are recognized on Linux by /sys/dev/block/MAJOR:MINOR/queue/rotational, on the other
+systems and for the network and the virtual file systems the type of the device is not known.
+"""
+import functools
+import os
+import queue
+import sys
+import threading
+import typing as t
+from collections import deque
+
+T = t.TypeVar("T")
+R = t.TypeVar("R")
+
+
+@functools.lru_cache(maxsize=None)
+def is_rotational(device: int) -> t.Optional[bool]:
+    """
+    :param device: The device of the file (st_dev).
+    :return: True for the rotational disk, False for SSD or None if the type of the device is not known.
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+    block = f"/sys/dev/block/{os.major(device)}:{os.minor(device)}"
+    # the partition has the queue of its disk in the parent directory
+    for queue_folder in (os.path.join(block, "queue"), os.path.join(block, "..", "queue")):
+        try:
+            with open(os.path.join(queue_folder, "rotational")) as f:
+                return f.read().strip() == "1"
+        except OSError:
+            continue
+    return None
+
+
+def group_by_device(
+        files: t.Iterable[t.Tuple[T, str]],
+        location: t.Callable[[T], t.Tuple[t.Optional[int], t.Optional[int]]]
+) -> t.Dict[t.Optional[int], t.List[t.Tuple[T, str]]]:
+    """
+    :param files: The pairs of any item (for example db.File) and the full path to the file.
+    :param location: The function returning the device and the inode of the item, None if they are not known.
+    :return: The files by the devices in the order of the inodes, the files without the inode keep their order.
+    """
+    devices: t.Dict[t.Optional[int], t.List[t.Tuple[int, T, str]]] = dict()
+    for item, path_file in files:
+        device, inode = location(item)
+        devices.setdefault(device, list()).append((inode or 0, item, path_file))
+    return {
+        device: [(item, path_file) for _, item, path_file in sorted(device_files, key=lambda file: file[0])]
+        for device, device_files in devices.items()
+    }
+
+
+def read_by_devices(
+        devices: t.Dict[t.Optional[int], t.List[t.Tuple[T, str]]],
+        function: t.Callable[[str], R],
+        readers: t.Callable[[t.Optional[int]], int],
+        queue_size: int = 64
+) -> t.Iterator[t.Tuple[T, R]]:
+    """
+    Calling the function for the files of each device in its own threads. The results are returned
+    in the order in which the files were read, so the only consumer gets them in the calling thread.
+    The number of the waiting results is limited, so the readers wait for the slow consumer.
+    If the consumer stops (for example the cancelled scan), the readers finish the files being read.
+
+    :param devices: The files by the devices from the function group_by_device().
+    :param function: The function reading the file from the path (for example the hash of the file).
+    :param readers: The function returning the number of the threads for the device.
+    :param queue_size: The maximal number of the waiting results.
+    :return: The pairs of the item and the result of the function.
+    :raise Exception: The exception of the function is raised in the calling thread.
+    """
+    results: queue.Queue = queue.Queue(maxsize=queue_size)
+    stopped = threading.Event()
+
+    def read(device_files: t.Deque[t.Tuple[T, str]]) -> None:
+        try:
+            while not stopped.is_set():
+                try:
+                    item, path_file = device_files.popleft()
+                except IndexError:
+                    break
+                results.put((item, function(path_file), None))
+        except BaseException as error:
+            results.put((None, None, error))
+        finally:
+            # the end of the thread
+            results.put(None)
+
+    threads = list()
+    for device, device_files in devices.items():
+        device_queue = deque(device_files)
+        for index in range(max(1, min(readers(device), len(device_files)))):
+            threads.append(threading.Thread(
+                target=read, args=(device_queue,), name=f"reader-{device}-{index}", daemon=True
+            ))
+    for thread in threads:
+        thread.start()
+
+    try:
+        running = len(threads)
+        while running:
+            result = results.get()
+            if result is None:
+                running -= 1
+                continue
+            item, value, error = result
+            if error is not None:
+                raise error
+            yield item, value
+    finally:
+        stopped.set()
+        # the readers waiting for the full queue are released
+        for thread in threads:
+            while thread.is_alive():
+                try:
+                    results.get(timeout=0.1)
+                except queue.Empty:
+                    pass
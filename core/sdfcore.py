@@ -1,17 +1,52 @@
-from sqlalchemy import func
+from __future__ import annotations
 
-from core import db
-from hashlib import md5
+import config
+from core import hashers
+from core import scheduler
+from core.catalog import Catalog
+from core.lazy import lazy_import
+from core.progress import ScanCancelled, ScanProgress
+from core.stats import ScanStats
+from collections import deque
+from concurrent import futures
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from itertools import groupby, islice
+from operator import attrgetter
+import datetime
 import typing as t
+import mmap
 import os
-from sqlalchemy.orm import Session
-from sqlalchemy.sql.operators import and_
+import time
 
-# create database session
-global db_session
-engine = db.load_engine()
-db.create_db_structure(engine)
-db_session = db.create_session(engine)
+# the heavy modules are imported at the first use of the database
+db = lazy_import("core.db")
+sa = lazy_import("sqlalchemy")
+db_writer = lazy_import("core.writer")
+perceptual = lazy_import("core.perceptual")
+chunking = lazy_import("core.chunking")
+
+if t.TYPE_CHECKING:
+    from sqlalchemy import Row
+    from sqlalchemy.orm import Session
+    from sqlalchemy.sql import ColumnElement, Executable
+
+# the database of the application, it is opened at the first use
+catalog = Catalog()
+
+
+def __getattr__(name: str) -> t.Any:
+    """
+    The database session and the engine of the older version of the module (db_session, engine).
+
+    :param name: The name of the attribute of the module.
+    :return: The shared session or the engine of the catalog.
+    """
+    if name == "db_session":
+        return catalog.session
+    if name == "engine":
+        return catalog.engine
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def load_files(root_folder: str) -> t.Tuple[str, t.List[str]]:
@@ -21,126 +56,1859 @@ def load_files(root_folder: str) -> t.Tuple[str, t.List[str]]:
     :param root_folder: Relative path to the folder.
     :return: Tuple where is first value root folder and second value is the list of the all files with absolute path.
     """
-    list_files = list()
-    for (path, _, files) in os.walk(root_folder):
-        for file_name in files:
-            list_files.append(os.path.abspath((os.path.join(path, file_name))))
-    return os.path.abspath(root_folder), list_files
+    root_folder = os.path.abspath(root_folder)
+    return root_folder, [entry.path for entry in TreeWalker(root_folder)]
 
 
-def get_hash(path_file: str) -> str:
+def get_hash(
+        path_file: str,
+        stats: t.Optional[ScanStats] = None,
+        algorithm: t.Optional[str] = None
+) -> t.Optional[str]:
     """
-    Getting hash from file
+    Getting hash from file. The file is read in the blocks, so the memory usage does not depend on the size of the file.
 
     :param path_file: Full path to the file.
+    :param stats: The timers and the counters of the scan.
+    :param algorithm: The hash algorithm from the file hashers.py. The value None means config.HASH_ALGORITHM.
     :return: Hash from the file
     """
     if os.path.exists(path_file):
+        with open(path_file, "rb", buffering=0) as file:
+            hash_file = get_stream_hash(file, stats, algorithm)
+    else:
+        hash_file = None
+    return hash_file
+
+
+def get_stream_hash(
+        file: t.BinaryIO,
+        stats: t.Optional[ScanStats] = None,
+        algorithm: t.Optional[str] = None
+) -> str:
+    """
+    Getting hash from the opened file. The file is read to the reused buffer of the size config.HASH_BUFFER_SIZE.
+    The file larger than config.HASH_MMAP_THRESHOLD is mapped to the memory (if the threshold is not 0).
+    The time of the reading (hash_read) and the time of the hashing (hash_cpu) are recorded separately,
+    the mapped file is read during the hashing, so its whole time is recorded as hash_mmap.
+
+    :param file: The file opened in the binary mode.
+    :param stats: The timers and the counters of the scan.
+    :param algorithm: The hash algorithm from the file hashers.py. The value None means config.HASH_ALGORITHM.
+    :return: Hash from the file
+    """
+    file_hash = hashers.get_hasher(algorithm or config.HASH_ALGORITHM)()
+    file_size = os.fstat(file.fileno()).st_size
+    read_time = hash_time = 0.0
+    bytes_hashed = 0
+    if config.HASH_MMAP_THRESHOLD and file_size >= config.HASH_MMAP_THRESHOLD:
+        started = time.perf_counter()
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+            if hasattr(mmap, "MADV_SEQUENTIAL"):
+                mapped_file.madvise(mmap.MADV_SEQUENTIAL)
+            with memoryview(mapped_file) as view:
+                for offset in range(0, file_size, config.HASH_BUFFER_SIZE):
+                    with view[offset:offset + config.HASH_BUFFER_SIZE] as block:
+                        file_hash.update(block)
+        bytes_hashed = file_size
+        if stats is not None:
+            stats.record(
+                "hash_mmap", time.perf_counter() - started,
+                bytes_read=bytes_hashed, bytes_hashed=bytes_hashed, files_hashed=1
+            )
+    else:
+        buffer = bytearray(config.HASH_BUFFER_SIZE)
+        with memoryview(buffer) as view:
+            while True:
+                started = time.perf_counter()
+                size = file.readinto(buffer)
+                read_done = time.perf_counter()
+                read_time += read_done - started
+                if not size:
+                    break
+                with view[:size] as block:
+                    file_hash.update(block)
+                hash_time += time.perf_counter() - read_done
+                bytes_hashed += size
+        if stats is not None:
+            stats.record("hash_read", read_time, bytes_read=bytes_hashed)
+            stats.record("hash_cpu", hash_time, bytes_hashed=bytes_hashed, files_hashed=1)
+    return file_hash.hexdigest()
+
+
+def get_partial_hash(
+        path_file: str,
+        stats: t.Optional[ScanStats] = None,
+        algorithm: t.Optional[str] = None
+) -> t.Optional[str]:
+    """
+    Getting hash from the first and the last block of the file. The size of the block is config.PARTIAL_HASH_SIZE.
+    The hash of the small file is computed from the whole file.
+
+    :param path_file: Full path to the file.
+    :param stats: The timers and the counters of the scan.
+    :param algorithm: The hash algorithm from the file hashers.py. The value None means config.HASH_ALGORITHM.
+    :return: Hash from the first and the last block of the file
+    """
+    if os.path.exists(path_file):
+        started = time.perf_counter()
         with open(path_file, "rb") as file:
-            hash_file = md5(file.read()).hexdigest()
+            file_size = os.fstat(file.fileno()).st_size
+            first_block = file.read(config.PARTIAL_HASH_SIZE)
+            partial_hash = hashers.get_hasher(algorithm or config.HASH_ALGORITHM)()
+            partial_hash.update(first_block)
+            if file_size > 2 * config.PARTIAL_HASH_SIZE:
+                file.seek(-config.PARTIAL_HASH_SIZE, os.SEEK_END)
+            last_block = file.read(config.PARTIAL_HASH_SIZE)
+            partial_hash.update(last_block)
+            hash_file = partial_hash.hexdigest()
+        if stats is not None:
+            bytes_read = len(first_block) + len(last_block)
+            stats.record("partial_hash", time.perf_counter() - started, bytes_read=bytes_read, bytes_hashed=bytes_read)
     else:
         hash_file = None
     return hash_file
 
 
+T = t.TypeVar("T")
+
+
+def get_workers(workers: t.Optional[int] = None) -> int:
+    """
+    Getting the number of the hashing threads.
+
+    :param workers: The number of the threads for the scan. The value None means config.HASH_WORKERS.
+    :return: The number of the threads, 0 in the config means the number of CPUs.
+    """
+    if workers is None:
+        workers = config.HASH_WORKERS
+    return workers or os.cpu_count() or 1
+
+
+def get_device_workers(device: t.Optional[int], workers: int) -> int:
+    """
+    :param device: The device of the files (st_dev), None if it is not known.
+    :param workers: The number of the threads for the other devices than the rotational disks.
+    :return: The number of the threads reading the files of the device, config.HASH_WORKERS_ROTATIONAL
+        for the rotational disk (HDD).
+    """
+    if device is not None and scheduler.is_rotational(device):
+        return max(1, min(config.HASH_WORKERS_ROTATIONAL, workers))
+    return workers
+
+
+def hash_files(
+        files: t.Iterable[t.Tuple[T, str]],
+        hash_function: t.Callable[[str], t.Optional[str]],
+        workers: t.Optional[int] = None,
+        location: t.Optional[t.Callable[[T], t.Tuple[t.Optional[int], t.Optional[int]]]] = None
+) -> t.Iterator[t.Tuple[T, t.Optional[str]]]:
+    """
+    Hashing files in the pool of the threads. The reading of the file and hashlib release the GIL,
+    so the files are hashed in parallel. The results are returned in the same order as the files,
+    so the only consumer (for example the database writer) gets them in the calling thread.
+    With the function location the files are read by the devices (core/scheduler.py): each device has
+    its own threads (get_device_workers()), the files of one device are read in the order of the inodes
+    and the results are returned in the order of the reading.
+
+    :param files: The pairs of any item (for example db.File) and the full path to the file.
+    :param hash_function: The function computing the hash from the path (get_hash or get_partial_hash).
+    :param workers: The number of the threads (for one device with the function location).
+        The value None means config.HASH_WORKERS.
+    :param location: The function returning the device and the inode of the item.
+    :return: The pairs of the item and the hash of the file.
+    """
+    workers = get_workers(workers)
+    if location is not None:
+        devices = scheduler.group_by_device(files, location)
+        if workers > 1:
+            yield from scheduler.read_by_devices(
+                devices, hash_function, partial(get_device_workers, workers=workers), workers * 4
+            )
+            return
+        files = [file for device_files in devices.values() for file in device_files]
+
+    if workers == 1:
+        for item, path_file in files:
+            yield item, hash_function(path_file)
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # the number of the waiting files is limited, so the memory does not depend on the number of files
+        pending = deque()
+        for item, path_file in files:
+            pending.append((item, executor.submit(hash_function, path_file)))
+            if len(pending) >= workers * 4:
+                item, future = pending.popleft()
+                yield item, future.result()
+        while pending:
+            item, future = pending.popleft()
+            yield item, future.result()
+
+
+def get_file_stat(path_file: str) -> t.Optional[t.Dict[str, int]]:
+    """
+    Getting the metadata of the file for the detection of the changes.
+
+    :param path_file: Full path to the file.
+    :return: The values of the columns filesize, mtime_ns, inode and device of db.File or None if the file does not exist.
+    """
+    try:
+        file_stat = os.stat(path_file)
+    except OSError:
+        return None
+    return {
+        "filesize": file_stat.st_size,
+        "mtime_ns": file_stat.st_mtime_ns,
+        "inode": file_stat.st_ino,
+        "device": file_stat.st_dev
+    }
+
+
+def file_stat_changed(saved_file: db.File, file_stat: t.Dict[str, int]) -> bool:
+    """
+    Check if the metadata of the file on the disk differ from the metadata saved in the database.
+
+    :param saved_file: The file saved in the database.
+    :param file_stat: The metadata of the file from the function get_file_stat().
+    :return: It returns True if any value differs.
+    """
+    return any(getattr(saved_file, name) != value for name, value in file_stat.items())
+
+
+def file_changed(saved_file: db.File, stats: t.Optional[ScanStats] = None) -> bool:
+    """
+    Check if the file on the disk differs from the file saved in the database.
+    The file is compared only by the size and the hashes known in the saved stage of the duplicate detection.
+    The hashes are computed by the saved algorithm of the file, which can differ from config.HASH_ALGORITHM.
+    The file without the hash (the file with the unique size) can be compared only by its metadata,
+    so any change of the metadata means the changed file.
+
+    :param saved_file: The file saved in the database.
+    :param stats: The timers and the counters of the scan.
+    :return: It returns True if the file was changed or deleted.
+    """
+    file_stat = get_file_stat(saved_file.filename)
+    if file_stat is None:
+        return True
+    if saved_file.filesize is not None and saved_file.filesize != file_stat["filesize"]:
+        return True
+    if saved_file.filehash is not None:
+        return get_hash(saved_file.filename, stats, saved_file.hash_algorithm) != saved_file.filehash
+    if saved_file.partial_hash is not None:
+        return get_partial_hash(saved_file.filename, stats, saved_file.hash_algorithm) != saved_file.partial_hash
+    return file_stat_changed(saved_file, file_stat)
+
+
+def changed_file_values() -> t.Dict[str, t.Any]:
+    """
+    The changed file has to go through all stages of the duplicate detection again.
+    Its perceptual hash and its chunks are computed again too.
+
+    :return: The values of the columns of db.File for the changed file.
+    """
+    return {
+        "partial_hash": None,
+        "filehash": None,
+        "perceptual_hash": None,
+        "perceptual_algorithm": None,
+        "chunk_count": None,
+        "hash_stage": db.HASH_STAGE_SIZE,
+    }
+
+
 def file_exists(session: Session, file: str) -> bool:
     """
-    Check if the file exists in database. File has to have the same hash and filename.
+    Check if the file exists in database. File has to have the same filename and it must not be changed.
 
     :param session: The function create_session() from the file db.py
     :param file: Full path to the file.
     :return: It returns True or False
     """
-    return bool(session.query(db.File).filter(
-        and_(db.File.filename == file, db.File.filehash == get_hash(file))
-    ).first())
+    saved_files = session.query(db.File).filter(path_condition(file)).all()
+    return any(not file_changed(saved_file) for saved_file in saved_files)
 
 
-def save_files(session: Session, root_folder: str) -> None:
+def path_condition(path: str) -> ColumnElement:
+    """
+    The condition finding the file by the full path. The files are saved with the directory and the name,
+    so the condition uses the indexes of the directories and the names instead of comparing the full paths.
+
+    :param path: Full path to the file.
+    :return: The condition for the query of db.File
+    """
+    directory, name = os.path.split(path)
+    return sa.and_(
+        db.File.name == name,
+        db.File.directory_id.in_(sa.select(db.Directory.id).where(db.Directory.path == directory))
+    )
+
+
+def add_root_folder(session: Session, root_folder: str, name: t.Optional[str] = None) -> db.RootFolder:
     """
-    Saving files to the database if the files do not exist in the database.
     Saving the root folder to the database if it does not exist.
 
     :param session: The function create_session() from the file db.py
     :param root_folder: Full path to the root folder.
+    :param name: Custom name of the root folder. The value None means the path.
+    :return: The saved root folder.
     """
     saved_root_folder = session.query(db.RootFolder).filter(db.RootFolder.path == root_folder).first()
     if saved_root_folder is None:
         session.add(
             db.RootFolder(
-                name=root_folder,
+                name=name or root_folder,
                 path=root_folder
             )
         )
         session.commit()
         saved_root_folder = session.query(db.RootFolder).filter(db.RootFolder.path == root_folder).first()
+    return saved_root_folder
 
-    root_folder, files = load_files(root_folder)
-    for file in files:
-        if not file_exists(session, file):
-            session.add(
-                db.File(
-                    filehash=get_hash(file),
-                    filename=file,
-                    root_folder_id=saved_root_folder.id
-                )
+
+def delete_root_folders(
+        session: Session,
+        root_folder_ids: t.Iterable[int],
+        stats: t.Optional[ScanStats] = None
+) -> int:
+    """
+    Deleting the root folders with their directories, files, chunks of the files and scan jobs.
+    Only the rows of the table root_folder are deleted by one statement, the rows of the other tables
+    are deleted by ON DELETE CASCADE in the same transaction, so the files are not loaded to the session.
+    The chunks which are not used by any file and the saved groups of the duplicates are updated after it.
+
+    :param session: The function create_session() from the file db.py
+    :param root_folder_ids: IDs of the deleted root folders.
+    :param stats: The timers and the counters of the scan.
+    :return: The number of the deleted root folders.
+    """
+    root_folder_ids = list(root_folder_ids)
+    with BatchWriter(session, stats) as writer:
+        writer.execute(
+            sa.delete(db.RootFolder).where(db.RootFolder.id.in_(root_folder_ids)), rows_written=len(root_folder_ids)
+        )
+        writer.execute(sa.delete(db.Chunk).where(db.Chunk.refcount <= 0), rows_written=0)
+    refresh_duplicate_groups(session, stats)
+    return len(root_folder_ids)
+
+
+class ScanDelta(t.NamedTuple):
+    """
+    The changes in the root folder found by the scan.
+    """
+
+    added: t.List[str]
+    """ Full paths to the new files """
+
+    removed: t.List[str]
+    """ Full paths to the files which do not exist """
+
+    modified: t.List[str]
+    """ Full paths to the files with the changed metadata """
+
+
+class FileEntry(t.NamedTuple):
+    """
+    The file found by the class TreeWalker with its metadata.
+    """
+
+    path: str
+    """ Full path to the file """
+
+    size: int
+    """ The size of the file (st_size) """
+
+    mtime_ns: int
+    """ The time of the last modification of the file (st_mtime_ns) """
+
+    inode: int
+    """ The inode number of the file (st_ino) """
+
+    device: int
+    """ The identifier of the device with the file (st_dev) """
+
+    def file_stat(self) -> t.Dict[str, int]:
+        """
+        :return: The values of the columns filesize, mtime_ns, inode and device of db.File like get_file_stat().
+        """
+        return {"filesize": self.size, "mtime_ns": self.mtime_ns, "inode": self.inode, "device": self.device}
+
+
+class TreeWalker:
+    """
+    Generator of the files in the root folder built on os.scandir(). The files are returned one by one
+    with the metadata from the directory entries, so the memory usage does not depend on the number of the files.
+    In the incremental mode the directory with the same modification time as the saved directory is not listed
+    again, its files are known from the database and its sub-folders are known from the saved directories.
+    The walk can be stopped after any file and continued later from the directories of the method pending_directories().
+    """
+
+    def __init__(
+            self,
+            root_folder: str,
+            saved_directories: t.Optional[t.Dict[str, t.Any]] = None,
+            incremental: bool = False,
+            progress: t.Optional[ScanProgress] = None,
+            pending: t.Optional[t.List[str]] = None
+    ) -> None:
+        """
+        :param root_folder: Full path to the root folder.
+        :param saved_directories: The saved directories of the root folder (path: row with mtime_ns).
+        :param incremental: Skip listing the unchanged directories.
+        :param progress: The progress of the scan, it can cancel the scan by raising ScanCancelled.
+        :param pending: The directories waiting for the walk from the checkpoint of the interrupted walk.
+            The value None means the whole root folder.
+        """
+        self.root_folder = root_folder
+        self.saved_directories = saved_directories or dict()
+        self.incremental = incremental
+        self.progress = progress or ScanProgress()
+
+        self.stack: t.List[str] = [root_folder] if pending is None else list(pending)
+        """ The directories waiting for the walk """
+
+        self.current: t.Optional[str] = None
+        """ The directory which is being listed, its sub-folders are added to the end of the stack """
+
+        self.current_mark = 0
+        """ The size of the stack before listing the current directory """
+
+        self.listed_directories: t.Dict[str, t.Dict[str, int]] = dict()
+        """ The listed directories (path: mtime_ns and entry_count), it is complete after the end of the walk """
+
+        self.unchanged_directories: t.Set[str] = set()
+        """ The unchanged directories which were not listed, it is complete after the end of the walk """
+
+    def __iter__(self) -> t.Iterator[FileEntry]:
+        # the saved sub-folders of the directories
+        saved_subfolders = dict()
+        if self.incremental:
+            for path in self.saved_directories:
+                saved_subfolders.setdefault(os.path.dirname(path), list()).append(path)
+
+        stack = self.stack
+        while stack:
+            path = stack.pop()
+            # the time of the walk does not contain the time of the consumer of the files
+            walk_started = time.perf_counter()
+            self.progress.check_cancelled()
+            saved_directory = self.saved_directories.get(path)
+            try:
+                directory_mtime_ns = os.stat(path).st_mtime_ns
+                if self.incremental and saved_directory is not None and saved_directory.mtime_ns == directory_mtime_ns:
+                    self.unchanged_directories.add(path)
+                    stack.extend(saved_subfolders.get(path, list()))
+                    continue
+                entries = os.scandir(path)
+            except FileNotFoundError:
+                # the removed directory, its saved files are removed too
+                continue
+            except OSError:
+                # the unreadable directory keeps the saved files
+                self.progress.stats.count(directories_failed=1)
+                if saved_directory is not None:
+                    self.unchanged_directories.add(path)
+                continue
+
+            self.current, self.current_mark = path, len(stack)
+            entry_count = 0
+            files_walked = 0
+            walk_time = 0.0
+            with entries:
+                for entry in entries:
+                    entry_count += 1
+                    try:
+                        if entry.is_dir():
+                            # symbolic links to the folders are not followed like in os.walk()
+                            if not entry.is_symlink():
+                                stack.append(entry.path)
+                            continue
+                        entry_stat = entry.stat()
+                    except OSError:
+                        # for example the broken symbolic link
+                        continue
+                    self.progress.advance(entry.path)
+                    files_walked += 1
+                    walk_time += time.perf_counter() - walk_started
+                    yield FileEntry(
+                        entry.path, entry_stat.st_size, entry_stat.st_mtime_ns, entry_stat.st_ino, entry_stat.st_dev
+                    )
+                    walk_started = time.perf_counter()
+            walk_time += time.perf_counter() - walk_started
+            self.progress.stats.record("walk", walk_time, directories_walked=1, files_walked=files_walked)
+            self.listed_directories[path] = {"mtime_ns": directory_mtime_ns, "entry_count": entry_count}
+            self.current = None
+
+    def pending_directories(self) -> t.List[str]:
+        """
+        The checkpoint of the walk. The directory which is being listed is returned instead of its sub-folders
+        found so far, so the continued walk lists it again from the beginning.
+
+        :return: Full paths to the directories which were not listed completely.
+        """
+        if self.current is None:
+            return list(self.stack)
+        return self.stack[:self.current_mark] + [self.current]
+
+
+def save_files(
+        session: Session,
+        root_folder: str,
+        workers: t.Optional[int] = None,
+        progress: t.Optional[ScanProgress] = None,
+        incremental: bool = False,
+        subtree: t.Optional[str] = None,
+        resume: bool = True,
+        allow_empty: bool = False,
+        detect: bool = True
+) -> ScanDelta:
+    """
+    Saving files to the database if the files do not exist in the database.
+    The changed files are updated and the files which do not exist are deleted from the database.
+    Saving the root folder to the database if it does not exist.
+    The root folder which does not exist (for example the unmounted disk) is not scanned,
+    so its files are not deleted from the database. The unmounted disk can leave the empty mount point,
+    so the root folder on another device than in the previous scan and the empty root folder with the saved files
+    are not scanned either.
+    The scan is saved as the scan job with the checkpoint after each config.SCAN_CHECKPOINT_FILES files.
+    The next scan of the same folder resumes the interrupted scan (cancelled, failed or killed with the application):
+    the directories listed before the interruption are not listed again and the hashed files are not hashed again.
+
+    :param session: The function create_session() from the file db.py
+    :param root_folder: Full path to the root folder.
+    :param workers: The number of the hashing threads. The value None means config.HASH_WORKERS.
+    :param progress: The progress of the scan, it can cancel the scan by raising ScanCancelled.
+    :param incremental: The directories with the same modification time as in the previous scan are not listed
+        again. The modification of the existing file does not change the modification time of its directory,
+        so these changes are found only by the function check_changed_files().
+    :param subtree: Full path to the sub-folder of the root folder. Only this sub-folder is scanned.
+        The value None means the whole root folder.
+    :param resume: Continue the interrupted scan of the same folder. The value False starts the scan again.
+    :param allow_empty: Scan the empty root folder with the saved files, its files were really removed.
+    :param detect: Run the duplicate detection after the walk. The caller scanning several subtrees at once
+        (for example the watch mode) runs the detection once after all of them.
+    :return: The added, removed and modified files. The resumed scan returns only the changes found after the resume.
+    :raise FileNotFoundError: The root folder does not exist.
+    :raise OSError: The root folder is on another device or it is empty, the disk is probably not mounted.
+    """
+    if progress is None:
+        progress = ScanProgress()
+
+    if not os.path.isdir(root_folder):
+        raise FileNotFoundError(f"The root folder {root_folder} does not exist.")
+    saved_root_folder = add_root_folder(session, root_folder)
+    subtree = os.path.abspath(subtree or root_folder)
+    check_root_folder_mounted(session, saved_root_folder, subtree, allow_empty)
+    job = start_scan_job(session, saved_root_folder.id, subtree, resume)
+    job_id, job_stage = job.id, job.stage
+
+    # the unreadable directories and files of the previous runs of the job are counted too
+    counters = progress.stats.counters
+    failed_before = job.failed - counters["files_failed"] - counters["directories_failed"]
+
+    def checkpoint(pending: int, done: int, **values: t.Any) -> None:
+        """
+        Saving the state of the job. The rows written by the scan before are committed before the checkpoint.
+        """
+        update_scan_job(
+            session, job_id, progress.stats,
+            stage=progress.stage,
+            pending=pending,
+            done=done,
+            failed=failed_before + counters["files_failed"] + counters["directories_failed"],
+            **values
+        )
+
+    delta = ScanDelta(list(), list(), list())
+    try:
+        if job_stage == "Reading metadata":
+            progress.start_stage("Reading metadata")
+            save_walked_files(session, saved_root_folder.id, subtree, job, incremental, progress, delta, checkpoint)
+        if detect:
+            detect_duplicates(session, workers, progress, checkpoint)
+            detect_similar_images(session, workers, progress, checkpoint)
+            detect_chunks(session, progress, checkpoint)
+        checkpoint(0, progress.files_done, status=db.SCAN_JOB_DONE)
+    except (ScanCancelled, KeyboardInterrupt):
+        stop_scan_job(session, job_id, db.SCAN_JOB_INTERRUPTED)
+        raise
+    except Exception as error:
+        stop_scan_job(session, job_id, db.SCAN_JOB_FAILED, str(error))
+        raise
+    return delta
+
+
+def check_root_folder_mounted(
+        session: Session,
+        saved_root_folder: db.RootFolder,
+        subtree: str,
+        allow_empty: bool = False
+) -> None:
+    """
+    The scan of the empty mount point of the unmounted disk would delete all saved files of the root folder.
+    The device of the root folder is saved by the first scan and the next scans compare it.
+    The catalogs of the older version do not have the device, so the empty root folder with the saved files
+    is refused too, unless the files were really removed (allow_empty).
+    The removed root folder is deleted by the function delete_root_folders().
+
+    :param session: The function create_session() from the file db.py
+    :param saved_root_folder: The root folder from the function add_root_folder().
+    :param subtree: Full path to the scanned folder.
+    :param allow_empty: Do not refuse the empty root folder with the saved files.
+    :raise OSError: The root folder is on another device or it is empty and it has the saved files.
+    """
+    device = os.stat(saved_root_folder.path).st_dev
+    if saved_root_folder.device is not None and saved_root_folder.device != device:
+        raise OSError(
+            f"The root folder {saved_root_folder.path} is on another device than in the previous scan, "
+            f"the disk is probably not mounted."
+        )
+    if not allow_empty and subtree == os.path.abspath(saved_root_folder.path):
+        with os.scandir(subtree) as entries:
+            empty = next(entries, None) is None
+        if empty and session.query(db.File.id).filter(db.File.root_folder_id == saved_root_folder.id).first():
+            raise OSError(
+                f"The root folder {saved_root_folder.path} is empty, but it has the saved files, "
+                f"the disk is probably not mounted (scan it with --allow-empty if its files were removed)."
+            )
+    if saved_root_folder.device is None:
+        saved_root_folder.device = device
+        session.commit()
+
+
+def save_walked_files(
+        session: Session,
+        root_folder_id: int,
+        subtree: str,
+        job: db.ScanJob,
+        incremental: bool,
+        progress: ScanProgress,
+        delta: ScanDelta,
+        checkpoint: t.Callable[..., None]
+) -> None:
+    """
+    The walk of the function save_files(). The files are saved in the chunks of config.SCAN_CHECKPOINT_FILES files.
+    After each chunk the directories listed completely are saved with the ID of the job and the directories
+    waiting for the walk are saved to the checkpoint of the job. The resumed walk starts from these directories
+    and the directories listed by the job before keep their saved files like the unchanged directories.
+
+    :param session: The function create_session() from the file db.py
+    :param root_folder_id: ID of the root folder.
+    :param subtree: Full path to the scanned folder.
+    :param job: The scan job from the function start_scan_job().
+    :param incremental: Skip listing the unchanged directories.
+    :param progress: The progress of the scan, it can cancel the scan by raising ScanCancelled.
+    :param delta: The changes found by the scan, the found files are added to it.
+    :param checkpoint: The function saving the state of the job.
+    """
+    job_id, job_done, pending_directories = job.id, job.done, job.pending_directories
+
+    # the metadata of all saved files and directories in the subtree are loaded in one query
+    subtree_prefix = os.path.join(subtree, "")
+    subtree_condition = sa.and_(
+        db.Directory.root_folder_id == root_folder_id,
+        sa.or_(db.Directory.path == subtree, db.Directory.path.startswith(subtree_prefix, autoescape=True))
+    )
+    # the saved files by the directories (path to the directory: name: row)
+    saved_files: t.Dict[str, t.Dict[str, t.Any]] = dict()
+    for saved_file in session.query(
+            db.File.id, db.Directory.path, db.File.name,
+            db.File.filesize, db.File.mtime_ns, db.File.inode, db.File.device
+    ).join(db.Directory, db.File.directory_id == db.Directory.id).filter(subtree_condition):
+        saved_files.setdefault(saved_file.path, dict())[saved_file.name] = saved_file
+    saved_directories = {
+        saved_directory.path: saved_directory for saved_directory in session.query(
+            db.Directory.id, db.Directory.path, db.Directory.mtime_ns, db.Directory.scan_job_id
+        ).filter(subtree_condition)
+    }
+    # the IDs of the directories for the new files, the new directories are added during the walk
+    directory_ids = {path: saved_directory.id for path, saved_directory in saved_directories.items()}
+
+    walker = TreeWalker(subtree, saved_directories, incremental, progress, pending_directories)
+    walker.unchanged_directories.update(
+        path for path, saved_directory in saved_directories.items() if saved_directory.scan_job_id == job_id
+    )
+    entries = iter(walker)
+    listed_directories = walker.listed_directories
+
+    def new_files(
+            chunk: t.Iterable[FileEntry],
+            changed_files: t.List[t.Dict[str, t.Any]],
+            legacy_files: t.List[t.Dict[str, t.Any]]
+    ) -> t.Iterator[t.Dict[str, t.Any]]:
+        """
+        The new files are written to the database during the walk. The saved files found by the walk
+        are removed from saved_files, so only the files which were not found remain there.
+        The files saved by the older version of the application do not have the metadata,
+        they get the metadata from the walk and they keep their hashes.
+        """
+        for entry in chunk:
+            directory, name = os.path.split(entry.path)
+            saved_file = saved_files.get(directory, dict()).pop(name, None)
+            if saved_file is None:
+                delta.added.append(entry.path)
+                yield {
+                    "directory": directory,
+                    "name": name,
+                    "hash_stage": db.HASH_STAGE_SIZE,
+                    "root_folder_id": root_folder_id,
+                    **entry.file_stat()
+                }
+            elif saved_file.filesize is None:
+                legacy_files.append({"id": saved_file.id, **entry.file_stat()})
+            elif file_stat_changed(saved_file, entry.file_stat()):
+                # the changed file has to go through all stages of the duplicate detection again
+                delta.modified.append(entry.path)
+                changed_files.append({"id": saved_file.id, **changed_file_values(), **entry.file_stat()})
+
+    directories_saved = 0
+    while True:
+        changed_files = list()
+        legacy_files = list()
+        execute_in_batches(
+            session,
+            sa.insert(db.File),
+            with_directory_ids(
+                session, root_folder_id, directory_ids,
+                new_files(islice(entries, config.SCAN_CHECKPOINT_FILES), changed_files, legacy_files), progress.stats
+            ),
+            progress.stats
+        )
+        execute_in_batches(session, sa.update(db.File), changed_files, progress.stats)
+        execute_in_batches(session, sa.update(db.File), legacy_files, progress.stats)
+
+        # the saved files which were not found in the directories listed completely in this chunk are removed
+        listed_chunk = list(islice(listed_directories.items(), directories_saved, None))
+        directories_saved = len(listed_directories)
+        removed_files = list()
+        for path, _ in listed_chunk:
+            for name, saved_file in saved_files.pop(path, dict()).items():
+                delta.removed.append(os.path.join(path, name))
+                removed_files.append(saved_file.id)
+        delete_in_batches(session, db.File, removed_files, progress.stats)
+
+        # the listed directories are saved for the next incremental scan and for the resume of the job
+        execute_in_batches(session, sa.insert(db.Directory), (
+            {"path": path, "root_folder_id": root_folder_id, "scan_job_id": job_id, **directory}
+            for path, directory in listed_chunk if path not in directory_ids
+        ), progress.stats)
+        execute_in_batches(session, sa.update(db.Directory), (
+            {"id": directory_ids[path], "scan_job_id": job_id, **directory}
+            for path, directory in listed_chunk if path in directory_ids
+        ), progress.stats)
+
+        pending_directories = walker.pending_directories()
+        checkpoint(len(pending_directories), job_done + directories_saved, pending_directories=pending_directories)
+        if not pending_directories:
+            break
+
+    # the files of the directories which were not found
+    unchanged_directories = walker.unchanged_directories
+    removed_files = list()
+    for path, files in saved_files.items():
+        if path not in unchanged_directories:
+            for name, saved_file in files.items():
+                delta.removed.append(os.path.join(path, name))
+                removed_files.append(saved_file.id)
+    delete_in_batches(session, db.File, removed_files, progress.stats)
+    delete_in_batches(session, db.Directory, [
+        saved_directory.id for path, saved_directory in saved_directories.items()
+        if path not in listed_directories and path not in unchanged_directories
+    ], progress.stats)
+
+
+def start_scan_job(session: Session, root_folder_id: int, path: str, resume: bool = True) -> db.ScanJob:
+    """
+    Starting the scan job of the folder. The unfinished job of the same folder is resumed,
+    the finished jobs of the root folder are deleted, their summaries are kept in the table scan_run.
+
+    :param session: The function create_session() from the file db.py
+    :param root_folder_id: ID of the root folder.
+    :param path: Full path to the scanned folder, the root folder or its sub-folder.
+    :param resume: Resume the unfinished job. The value False deletes it and starts the new job.
+    :return: The running job.
+    """
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    unfinished_job = session.query(db.ScanJob).filter(
+        db.ScanJob.root_folder_id == root_folder_id,
+        db.ScanJob.path == path,
+        db.ScanJob.status != db.SCAN_JOB_DONE
+    ).order_by(db.ScanJob.id.desc()).first()
+    if resume and unfinished_job is not None:
+        unfinished_job.status = db.SCAN_JOB_RUNNING
+        unfinished_job.error = None
+        unfinished_job.updated = now
+        session.commit()
+        return unfinished_job
+
+    session.query(db.ScanJob).filter(
+        db.ScanJob.root_folder_id == root_folder_id,
+        sa.or_(db.ScanJob.status == db.SCAN_JOB_DONE, db.ScanJob.path == path)
+    ).delete(synchronize_session=False)
+    job = db.ScanJob(
+        root_folder_id=root_folder_id,
+        path=path,
+        status=db.SCAN_JOB_RUNNING,
+        stage="Reading metadata",
+        pending_directories=[path],
+        pending=1,
+        started=now,
+        updated=now
+    )
+    session.add(job)
+    session.commit()
+    return job
+
+
+def update_scan_job(session: Session, job_id: int, stats: t.Optional[ScanStats] = None, **values: t.Any) -> None:
+    """
+    Saving the checkpoint of the job. It is written by the database writer after the batches of the scan
+    sent before, so the checkpoint never refers to the rows which are not committed.
+
+    :param session: The function create_session() from the file db.py
+    :param job_id: ID of the scan job.
+    :param stats: The timers and the counters of the scan.
+    :param values: The values of the columns of db.ScanJob, for example stage, pending or done.
+    """
+    updated = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    execute_in_batches(session, sa.update(db.ScanJob), [{"id": job_id, "updated": updated, **values}], stats)
+
+
+def stop_scan_job(session: Session, job_id: int, status: str, error: t.Optional[str] = None) -> None:
+    """
+    Saving the state of the stopped job. The checkpoint is not changed, so the job is resumed from it.
+    The failure of the database is ignored, the job stays running and it is resumed anyway.
+
+    :param session: The function create_session() from the file db.py
+    :param job_id: ID of the scan job.
+    :param status: The state SCAN_JOB_INTERRUPTED or SCAN_JOB_FAILED.
+    :param error: The description of the error.
+    """
+    try:
+        session.rollback()
+        session.execute(sa.update(db.ScanJob).where(db.ScanJob.id == job_id).values(
+            status=status,
+            error=error[:1000] if error else None,
+            updated=datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        ))
+        session.commit()
+    except sa.exc.SQLAlchemyError:
+        session.rollback()
+
+
+def load_scan_jobs(session: Session, root_folder: t.Optional[str] = None) -> t.List[db.ScanJob]:
+    """
+    Loading the scan jobs with the number of the pending, done and failed items of the last checkpoint.
+
+    :param session: The function create_session() from the file db.py
+    :param root_folder: Full path to the root folder. The value None means all root folders.
+    :return: The jobs from the newest one.
+    """
+    query = session.query(db.ScanJob)
+    if root_folder is not None:
+        query = query.join(db.RootFolder, db.ScanJob.root_folder_id == db.RootFolder.id).filter(
+            db.RootFolder.path == root_folder
+        )
+    return query.order_by(db.ScanJob.id.desc()).all()
+
+
+def save_paths(session: Session, root_folder: str, paths: t.Iterable[str]) -> ScanDelta:
+    """
+    Saving the given files of the root folder to the database. The new files are added, the changed files
+    are updated and the files which do not exist are deleted. The function does not run the duplicate detection.
+
+    :param session: The function create_session() from the file db.py
+    :param root_folder: Full path to the root folder.
+    :param paths: Full paths to the files in the root folder.
+    :return: The added, removed and modified files.
+    """
+    saved_root_folder = add_root_folder(session, root_folder)
+    paths = sorted(set(paths))
+    saved_files = load_saved_files(session, paths)
+
+    delta = ScanDelta(list(), list(), list())
+    new_files = list()
+    changed_files = list()
+    removed_files = list()
+    for path in paths:
+        saved_file = saved_files.get(path)
+        file_stat = get_file_stat(path) if not os.path.isdir(path) else None
+        if file_stat is None:
+            if saved_file is not None:
+                delta.removed.append(path)
+                removed_files.append(saved_file.id)
+        elif saved_file is None:
+            delta.added.append(path)
+            directory, name = os.path.split(path)
+            new_files.append({
+                "directory": directory,
+                "name": name,
+                "hash_stage": db.HASH_STAGE_SIZE,
+                "root_folder_id": saved_root_folder.id,
+                **file_stat
+            })
+        elif file_stat_changed(saved_file, file_stat):
+            delta.modified.append(path)
+            changed_files.append({"id": saved_file.id, **changed_file_values(), **file_stat})
+
+    directory_ids = dict()
+    execute_in_batches(
+        session, sa.insert(db.File), with_directory_ids(session, saved_root_folder.id, directory_ids, new_files)
+    )
+    execute_in_batches(session, sa.update(db.File), changed_files)
+    delete_in_batches(session, db.File, removed_files)
+    return delta
+
+
+def load_saved_files(session: Session, paths: t.List[str]) -> t.Dict[str, t.Any]:
+    """
+    Loading the saved files by the full paths in the batches of the size config.DB_BATCH_SIZE.
+    The files are loaded by the directories and the names, so the result can contain other files
+    with the same names in the same directories.
+
+    :param session: The function create_session() from the file db.py
+    :param paths: Full paths to the files.
+    :return: The rows with the columns id, path (the directory), name, filesize, mtime_ns, inode and device
+        of the saved files by the full paths, the paths which are not saved are missing.
+    """
+    saved_files = dict()
+    for start in range(0, len(paths), config.DB_BATCH_SIZE):
+        batch = paths[start:start + config.DB_BATCH_SIZE]
+        for saved_file in session.query(
+                db.File.id, db.Directory.path, db.File.name,
+                db.File.filesize, db.File.mtime_ns, db.File.inode, db.File.device
+        ).join(db.Directory, db.File.directory_id == db.Directory.id).filter(
+            db.Directory.path.in_({os.path.dirname(path) for path in batch}),
+            db.File.name.in_({os.path.basename(path) for path in batch})
+        ):
+            saved_files[os.path.join(saved_file.path, saved_file.name)] = saved_file
+    return saved_files
+
+
+def with_directory_ids(
+        session: Session,
+        root_folder_id: int,
+        directory_ids: t.Dict[str, int],
+        rows: t.Iterable[t.Dict[str, t.Any]],
+        stats: t.Optional[ScanStats] = None
+) -> t.Iterator[t.Dict[str, t.Any]]:
+    """
+    Generator replacing the full path to the directory (the key "directory") of the new files by the ID
+    of the directory (the key "directory_id"). The rows are processed in the batches of the size config.DB_BATCH_SIZE
+    and the missing directories of the batch are saved in one transaction.
+    The saved directories do not have the modification time yet, it is saved after the directory is listed.
+
+    :param session: The function create_session() from the file db.py
+    :param root_folder_id: ID of the root folder of the files.
+    :param directory_ids: The known IDs of the directories (path: ID), the new directories are added.
+    :param rows: The values of the columns of the new files with the key "directory".
+    :param stats: The timers and the counters of the scan.
+    :return: The values of the columns of the new files with the key "directory_id".
+    """
+    rows = iter(rows)
+    while batch := list(islice(rows, config.DB_BATCH_SIZE)):
+        missing_directories = {row["directory"] for row in batch} - directory_ids.keys()
+        if missing_directories:
+            directory_ids.update(
+                session.query(db.Directory.path, db.Directory.id).filter(
+                    db.Directory.root_folder_id == root_folder_id, db.Directory.path.in_(missing_directories)
+                ).all()
+            )
+            missing_directories -= directory_ids.keys()
+        if missing_directories:
+            execute_in_batches(session, sa.insert(db.Directory), (
+                {"path": path, "root_folder_id": root_folder_id} for path in missing_directories
+            ), stats)
+            directory_ids.update(
+                session.query(db.Directory.path, db.Directory.id).filter(
+                    db.Directory.root_folder_id == root_folder_id, db.Directory.path.in_(missing_directories)
+                ).all()
             )
-            session.commit()
+        for row in batch:
+            row["directory_id"] = directory_ids[row.pop("directory")]
+            yield row
+
+
+def execute_in_batches(
+        session: Session,
+        statement: Executable,
+        rows: t.Iterable[t.Dict[str, t.Any]],
+        stats: t.Optional[ScanStats] = None
+) -> int:
+    """
+    Executing the statement for the rows in the batches of the size config.DB_BATCH_SIZE.
+    The batches are written by the database writer thread, so the next batch is prepared during the commit.
+    The function returns after all batches are committed.
+
+    :param session: The function create_session() from the file db.py
+    :param statement: The statement insert() or update() of the model from the file db.py
+    :param rows: The values of the columns, the update() statement needs the primary key "id".
+    :param stats: The timers and the counters of the scan, the time of the rows generator is not recorded.
+    :return: The number of the written rows.
+    """
+    number_of_rows = 0
+    batch = list()
+    with BatchWriter(session, stats) as writer:
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= config.DB_BATCH_SIZE:
+                writer.execute(statement, batch)
+                number_of_rows += len(batch)
+                batch = list()
+        if batch:
+            writer.execute(statement, batch)
+            number_of_rows += len(batch)
+    return number_of_rows
+
+
+def delete_in_batches(
+        session: Session,
+        model: t.Type[db.Base],
+        ids: t.List[int],
+        stats: t.Optional[ScanStats] = None
+) -> int:
+    """
+    Deleting the rows by the primary key in the batches of the size config.DB_BATCH_SIZE.
+    The batches are written by the database writer thread like in the function execute_in_batches().
+
+    :param session: The function create_session() from the file db.py
+    :param model: The model from the file db.py, for example db.File
+    :param ids: The primary keys of the deleted rows.
+    :param stats: The timers and the counters of the scan.
+    :return: The number of the deleted rows.
+    """
+    with BatchWriter(session, stats) as writer:
+        for start in range(0, len(ids), config.DB_BATCH_SIZE):
+            batch = ids[start:start + config.DB_BATCH_SIZE]
+            writer.execute(sa.delete(model).where(model.id.in_(batch)), rows_written=len(batch))
+    return len(ids)
+
+
+class BatchWriter:
+    """
+    Context manager sending the batches of one function to the database writer of the session.
+    The session is committed before the first batch, so it does not hold the lock which the writer waits for.
+    At the end it waits for all batches and the objects of the session are expired, so they are loaded again
+    with the written values. The batches committed before the error or ScanCancelled stay in the database.
+    """
+
+    def __init__(self, session: Session, stats: t.Optional[ScanStats] = None) -> None:
+        """
+        :param session: The function create_session() from the file db.py
+        :param stats: The timers and the counters of the scan.
+        """
+        self.session = session
+        self.stats = stats or ScanStats()
+        self.writer = db_writer.get_writer(session.get_bind())
+        self.futures: t.List[Future] = list()
+
+    def __enter__(self) -> BatchWriter:
+        self.session.commit()
+        return self
+
+    def execute(
+            self,
+            statement: t.Union[Executable, t.List[Executable]],
+            rows: t.Optional[t.List[t.Dict[str, t.Any]]] = None,
+            rows_written: t.Optional[int] = None
+    ) -> None:
+        """
+        Writing the batch.
+
+        :param statement: The statement insert(), update() or delete() of the model from the file db.py
+            or the list of the statements which are written in the same transaction.
+        :param rows: The values of the columns, None for the statement without the parameters.
+        :param rows_written: The number of the written rows for the statement without the parameters.
+        """
+        if self.writer is not None:
+            self.futures.append(self.writer.execute(statement, rows, self.stats, rows_written))
+            return
+        # the in-memory database is written directly by the session
+        with self.stats.timer("db_write", rows_written=len(rows or ()) if rows_written is None else rows_written):
+            for each_statement in statement if isinstance(statement, list) else [statement]:
+                self.session.execute(each_statement, rows)
+            self.session.commit()
+        self.stats.count(commits=1)
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        futures.wait(self.futures)
+        self.session.expire_all()
+        if exc_type is None:
+            for future in self.futures:
+                future.result()
+
+
+def detect_duplicates(
+        session: Session,
+        workers: t.Optional[int] = None,
+        progress: t.Optional[ScanProgress] = None,
+        checkpoint: t.Optional[t.Callable[..., None]] = None
+) -> None:
+    """
+    Staged detection of the duplicate files in the database.
+    The files with the same size get the partial hash (stage HASH_STAGE_PARTIAL)
+    and the files with the same size and the same partial hash get the full hash (stage HASH_STAGE_FULL).
+    The files with the unique size are never read and the sizes where all files have the full hash
+    (the catalog of the older version) are not read either. The hashes are committed in the batches, so the interrupted
+    detection continues with the files without the hash. The unreadable files are counted as files_failed
+    and they stay without the hash, so the next detection tries them again.
+    The files are hashed by config.HASH_ALGORITHM. The files hashed by another algorithm (before the change
+    of the configuration) lose their hashes and they go through the stages again, so only the files
+    with the colliding sizes are hashed by the new algorithm.
+
+    :param session: The function create_session() from the file db.py
+    :param workers: The number of the hashing threads. The value None means config.HASH_WORKERS.
+    :param progress: The progress of the scan, it can cancel the scan by raising ScanCancelled.
+    :param checkpoint: The function saving the number of the pending and the done files of the scan job,
+        it is called at the start of each stage and after each config.SCAN_CHECKPOINT_FILES files.
+    :raise ValueError: The hash algorithm of config.HASH_ALGORITHM is not available.
+    """
+    if progress is None:
+        progress = ScanProgress()
+    algorithm = config.HASH_ALGORITHM
+    hashers.get_hasher(algorithm)
+
+    # the files saved by the older version of the application do not have the size
+    old_files = session.query(db.File.id, db.File.filename).filter(db.File.filesize.is_(None)).all()
+    execute_in_batches(
+        session,
+        sa.update(db.File),
+        ({"id": file.id, **file_stat} for file in old_files if (file_stat := get_file_stat(file.filename))),
+        progress.stats
+    )
+
+    # the hashes of another algorithm can not be compared with the new hashes
+    other_algorithm_files = session.query(db.File.id).filter(
+        db.File.hash_algorithm != algorithm,
+        sa.or_(db.File.partial_hash.is_not(None), db.File.filehash.is_not(None))
+    ).all()
+    execute_in_batches(session, sa.update(db.File), (
+        {"id": file.id, "partial_hash": None, "filehash": None, "hash_stage": db.HASH_STAGE_SIZE}
+        for file in other_algorithm_files
+    ), progress.stats)
+
+    # the sizes with a file without the full hash, the files of the older version have only the full hash
+    # query: select filesize from file group by filesize having count(distinct inode) > 1 and count(id) > count(filehash);
+    same_size = session.query(db.File.filesize).group_by(db.File.filesize).having(
+        sa.func.count(sa.distinct(db.inode_key())) > 1,
+        sa.func.count(db.File.id) > sa.func.count(db.File.filehash)
+    ).subquery("same_size")
+    files = session.query(
+        db.File.id, db.File.filename, db.File.filesize, db.File.hash_stage, db.File.device, db.File.inode
+    ).join(
+        same_size, db.File.filesize == same_size.c.filesize
+    ).filter(db.File.partial_hash.is_(None)).all()
+    inodes = group_hardlinks(files)
+    progress.start_stage(
+        "Partial hash",
+        len(inodes),
+        sum(min(linked_files[0].filesize, 2 * config.PARTIAL_HASH_SIZE) for linked_files in inodes)
+    )
+    if checkpoint is not None:
+        checkpoint(len(inodes), 0)
+    execute_in_batches(
+        session,
+        sa.update(db.File),
+        (
+            {
+                "id": file.id,
+                "partial_hash": partial_hash,
+                "hash_algorithm": algorithm,
+                "hash_stage": max(file.hash_stage, db.HASH_STAGE_PARTIAL)
+            }
+            for linked_files, partial_hash in with_checkpoints(progress.track(
+                hash_files(
+                    [(linked_files, linked_files[0].filename) for linked_files in inodes],
+                    partial(try_hash, partial(get_partial_hash, stats=progress.stats, algorithm=algorithm), progress.stats),
+                    workers,
+                    hardlinks_location
+                ),
+                lambda result: result[0][0].filename,
+                lambda result: min(result[0][0].filesize, 2 * config.PARTIAL_HASH_SIZE)
+            ), progress, checkpoint)
+            for file in linked_files
+        ),
+        progress.stats
+    )
+
+    # query: select filesize, partial_hash from file group by filesize, partial_hash having count(distinct inode) > 1;
+    same_partial_hash = session.query(db.File.filesize, db.File.partial_hash).filter(
+        db.File.partial_hash.is_not(None)
+    ).group_by(db.File.filesize, db.File.partial_hash).having(
+        sa.func.count(sa.distinct(db.inode_key())) > 1
+    ).subquery("same_partial_hash")
+    files = session.query(db.File.id, db.File.filename, db.File.filesize, db.File.device, db.File.inode).join(
+        same_partial_hash,
+        sa.and_(
+            db.File.filesize == same_partial_hash.c.filesize,
+            db.File.partial_hash == same_partial_hash.c.partial_hash
+        )
+    ).filter(db.File.filehash.is_(None)).all()
+    inodes = group_hardlinks(files)
+    progress.start_stage("Full hash", len(inodes), sum(linked_files[0].filesize for linked_files in inodes))
+    if checkpoint is not None:
+        checkpoint(len(inodes), 0)
+    execute_in_batches(
+        session,
+        sa.update(db.File),
+        (
+            {"id": file.id, "filehash": filehash, "hash_algorithm": algorithm, "hash_stage": db.HASH_STAGE_FULL}
+            for linked_files, filehash in with_checkpoints(progress.track(
+                hash_files(
+                    [(linked_files, linked_files[0].filename) for linked_files in inodes],
+                    partial(try_hash, partial(get_hash, stats=progress.stats, algorithm=algorithm), progress.stats),
+                    workers,
+                    hardlinks_location
+                ),
+                lambda result: result[0][0].filename,
+                lambda result: result[0][0].filesize
+            ), progress, checkpoint)
+            for file in linked_files
+        ),
+        progress.stats
+    )
+    refresh_duplicate_groups(session, progress.stats)
+
+
+def refresh_duplicate_groups(session: Session, stats: t.Optional[ScanStats] = None) -> None:
+    """
+    Saving the groups of the duplicate files to the table duplicate_group for the pages sorted
+    by the wasted bytes. The old groups are replaced in one transaction, so the readers see either the old
+    or the new groups.
+
+    :param session: The function create_session() from the file db.py
+    :param stats: The timers and the counters of the scan.
+    """
+    with BatchWriter(session, stats) as writer:
+        writer.execute([
+            sa.delete(db.DuplicateGroup),
+            sa.insert(db.DuplicateGroup).from_select(["filehash", "filesize", "wasted"], db.duplicate_groups_select())
+        ], rows_written=0)
+
+
+def image_condition() -> ColumnElement:
+    """
+    :return: The condition for the query of db.File finding the images by the extensions config.IMAGE_EXTENSIONS
+    """
+    return sa.or_(*[sa.func.lower(db.File.name).endswith(extension) for extension in config.IMAGE_EXTENSIONS])
+
+
+def detect_similar_images(
+        session: Session,
+        workers: t.Optional[int] = None,
+        progress: t.Optional[ScanProgress] = None,
+        checkpoint: t.Optional[t.Callable[..., None]] = None
+) -> None:
+    """
+    The optional stage of the scan computing the perceptual hashes config.PERCEPTUAL_HASH of the images.
+    The stage is skipped if config.PERCEPTUAL_HASH is None or the package Pillow is not installed.
+    Each image is hashed once, the images with another algorithm of the perceptual hash are hashed again.
+    The image which can not be decoded gets no hash, but it is not decoded again until it is changed.
+
+    :param session: The function create_session() from the file db.py
+    :param workers: The number of the hashing threads. The value None means config.HASH_WORKERS.
+    :param progress: The progress of the scan, it can cancel the scan by raising ScanCancelled.
+    :param checkpoint: The function saving the number of the pending and the done files of the scan job.
+    """
+    algorithm = config.PERCEPTUAL_HASH
+    if algorithm is None or not perceptual.available():
+        return
+    if progress is None:
+        progress = ScanProgress()
+
+    files = session.query(db.File.id, db.File.filename, db.File.filesize, db.File.device, db.File.inode).filter(
+        image_condition(),
+        sa.or_(db.File.perceptual_algorithm.is_(None), db.File.perceptual_algorithm != algorithm)
+    ).all()
+    progress.start_stage("Perceptual hash", len(files), sum(file.filesize or 0 for file in files))
+    if checkpoint is not None:
+        checkpoint(len(files), 0)
+    execute_in_batches(
+        session,
+        sa.update(db.File),
+        (
+            {"id": file.id, "perceptual_hash": perceptual_hash, "perceptual_algorithm": algorithm}
+            for file, perceptual_hash in with_checkpoints(progress.track(
+                hash_files(
+                    [(file, file.filename) for file in files],
+                    partial(try_hash, partial(perceptual.image_hash, algorithm=algorithm), progress.stats),
+                    workers,
+                    attrgetter("device", "inode")
+                ),
+                lambda result: result[0].filename,
+                lambda result: result[0].filesize or 0
+            ), progress, checkpoint)
+        ),
+        progress.stats
+    )
+
+
+class SimilarImages(t.NamedTuple):
+    """
+    The pair of the images with the similar perceptual hashes.
+    """
+
+    first: Row
+    """ The image with the lower ID (id, filename, filesize, filehash, device, inode, perceptual_hash) """
+
+    second: Row
+    """ The image with the higher ID """
+
+    distance: int
+    """ The Hamming distance of the perceptual hashes, 0 means the same hashes """
+
+
+def find_similar_images(session: Session, max_distance: t.Optional[int] = None) -> t.List[SimilarImages]:
+    """
+    Finding the pairs of the similar images by the perceptual hashes of config.PERCEPTUAL_HASH.
+    The pairs are searched in the multi-index of the hashes, so not all pairs of the images are compared.
+    The exact duplicates (the same hash of the file) and the hardlinks are not returned,
+    they are listed by the function load_duplicate_files().
+
+    :param session: The function create_session() from the file db.py
+    :param max_distance: The maximal Hamming distance of the hashes. The value None means config.PERCEPTUAL_MAX_DISTANCE.
+    :return: The pairs sorted by the distance and the IDs of the files.
+    """
+    if max_distance is None:
+        max_distance = config.PERCEPTUAL_MAX_DISTANCE
+    images = session.query(
+        db.File.id, db.File.filename, db.File.filesize, db.File.filehash,
+        db.File.device, db.File.inode, db.File.perceptual_hash
+    ).filter(
+        db.File.perceptual_algorithm == config.PERCEPTUAL_HASH, db.File.perceptual_hash.is_not(None)
+    ).order_by(db.File.id).all()
+    pairs = list()
+    for first, second, distance in perceptual.similar_pairs(
+            ((image, image.perceptual_hash) for image in images), max_distance
+    ):
+        if first.filehash is not None and first.filehash == second.filehash:
+            continue
+        if first.inode is not None and (first.device, first.inode) == (second.device, second.inode):
+            continue
+        pairs.append(SimilarImages(first, second, distance))
+    pairs.sort(key=lambda pair: (pair.distance, pair.first.id, pair.second.id))
+    return pairs
+
+
+def detect_chunks(
+        session: Session,
+        progress: t.Optional[ScanProgress] = None,
+        checkpoint: t.Optional[t.Callable[..., None]] = None
+) -> None:
+    """
+    The optional stage of the scan splitting the files of at least config.CHUNK_MIN_FILE_SIZE bytes
+    to the content-defined chunks for the block-level duplicate analysis. The stage runs only
+    with config.CHUNK_SCAN and SQLite, which keeps the reference counts of the chunks by the triggers.
+    Each inode is split once, the hardlinks do not take the space. The chunks of the file are written
+    in the batches during the reading, so the memory does not depend on the size of the file.
+    The chunking holds the GIL between the reads, so the files are split one by one.
+
+    :param session: The function create_session() from the file db.py
+    :param progress: The progress of the scan, it can cancel the scan by raising ScanCancelled.
+    :param checkpoint: The function saving the number of the pending and the done files of the scan job.
+    """
+    if not config.CHUNK_SCAN or session.get_bind().dialect.name != "sqlite":
+        return
+    from sqlalchemy.dialects import sqlite
+    if progress is None:
+        progress = ScanProgress()
+
+    files = session.query(
+        db.File.id, db.File.filename, db.File.filesize, db.File.device, db.File.inode, db.File.chunk_count
+    ).filter(db.File.filesize >= config.CHUNK_MIN_FILE_SIZE).order_by(db.File.device, db.File.inode).all()
+    inodes = [
+        linked_files[0] for linked_files in group_hardlinks(files)
+        if all(file.chunk_count is None for file in linked_files)
+    ]
+    progress.start_stage("Chunking", len(inodes), sum(file.filesize for file in inodes))
+    if checkpoint is not None:
+        checkpoint(len(inodes), 0)
+
+    insert_chunks = sqlite.insert(db.Chunk).on_conflict_do_nothing()
+    insert_file_chunks = sqlite.insert(db.FileChunk)
+    insert_file_chunks = insert_file_chunks.on_conflict_do_update(
+        index_elements=[db.FileChunk.file_id, db.FileChunk.digest],
+        set_={"count": db.FileChunk.count + insert_file_chunks.excluded["count"]}
+    )
+    for file in with_checkpoints(progress.track(inodes, attrgetter("filename"), attrgetter("filesize")), progress, checkpoint):
+        # the chunks of the interrupted or the failed chunking of the file are removed first
+        remove_chunks = sa.delete(db.FileChunk).where(db.FileChunk.file_id == file.id)
+        chunk_count = 0
+        try:
+            with BatchWriter(session, progress.stats) as writer:
+                writer.execute(remove_chunks, rows_written=0)
+                chunks = chunking.chunk_file(
+                    file.filename, config.CHUNK_WINDOW_SIZE, config.CHUNK_MAX_SIZE, config.HASH_BUFFER_SIZE
+                )
+                with progress.stats.timer("chunk"):
+                    batch = list(islice(chunks, config.DB_BATCH_SIZE))
+                while batch:
+                    counts: t.Dict[bytes, t.List[int]] = dict()
+                    for digest, size in batch:
+                        counts.setdefault(digest, [size, 0])[1] += 1
+                    # the writer is FIFO, so the chunk is saved before its reference
+                    writer.execute(insert_chunks, [
+                        {"digest": digest, "size": size, "refcount": 0} for digest, (size, _) in counts.items()
+                    ])
+                    writer.execute(insert_file_chunks, [
+                        {"file_id": file.id, "digest": digest, "count": count} for digest, (_, count) in counts.items()
+                    ])
+                    chunk_count += len(batch)
+                    progress.check_cancelled()
+                    with progress.stats.timer("chunk"):
+                        batch = list(islice(chunks, config.DB_BATCH_SIZE))
+                writer.execute(sa.update(db.File), [{"id": file.id, "chunk_count": chunk_count}])
+        except OSError:
+            progress.stats.count(files_failed=1)
+            with BatchWriter(session, progress.stats) as writer:
+                writer.execute(remove_chunks, rows_written=0)
+        else:
+            progress.stats.count(bytes_read=file.filesize)
+
+    # the chunks of the removed and the changed files
+    with BatchWriter(session, progress.stats) as writer:
+        writer.execute(sa.delete(db.Chunk).where(db.Chunk.refcount <= 0), rows_written=0)
+
+
+class ChunkSummary(t.NamedTuple):
+    """
+    The block-level redundancy of the split files.
+    """
+
+    files: int
+    """ The number of the split files (one file of the hardlinks) """
+
+    chunks: int
+    """ The number of the different chunks """
 
+    referenced_bytes: int
+    """ The size of all chunks of the files, it is the size of the files """
 
-def check_changed_files(session: Session) -> t.List[str]:
+    stored_bytes: int
+    """ The size of the different chunks, the files would take this space after the block-level deduplication """
+
+    reclaimable_bytes: int
+    """ The bytes released by the block-level deduplication (referenced_bytes - stored_bytes) """
+
+
+def summarize_chunks(session: Session) -> ChunkSummary:
+    """
+    :param session: The function create_session() from the file db.py
+    :return: The block-level redundancy of the files split by the function detect_chunks().
+    """
+    files = session.query(sa.func.count(db.File.id)).filter(db.File.chunk_count.is_not(None)).scalar()
+    chunks, referenced_bytes, stored_bytes = session.query(
+        sa.func.count(db.Chunk.digest),
+        sa.func.coalesce(sa.func.sum(db.Chunk.size * db.Chunk.refcount), 0),
+        sa.func.coalesce(sa.func.sum(db.Chunk.size), 0)
+    ).filter(db.Chunk.refcount > 0).one()
+    return ChunkSummary(files, chunks, referenced_bytes, stored_bytes, referenced_bytes - stored_bytes)
+
+
+class ChunkPair(t.NamedTuple):
+    """
+    The pair of the files sharing the chunks.
+    """
+
+    first: Row
+    """ The file with the lower ID (id, filename, filesize, filehash) """
+
+    second: Row
+    """ The file with the higher ID """
+
+    shared_bytes: int
+    """ The size of the chunks which are in both files """
+
+    ratio: float
+    """ The shared bytes divided by the size of the larger file """
+
+
+def iter_chunk_pairs(session: Session, min_ratio: t.Optional[float] = None) -> t.Iterator[ChunkPair]:
+    """
+    Generator finding the pairs of the files sharing the chunks. The shared chunks are joined
+    for one file after another, so the pairs of all files are never loaded at once.
+    The exact duplicates (the same hash of the file) are listed by the function
+    load_duplicate_files(), so they are not returned.
+
+    :param session: The function create_session() from the file db.py
+    :param min_ratio: The minimal shared part of the larger file. The value None means config.CHUNK_PAIR_MIN_RATIO.
+    :return: The pairs ordered by the ID of the first file.
+    """
+    if min_ratio is None:
+        min_ratio = config.CHUNK_PAIR_MIN_RATIO
+    own_chunk, other_chunk = sa.orm.aliased(db.FileChunk), sa.orm.aliased(db.FileChunk)
+    files = session.query(db.File.id, db.File.filename, db.File.filesize, db.File.filehash).filter(
+        db.File.chunk_count > 0
+    ).order_by(db.File.id).all()
+    for first in files:
+        shared = session.query(
+            other_chunk.file_id,
+            sa.func.sum(db.Chunk.size * sa.func.min(own_chunk.count, other_chunk.count)).label("shared_bytes")
+        ).select_from(own_chunk).join(
+            db.Chunk, db.Chunk.digest == own_chunk.digest
+        ).join(
+            other_chunk, other_chunk.digest == own_chunk.digest
+        ).filter(
+            own_chunk.file_id == first.id,
+            other_chunk.file_id > first.id,
+            # the chunks only in this file are not joined
+            db.Chunk.refcount > own_chunk.count
+        ).group_by(other_chunk.file_id).subquery()
+        for second in session.query(
+                db.File.id, db.File.filename, db.File.filesize, db.File.filehash, shared.c.shared_bytes
+        ).join(shared, db.File.id == shared.c.file_id).order_by(db.File.id):
+            if first.filehash is not None and first.filehash == second.filehash:
+                continue
+            ratio = second.shared_bytes / max(first.filesize, second.filesize, 1)
+            if ratio >= min_ratio:
+                yield ChunkPair(first, second, second.shared_bytes, ratio)
+
+
+def try_hash(hash_function: t.Callable[[str], T], stats: ScanStats, path_file: str) -> t.Optional[T]:
+    """
+    Hashing the file which can be unreadable, for example without the permission or on the failing disk.
+
+    :param hash_function: The function computing the hash from the path (get_hash or get_partial_hash).
+    :param stats: The timers and the counters of the scan, the unreadable file is counted as files_failed.
+    :param path_file: Full path to the file.
+    :return: Hash from the file or None if the file can not be read.
+    """
+    try:
+        return hash_function(path_file)
+    except OSError:
+        stats.count(files_failed=1)
+        return None
+
+
+def with_checkpoints(
+        items: t.Iterable[T],
+        progress: ScanProgress,
+        checkpoint: t.Optional[t.Callable[..., None]]
+) -> t.Iterator[T]:
+    """
+    Generator calling the checkpoint of the scan job after each config.SCAN_CHECKPOINT_FILES items of the stage.
+
+    :param items: The processed items, for example the hashed files.
+    :param progress: The progress of the stage with the number of all and the done files.
+    :param checkpoint: The function saving the number of the pending and the done files, None means no checkpoints.
+    :return: The same items.
+    """
+    for index, item in enumerate(items, 1):
+        yield item
+        if checkpoint is not None and index % config.SCAN_CHECKPOINT_FILES == 0:
+            checkpoint(progress.files_total - progress.files_done, progress.files_done)
+
+
+def group_hardlinks(files: t.Iterable[Row]) -> t.List[t.List[Row]]:
+    """
+    Grouping the files by the inode. The files in one group are the hardlinks of the same data,
+    so they are hashed once and they do not waste the space.
+
+    :param files: The rows with the columns id, device and inode.
+    :return: The list of the lists of the hardlinks in the order of the first file of the group.
+    """
+    inodes = dict()
+    for file in files:
+        key = (file.device, file.inode) if file.inode is not None else ("id", file.id)
+        inodes.setdefault(key, list()).append(file)
+    return list(inodes.values())
+
+
+def hardlinks_location(linked_files: t.List[Row]) -> t.Tuple[t.Optional[int], t.Optional[int]]:
+    """
+    :param linked_files: The hardlinks of the same data from the function group_hardlinks().
+    :return: The device and the inode of the files for the function hash_files().
+    """
+    return linked_files[0].device, linked_files[0].inode
+
+
+class DuplicateGroupSummary(t.NamedTuple):
+    """
+    The summary of the group of the duplicate files.
+    """
+
+    filehash: str
+    """ The hash of the files """
+
+    filesize: int
+    """ The size of one file """
+
+    copies: t.List[t.List[Row]]
+    """ The copies of the file, each copy is the list of its hardlinks """
+
+    reclaimable: int
+    """ The bytes released after deleting all copies except one """
+
+
+def summarize_duplicate_group(group: t.List[Row]) -> DuplicateGroupSummary:
+    """
+    Summary of the group of the duplicate files which tells apart the hardlinks from the real copies.
+
+    :param group: The group from the function iter_duplicate_groups().
+    :return: The summary of the group.
+    """
+    copies = group_hardlinks(group)
+    filesize = group[0].filesize or 0
+    return DuplicateGroupSummary(group[0].filehash, filesize, copies, (len(copies) - 1) * filesize)
+
+
+def check_changed_files(
+        session: Session,
+        paranoid: bool = False,
+        progress: t.Optional[ScanProgress] = None
+) -> t.List[str]:
     """
     The function checks if the files exist in the database and the file exists on the disk.
     The deleted files are detected as changed files.
+    Only the files with the changed metadata (size, mtime, inode, device) are hashed again.
+    The file with the changed metadata and the same content gets the new metadata in the database.
+    The file without the hash is changed if its metadata changed.
 
     :param session: The function create_session() from the file db.py
+    :param paranoid: If it is True, all files are hashed again regardless of the metadata. The files without
+        the full hash (the unique size or only the partial hash) get the full hash,
+        so the next paranoid check compares their whole content.
+    :param progress: The progress of the check, it can cancel the check by raising ScanCancelled.
     :return: List of the changed files
     """
+    if progress is None:
+        progress = ScanProgress()
+
     # load all files from the database
     files = session.query(db.File).all()
+    progress.start_stage("Checking files", len(files))
+    progress.stats.count(files_walked=len(files))
+    algorithm = config.HASH_ALGORITHM
     changed_files = list()
+    unchanged_files = list()
     for file in files:
-        if not get_hash(file.filename) == file.filehash:
+        file_stat = get_file_stat(file.filename)
+        if file_stat is None:
+            progress.advance(file.filename)
             changed_files.append(file.filename)
+        elif paranoid or file_stat_changed(file, file_stat):
+            progress.advance(file.filename, file_stat["filesize"])
+            if file_changed(file, progress.stats):
+                changed_files.append(file.filename)
+            elif paranoid and file.filehash is None:
+                # the partial hash does not cover the middle of the file, the full hash is computed
+                # by the algorithm of the partial hash
+                file_algorithm = file.hash_algorithm if file.partial_hash is not None else algorithm
+                hash_function = partial(get_hash, stats=progress.stats, algorithm=file_algorithm)
+                filehash = try_hash(hash_function, progress.stats, file.filename)
+                if filehash is not None:
+                    unchanged_files.append({
+                        "id": file.id, "filehash": filehash, "hash_algorithm": file_algorithm,
+                        "hash_stage": db.HASH_STAGE_FULL
+                    })
+            elif file_stat_changed(file, file_stat):
+                unchanged_files.append({"id": file.id, **file_stat})
+        else:
+            progress.advance(file.filename)
+    execute_in_batches(session, sa.update(db.File), unchanged_files, progress.stats)
 
     return changed_files
 
 
-def save_changed_files(session: Session, list_files: t.List[str]) -> None:
+def save_changed_files(
+        session: Session,
+        list_files: t.List[str],
+        workers: t.Optional[int] = None,
+        progress: t.Optional[ScanProgress] = None
+) -> None:
     """
     Save changed files in filesystem. They are the deleted files and changed files.
     These changes are detected of the function check_changed_files()
+    The files are loaded, updated and deleted in the batches of the size config.DB_BATCH_SIZE.
 
     :param session: The function create_session() from the file db.py
     :param list_files: The list of the changed files.
+    :param workers: The number of the hashing threads. The value None means config.HASH_WORKERS.
+    :param progress: The progress of the scan, it can cancel the scan by raising ScanCancelled.
     """
+    if progress is None:
+        progress = ScanProgress()
+
+    progress.start_stage("Saving changed files", len(list_files))
+    saved_files = load_saved_files(session, list_files)
+    changed_files = list()
+    removed_files = list()
     for file in list_files:
-        file_from_db = session.query(db.File).filter(db.File.filename == file).one()
-        if not os.path.exists(file_from_db.filename):
-            session.delete(file_from_db)
+        progress.advance(file)
+        saved_file = saved_files.get(file)
+        if saved_file is None:
+            continue
+        file_stat = get_file_stat(file)
+        if file_stat is None:
+            removed_files.append(saved_file.id)
         else:
-            session.query(db.File).filter(db.File.filename == file).update({'filehash': get_hash(file)})
-        session.commit()
+            changed_files.append({"id": saved_file.id, **changed_file_values(), **file_stat})
+    execute_in_batches(session, sa.update(db.File), changed_files, progress.stats)
+    delete_in_batches(session, db.File, removed_files, progress.stats)
+
+    detect_duplicates(session, workers, progress)
+    detect_similar_images(session, workers, progress)
+    detect_chunks(session, progress)
+
+
+def save_scan_run(
+        session: Session,
+        command: str,
+        stats: ScanStats,
+        root_folder: t.Optional[str] = None
+) -> t.Dict[str, t.Any]:
+    """
+    Saving the summary of the finished scan to the table scan_run.
+
+    :param session: The function create_session() from the file db.py
+    :param command: The name of the scan, for example "scan" or "check".
+    :param stats: The timers and the counters of the scan, usually ScanProgress.stats
+    :param root_folder: Full path to the scanned root folder.
+    :return: The saved summary from the method ScanStats.summary()
+    """
+    stats.end_stage()
+    summary = stats.summary()
+    counters = summary["counters"]
+    finished = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    session.add(db.ScanRun(
+        command=command,
+        root_folder=root_folder,
+        started=finished - datetime.timedelta(seconds=summary["duration_s"]),
+        duration=summary["duration_s"],
+        files_walked=counters["files_walked"],
+        bytes_read=counters["bytes_read"],
+        bytes_hashed=counters["bytes_hashed"],
+        rows_written=counters["rows_written"],
+        commits=counters["commits"],
+        stats=summary
+    ))
+    session.commit()
+    return summary
+
+
+def load_scan_runs(session: Session, limit: int = 20) -> t.List[db.ScanRun]:
+    """
+    Loading the summaries of the last scans.
+
+    :param session: The function create_session() from the file db.py
+    :param limit: The maximal number of the scans.
+    :return: The scans from the newest one.
+    """
+    return session.query(db.ScanRun).order_by(db.ScanRun.started.desc(), db.ScanRun.id.desc()).limit(limit).all()
 
 
 def load_duplicate_files(session: Session) -> t.List[t.List[db.File]]:
     """
-    Load only duplicates of the files. The list of the list of the files is sorted by 'id' of the file.
+    Load only duplicates of the files confirmed by the full hash.
+    All duplicates are loaded in one query sorted by the hash and 'id' of the file.
+    The list of the list of the files is sorted by 'id' of the file.
 
     :param session: The function create_session() from the file db.py
     :return: The list of the list of the db.File object
     """
-    duplicate_files = list()
-
     # get duplicate hash of files
-    # query: select * from (select count(*) as file_number, filehash from file group by filehash) where file_number > 1;
-    subquery = session.query(
-        func.count(db.File.filehash).label("filenumber"),
-        db.File.filehash.label("filehash")
-    ).group_by(db.File.filehash).subquery("subquery")
+    # query: select filehash from file where filehash is not null group by filehash having count(distinct inode) > 1;
+    duplicate_hashes = session.query(db.File.filehash).filter(
+        db.File.filehash.is_not(None)
+    ).group_by(db.File.filehash).having(sa.func.count(sa.distinct(db.inode_key())) > 1).subquery("duplicate_hashes")
+
+    # query: select file.* from file join duplicate_hashes using (filehash) order by filehash, id;
+    files = session.query(db.File).join(
+        duplicate_hashes, db.File.filehash == duplicate_hashes.c.filehash
+    ).order_by(db.File.filehash, db.File.id)
 
-    hashes = session.query(subquery.c.filehash).filter(subquery.c.filenumber > 1).all()
-    for hash in hashes:
-        duplicate_files.append(session.query(db.File).filter(db.File.filehash == hash[0]).all())
+    return [list(duplicate_files) for _, duplicate_files in groupby(files, key=attrgetter("filehash"))]
+
+
+def load_duplicate_page(
+        session: Session,
+        page_size: t.Optional[int] = None,
+        after: t.Optional[t.Tuple] = None,
+        order_by_wasted: bool = False,
+        min_size: int = 0
+) -> t.Tuple[t.List[t.List[Row]], t.Optional[t.Tuple]]:
+    """
+    Load one page of the duplicates confirmed by the full hash. The pages use the keyset pagination,
+    so the next page is loaded by the key of the last group and the loading does not depend on the number of the pages.
+    The files are returned as the lightweight rows (id, filename, filehash, filesize, device, inode) outside the session.
+    The hardlinks of the same file are not duplicates, so the group has at least two different inodes.
+
+    :param session: The function create_session() from the file db.py
+    :param page_size: The number of the groups on the page. The value None means config.DUPLICATE_PAGE_SIZE.
+    :param after: The key of the last group from the previous page or None for the first page.
+    :param order_by_wasted: The groups are sorted by the wasted bytes (the largest first) instead of the hash.
+        These groups are read from the table duplicate_group saved by the function detect_duplicates().
+    :param min_size: Only the groups of the files with at least this size (bytes) are loaded.
+    :return: Tuple where is first value the list of the groups and second value the key for the next page or None.
+    """
+    if page_size is None:
+        page_size = config.DUPLICATE_PAGE_SIZE
 
-    return duplicate_files
+    if order_by_wasted:
+        # the groups saved by the duplicate detection are read by the index of the wasted bytes
+        query = sa.select(db.DuplicateGroup.filehash, db.DuplicateGroup.wasted)
+        if min_size:
+            query = query.where(db.DuplicateGroup.filesize >= min_size)
+        if after is not None:
+            query = query.where(
+                db.DuplicateGroup.wasted <= after[0],
+                sa.or_(db.DuplicateGroup.wasted < after[0], db.DuplicateGroup.filehash > after[1])
+            )
+        query = query.order_by(db.DuplicateGroup.wasted.desc(), db.DuplicateGroup.filehash)
+    else:
+        # query: select filehash, max(filesize), (count(distinct inode) - 1) * max(filesize) as wasted from file
+        #        where filehash > :after group by filehash having count(distinct inode) > 1 order by filehash;
+        # the range of the hashes after the previous page is read by the index ix_file_filehash
+        query = db.duplicate_groups_select()
+        if min_size:
+            query = query.where(db.File.filesize >= min_size)
+        if after is not None:
+            query = query.where(db.File.filehash > after[0])
+        query = query.order_by(db.File.filehash)
+    hashes = [(row.filehash, row.wasted) for row in session.execute(query.limit(page_size))]
+    if not hashes:
+        return list(), None
+
+    # query: select id, filename, filehash, filesize, device, inode from file where filehash in (...)
+    #        order by filehash, id;
+    files = session.query(
+        db.File.id, db.File.filename, db.File.filehash, db.File.filesize, db.File.device, db.File.inode
+    ).filter(
+        db.File.filehash.in_([filehash for filehash, _ in hashes])
+    ).order_by(db.File.filehash, db.File.id)
+    groups = {filehash: list(duplicate_files) for filehash, duplicate_files in groupby(files, key=attrgetter("filehash"))}
+    # the saved group can be out of date until the next duplicate detection
+    groups = {filehash: group for filehash, group in groups.items() if len(group_hardlinks(group)) > 1}
+
+    last_hash, last_wasted = hashes[-1]
+    if len(hashes) < page_size:
+        next_key = None
+    elif order_by_wasted:
+        next_key = (last_wasted, last_hash)
+    else:
+        next_key = (last_hash,)
+    return [groups[filehash] for filehash, _ in hashes if filehash in groups], next_key
+
+
+def iter_duplicate_groups(
+        session: Session,
+        page_size: t.Optional[int] = None,
+        order_by_wasted: bool = False,
+        min_size: int = 0
+) -> t.Iterator[t.List[Row]]:
+    """
+    Generator of the duplicates confirmed by the full hash. The groups are loaded by the pages,
+    so the memory usage depends only on the size of the page.
+
+    :param session: The function create_session() from the file db.py
+    :param page_size: The number of the groups loaded in one query. The value None means config.DUPLICATE_PAGE_SIZE.
+    :param order_by_wasted: The groups are sorted by the wasted bytes (the largest first) instead of the hash.
+    :param min_size: Only the groups of the files with at least this size (bytes) are loaded.
+    :return: The groups of the rows (id, filename, filehash, filesize, device, inode)
+    """
+    after = None
+    while True:
+        groups, after = load_duplicate_page(session, page_size, after, order_by_wasted, min_size)
+        yield from groups
+        if after is None:
+            break
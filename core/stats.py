@@ -0,0 +1,209 @@
+"""
+The instrumentation of the scan. The scan functions from sdfcore.py record the durations of the operations
+(walking the directories, reading and hashing the files, writing to the database) to the histograms
+and count the processed files, bytes and rows. The summary is saved to the table scan_run after the scan.
+"""
+import contextlib
+import math
+import threading
+import time
+import typing as t
+
+COUNTERS = (
+    "files_walked",
+    "directories_walked",
+    "bytes_read",
+    "bytes_hashed",
+    "files_hashed",
+    "files_failed",
+    "directories_failed",
+    "rows_written",
+    "commits",
+)
+""" The counters of the scan, they are always in the summary """
+
+
+class Histogram:
+    """
+    The histogram of the durations. The buckets are the powers of two of microseconds,
+    so the memory does not depend on the number of the recorded durations.
+    """
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self.buckets: t.Dict[int, int] = dict()
+
+    def add(self, duration: float) -> None:
+        """
+        :param duration: The duration in seconds.
+        """
+        self.count += 1
+        self.total += duration
+        self.min = min(self.min, duration)
+        self.max = max(self.max, duration)
+        bucket = max(0, math.ceil(math.log2(duration * 1_000_000))) if duration > 0 else 0
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def percentile(self, fraction: float) -> float:
+        """
+        :param fraction: The fraction of the durations, for example 0.95
+        :return: The upper bound of the bucket with the percentile in seconds.
+        """
+        rank = fraction * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(2 ** bucket / 1_000_000, self.max)
+        return self.max
+
+    def summary(self) -> t.Dict[str, float]:
+        return {
+            "count": self.count,
+            "total_s": self.total,
+            "mean_s": self.total / self.count if self.count else 0.0,
+            "min_s": self.min if self.count else 0.0,
+            "max_s": self.max,
+            "p50_s": self.percentile(0.5),
+            "p95_s": self.percentile(0.95),
+            "p99_s": self.percentile(0.99),
+        }
+
+
+class ScanStats:
+    """
+    The timers and the counters of one scan. The methods can be called from the hashing threads.
+    """
+
+    def __init__(self, trace: t.Optional[t.Callable[[str, float], None]] = None) -> None:
+        """
+        :param trace: The function called with the name and the duration of each timed operation,
+            for example for the external tracing. It is called in the thread of the operation.
+        """
+        self.trace = trace
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.timings: t.Dict[str, Histogram] = dict()
+        self.stages: t.Dict[str, float] = dict()
+        self.stage: t.Optional[str] = None
+        self.stage_started = 0.0
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+
+    def count(self, **counters: int) -> None:
+        """
+        Adding the values to the counters, for example count(rows_written=1000, commits=1)
+        """
+        with self.lock:
+            for name, value in counters.items():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def record(self, name: str, duration: float, **counters: int) -> None:
+        """
+        Adding the duration of the operation to the histogram and the values to the counters.
+
+        :param name: The name of the operation, for example "hash_read".
+        :param duration: The duration of the operation in seconds.
+        """
+        with self.lock:
+            self.timings.setdefault(name, Histogram()).add(duration)
+            for counter, value in counters.items():
+                self.counters[counter] = self.counters.get(counter, 0) + value
+        if self.trace is not None:
+            self.trace(name, duration)
+
+    @contextlib.contextmanager
+    def timer(self, name: str, **counters: int) -> t.Iterator[None]:
+        """
+        Measuring the duration of the block of the code by the method record().
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started, **counters)
+
+    def start_stage(self, stage: str) -> None:
+        """
+        Ending the previous stage and starting the new stage. The durations of the repeated stages are added.
+
+        :param stage: The name of the stage.
+        """
+        self.end_stage()
+        self.stage = stage
+        self.stage_started = time.monotonic()
+
+    def end_stage(self) -> None:
+        if self.stage is not None:
+            self.stages[self.stage] = self.stages.get(self.stage, 0.0) + time.monotonic() - self.stage_started
+            self.stage = None
+
+    def summary(self) -> t.Dict[str, t.Any]:
+        """
+        The summary of the scan. It can be saved as JSON.
+
+        :return: The duration, the stages, the counters, the histograms and the throughput of the scan.
+        """
+        duration = time.monotonic() - self.started
+        with self.lock:
+            stages = dict(self.stages)
+            if self.stage is not None:
+                stages[self.stage] = stages.get(self.stage, 0.0) + time.monotonic() - self.stage_started
+            counters = dict(self.counters)
+            timings = {name: histogram.summary() for name, histogram in self.timings.items()}
+        return {
+            "duration_s": duration,
+            "stages_s": stages,
+            "counters": counters,
+            "timings": timings,
+            "files_per_second": counters["files_walked"] / duration if duration else 0.0,
+            "mb_per_second": counters["bytes_read"] / duration / 1024 / 1024 if duration else 0.0,
+        }
+
+
+def format_summary(summary: t.Dict[str, t.Any]) -> str:
+    """
+    The summary of the scan as the text for the user.
+
+    :param summary: The summary from the method ScanStats.summary()
+    :return: The lines with the duration, the stages, the counters and the slowest operations.
+    """
+    counters = summary["counters"]
+    lines = [
+        f"Duration {summary['duration_s']:.2f} s, {summary['files_per_second']:.1f} files/s, "
+        f"{summary['mb_per_second']:.1f} MB/s",
+        f"Walked {counters['files_walked']} files in {counters['directories_walked']} directories, "
+        f"hashed {counters['files_hashed']} files, read {counters['bytes_read']} bytes, "
+        f"wrote {counters['rows_written']} rows in {counters['commits']} commits",
+    ]
+    lines.extend(f"Stage {stage}: {duration:.2f} s" for stage, duration in summary["stages_s"].items())
+    lines.extend(
+        f"Operation {name}: {timing['count']} x, total {timing['total_s']:.3f} s, "
+        f"p50 {timing['p50_s'] * 1000:.2f} ms, p95 {timing['p95_s'] * 1000:.2f} ms, max {timing['max_s'] * 1000:.2f} ms"
+        for name, timing in sorted(summary["timings"].items(), key=lambda item: -item[1]["total_s"])
+    )
+    return "\n".join(lines)
+
+
+@contextlib.contextmanager
+def profile(path: t.Optional[str]) -> t.Iterator[None]:
+    """
+    Profiling the block of the code by cProfile. The statistics are saved for pstats or snakeviz.
+    Only the calling thread is profiled, the hashing threads are profiled with one worker.
+
+    :param path: The file for the statistics. The value None means no profiling.
+    """
+    if path is None:
+        yield
+        return
+
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
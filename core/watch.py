@@ -0,0 +1,317 @@
+"""
+The watch mode keeping the database current with the inotify events (only Linux).
+The events are read in the background thread to the bounded queue, the bursts of the events are coalesced
+and the changed files are saved to the database in the batches.
+"""
+import ctypes
+import ctypes.util
+import logging
+import os
+import queue
+import select
+import struct
+import sys
+import threading
+import time
+import typing as t
+
+import config
+from core import sdfcore
+from core.progress import ScanProgress
+
+if t.TYPE_CHECKING:
+    from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# the constants from <sys/inotify.h>
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+""" The events of the watched directories """
+
+EVENT_HEADER = struct.Struct("iIII")
+""" The header of the event: watch descriptor, mask, cookie, length of the name """
+
+
+class InotifyEvent(t.NamedTuple):
+    """
+    The event read from the inotify file descriptor.
+    """
+
+    wd: int
+    """ The watch descriptor of the directory """
+
+    mask: int
+    """ The mask of the event (IN_CREATE, IN_DELETE, ...) """
+
+    name: str
+    """ The name of the file in the directory, it is empty for the events of the directory itself """
+
+
+class Inotify:
+    """
+    The minimal interface to the Linux inotify through ctypes, so no additional library is needed.
+    """
+
+    def __init__(self) -> None:
+        if not sys.platform.startswith("linux"):
+            raise OSError("The watch mode needs Linux inotify.")
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+
+    def add_watch(self, path: str, mask: int = WATCH_MASK) -> int:
+        """
+        Watching the directory.
+
+        :param path: Full path to the directory.
+        :param mask: The watched events.
+        :return: The watch descriptor.
+        :raise OSError: For example the limit fs.inotify.max_user_watches is reached (ENOSPC).
+        """
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), mask | IN_ONLYDIR)
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), path)
+        return wd
+
+    def read_events(self, timeout: float) -> t.List[InotifyEvent]:
+        """
+        Reading the waiting events.
+
+        :param timeout: The maximal waiting time for the first event in seconds.
+        :return: The list of the events, it is empty after the timeout.
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return list()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return list()
+
+        events = list()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, name_length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + name_length].rstrip(b"\0"))
+            offset += name_length
+            events.append(InotifyEvent(wd, mask, name))
+        return events
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class CatalogWatcher:
+    """
+    The watch mode for all root folders from the database. The changed files are hashed by the staged
+    duplicate detection and saved to the database, so the list of the duplicate files is always current.
+    After the overflow of the kernel queue or the application queue the affected subtree is scanned again.
+    The subtrees which could not be watched are tried again and scanned every config.WATCH_RESCAN_INTERVAL seconds.
+    """
+
+    def __init__(
+            self,
+            session: "Session",
+            workers: t.Optional[int] = None,
+            coalesce_delay: t.Optional[float] = None,
+            queue_size: t.Optional[int] = None,
+            on_change: t.Optional[t.Callable[[sdfcore.ScanDelta], None]] = None
+    ) -> None:
+        """
+        :param session: The function create_session() from the file db.py
+        :param workers: The number of the hashing threads. The value None means config.HASH_WORKERS.
+        :param coalesce_delay: The changes are saved after this time without events (seconds).
+            The value None means config.WATCH_COALESCE_DELAY.
+        :param queue_size: The maximal number of the waiting events. The value None means config.WATCH_QUEUE_SIZE.
+        :param on_change: The function called with the changes saved to the database.
+        """
+        self.session = session
+        self.workers = workers
+        self.coalesce_delay = config.WATCH_COALESCE_DELAY if coalesce_delay is None else coalesce_delay
+        self.on_change = on_change
+        # full paths to the root folders (normalized path: saved path)
+        self.root_folders = {
+            os.path.abspath(root_folder.path): root_folder.path
+            for root_folder in session.query(sdfcore.db.RootFolder).all()
+        }
+
+        self.inotify = Inotify()
+        self.watches: t.Dict[int, str] = dict()
+        self.events = queue.Queue(maxsize=config.WATCH_QUEUE_SIZE if queue_size is None else queue_size)
+        self.overflowed_subtrees: t.Set[str] = set()
+        # the directories which could not be watched or listed, they are tried again periodically
+        self.unwatched_subtrees: t.Set[str] = set()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.reader = threading.Thread(target=self.read_events, daemon=True)
+
+        for root_folder in self.root_folders:
+            self.watch_tree(root_folder)
+
+    def watch_tree(self, path: str) -> None:
+        """
+        Watching the directory and all its sub-folders.
+        The directory which can not be watched (for example PermissionError or the limit of the watches ENOSPC)
+        is added with its sub-folders to the unwatched subtrees, the other directories are watched.
+
+        :param path: Full path to the directory.
+        """
+        stack = [path]
+        while stack:
+            directory = stack.pop()
+            try:
+                self.watches[self.inotify.add_watch(directory)] = directory
+                with os.scandir(directory) as entries:
+                    stack.extend(entry.path for entry in entries if entry.is_dir(follow_symlinks=False))
+            except FileNotFoundError:
+                continue
+            except OSError as error:
+                logger.warning("The directory %s is not watched, it is scanned again later: %s", directory, error)
+                self.unwatched_subtrees.add(directory)
+
+    def root_folder_of(self, path: str) -> t.Optional[str]:
+        """
+        :param path: Full path to the file or the directory.
+        :return: The saved path of the root folder containing the path.
+        """
+        for root_folder, saved_path in self.root_folders.items():
+            if path == root_folder or path.startswith(os.path.join(root_folder, "")):
+                return saved_path
+        return None
+
+    def read_events(self) -> None:
+        """
+        Reading the inotify events to the queue in the background thread.
+        The directory with the lost event is scanned again.
+        """
+        while not self.stopped.is_set():
+            for event in self.inotify.read_events(0.5):
+                if event.mask & IN_Q_OVERFLOW:
+                    with self.lock:
+                        self.overflowed_subtrees.update(self.root_folders)
+                    continue
+                directory = self.watches.get(event.wd)
+                if directory is None:
+                    continue
+                if event.mask & IN_IGNORED:
+                    self.watches.pop(event.wd, None)
+                    continue
+                try:
+                    self.events.put_nowait((os.path.join(directory, event.name), event.mask))
+                except queue.Full:
+                    with self.lock:
+                        self.overflowed_subtrees.add(directory)
+
+    def run(self) -> None:
+        """
+        Saving the changes to the database until the method stop() is called.
+        The events are collected until no event comes for the coalesce delay.
+        """
+        self.reader.start()
+        next_rescan = time.monotonic() + config.WATCH_RESCAN_INTERVAL
+        try:
+            while not self.stopped.is_set():
+                events = list()
+                try:
+                    events.append(self.events.get(timeout=0.5))
+                    while True:
+                        events.append(self.events.get(timeout=self.coalesce_delay))
+                except queue.Empty:
+                    pass
+                with self.lock:
+                    subtrees = self.overflowed_subtrees
+                    self.overflowed_subtrees = set()
+                if self.unwatched_subtrees and time.monotonic() >= next_rescan:
+                    next_rescan = time.monotonic() + config.WATCH_RESCAN_INTERVAL
+                    unwatched_subtrees = self.unwatched_subtrees
+                    self.unwatched_subtrees = set()
+                    for subtree in unwatched_subtrees:
+                        # the subtree is added to the unwatched subtrees again if it still can not be watched
+                        self.watch_tree(subtree)
+                    subtrees.update(unwatched_subtrees)
+                if events or subtrees:
+                    self.apply(events, subtrees)
+        finally:
+            self.stopped.set()
+            self.reader.join()
+            self.inotify.close()
+
+    def apply(self, events: t.List[t.Tuple[str, int]], subtrees: t.Set[str]) -> None:
+        """
+        Saving the coalesced events to the database.
+
+        :param events: The full paths and the masks of the events.
+        :param subtrees: The directories which have to be scanned again.
+        """
+        changed_files = set()
+        for path, mask in events:
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    # the files created before the watch of the new directory are found by the scan
+                    self.watch_tree(path)
+                if mask & (IN_CREATE | IN_MOVED_TO | IN_MOVED_FROM | IN_DELETE):
+                    subtrees.add(path)
+            elif not mask & IN_DELETE_SELF:
+                changed_files.add(path)
+
+        # the nested subtrees are scanned with their parent
+        subtrees = {
+            subtree for subtree in subtrees
+            if not any(subtree.startswith(os.path.join(other, "")) for other in subtrees)
+        }
+        # the detection stages run once after all subtrees and files are saved
+        saved = False
+        for subtree in subtrees:
+            if (root_folder := self.root_folder_of(subtree)) is not None and os.path.isdir(root_folder):
+                try:
+                    delta = sdfcore.save_files(
+                        self.session, root_folder, self.workers, ScanProgress(), subtree=subtree, detect=False
+                    )
+                except OSError as error:
+                    # for example the unmounted disk, the saved files are kept
+                    logger.warning("The directory %s is not scanned: %s", subtree, error)
+                    continue
+                saved = True
+                if self.on_change is not None:
+                    self.on_change(delta)
+
+        files_by_root_folder = dict()
+        for path in changed_files:
+            if any(path.startswith(os.path.join(subtree, "")) for subtree in subtrees):
+                continue
+            if (root_folder := self.root_folder_of(path)) is not None:
+                files_by_root_folder.setdefault(root_folder, list()).append(path)
+        for root_folder, paths in files_by_root_folder.items():
+            delta = sdfcore.save_paths(self.session, root_folder, paths)
+            saved = True
+            if self.on_change is not None:
+                self.on_change(delta)
+        if saved:
+            # the same stages as the scan of the root folder
+            sdfcore.detect_duplicates(self.session, self.workers)
+            sdfcore.detect_similar_images(self.session, self.workers)
+            sdfcore.detect_chunks(self.session)
+
+    def stop(self) -> None:
+        """
+        Stopping the watch mode, it can be called from another thread.
+        """
+        self.stopped.set()
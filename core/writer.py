@@ -0,0 +1,181 @@
+"""
+The single database writer. SQLite allows only one writing transaction at a time, so all batches of the scans
+are written by one thread per database. The scan prepares the next batch (walking the directories or hashing
+the files) while the writer commits the previous one, and the readers (the GUI, the CLI) are not blocked
+thanks to the WAL journal mode set in db.py.
+"""
+import queue
+import threading
+import typing as t
+from concurrent.futures import Future
+
+import config
+from core.stats import ScanStats
+
+from sqlalchemy import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Executable
+
+
+class WriteRequest(t.NamedTuple):
+    """
+    One batch waiting for the writer.
+    """
+
+    statement: t.Union[Executable, t.List[Executable]]
+    """ The statement insert(), update() or delete() or the list of the statements written together """
+
+    rows: t.Optional[t.List[t.Dict[str, t.Any]]]
+    """ The values of the columns, None for the statement without the parameters """
+
+    rows_written: int
+    """ The number of the written rows for the statistics """
+
+    stats: ScanStats
+    """ The timers and the counters of the scan """
+
+    future: Future
+    """ The result of the batch, it is set after the commit """
+
+
+class DatabaseWriter:
+    """
+    The thread writing the batches to the database. The waiting batches are written in one transaction,
+    so the number of the commits decreases when the writer is slower than the scan. If the transaction fails,
+    each batch is written again in its own transaction, so only the caller of the failing batch gets the error.
+    The thread stops after config.DB_WRITER_IDLE_TIMEOUT without the batches and it starts again with the next batch.
+    """
+
+    def __init__(self, engine: Engine, queue_size: t.Optional[int] = None) -> None:
+        """
+        :param engine: sqlalchemy.engine.base.Engine
+        :param queue_size: The maximal number of the waiting batches, the scan waits for the writer
+            if the queue is full. The value None means config.DB_WRITER_QUEUE_SIZE.
+        """
+        self.engine = engine
+        self.requests: queue.Queue = queue.Queue(
+            maxsize=config.DB_WRITER_QUEUE_SIZE if queue_size is None else queue_size
+        )
+        self.lock = threading.Lock()
+        self.thread: t.Optional[threading.Thread] = None
+
+    def execute(
+            self,
+            statement: t.Union[Executable, t.List[Executable]],
+            rows: t.Optional[t.List[t.Dict[str, t.Any]]] = None,
+            stats: t.Optional[ScanStats] = None,
+            rows_written: t.Optional[int] = None
+    ) -> Future:
+        """
+        Sending the batch to the writer thread.
+
+        :param statement: The statement insert(), update() or delete() of the model from the file db.py
+            or the list of the statements which are written in the same transaction.
+        :param rows: The values of the columns, the update() statement needs the primary key "id".
+        :param stats: The timers and the counters of the scan.
+        :param rows_written: The number of the written rows for the statement without the parameters.
+            The value None means the number of the rows.
+        :return: The future, its result is the number of the written rows or the exception of the transaction.
+        """
+        future = Future()
+        rows_written = len(rows or ()) if rows_written is None else rows_written
+        self.requests.put(WriteRequest(statement, rows, rows_written, stats or ScanStats(), future))
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+        return future
+
+    def run(self) -> None:
+        """
+        Writing the batches in the writer thread.
+        """
+        while True:
+            try:
+                requests = [self.requests.get(timeout=config.DB_WRITER_IDLE_TIMEOUT)]
+            except queue.Empty:
+                with self.lock:
+                    # the new batch could come after the timeout
+                    if self.requests.empty():
+                        self.thread = None
+                        return
+                continue
+            while True:
+                try:
+                    requests.append(self.requests.get_nowait())
+                except queue.Empty:
+                    break
+            self.write(requests)
+
+    def write(self, requests: t.List[WriteRequest]) -> None:
+        """
+        Writing the batches in one transaction. If it fails, the batches are written one by one.
+
+        :param requests: The batches from the queue.
+        """
+        try:
+            self.write_transaction(requests)
+        except Exception as error:
+            if len(requests) == 1:
+                requests[0].future.set_exception(error)
+            else:
+                for request in requests:
+                    self.write([request])
+                return
+        else:
+            for request in requests:
+                request.future.set_result(request.rows_written)
+        for _ in requests:
+            self.requests.task_done()
+
+    def write_transaction(self, requests: t.List[WriteRequest]) -> None:
+        """
+        :param requests: The batches written in one transaction.
+        :raise Exception: The error of the transaction, no batch is written.
+        """
+        with Session(self.engine) as session, session.begin():
+            for request in requests:
+                statements = request.statement if isinstance(request.statement, list) else [request.statement]
+                with request.stats.timer("db_write", rows_written=request.rows_written):
+                    for statement in statements:
+                        session.execute(statement, request.rows)
+        requests[0].stats.count(commits=1)
+
+    def flush(self) -> None:
+        """
+        Waiting until all batches are written.
+        """
+        self.requests.join()
+
+
+# the writers of the databases (engine: writer)
+writers: t.Dict[Engine, DatabaseWriter] = dict()
+writers_lock = threading.Lock()
+
+
+def get_writer(engine: Engine) -> t.Optional[DatabaseWriter]:
+    """
+    Getting the writer of the database. All sessions of one engine share one writer.
+
+    :param engine: sqlalchemy.engine.base.Engine
+    :return: The writer or None for the in-memory SQLite database, its connections in other threads
+        see another database, so it is written directly by the session.
+    """
+    if engine.dialect.name == "sqlite" and engine.url.database in (None, "", ":memory:"):
+        return None
+    with writers_lock:
+        if engine not in writers:
+            writers[engine] = DatabaseWriter(engine)
+        return writers[engine]
+
+
+def close_writer(engine: Engine) -> None:
+    """
+    Writing the waiting batches and forgetting the writer of the closed engine.
+
+    :param engine: sqlalchemy.engine.base.Engine
+    """
+    with writers_lock:
+        writer = writers.pop(engine, None)
+    if writer is not None:
+        writer.flush()
@@ -1,6 +1,8 @@
 import tkinter as tk
+import typing as t
 
-from core.sdfcore import check_changed_files, db_session, save_changed_files
+from core.sdfcore import check_changed_files, save_changed_files
+from gui.dialog_scan_progress import DialogScanProgress
 
 
 class DialogListChangedFiles(tk.Toplevel):
@@ -15,7 +17,7 @@ class DialogListChangedFiles(tk.Toplevel):
         super().__init__(parent)
         self.title("List changed files")
         self.parent = parent
-        self.list_changed_files = check_changed_files(db_session)
+        self.list_changed_files = list()
 
         # frame buttons
         self.frame_buttons = tk.Frame(self)
@@ -53,11 +55,6 @@ class DialogListChangedFiles(tk.Toplevel):
 
         # listbox for the list changed files
         self.listbox_list_changed_files = tk.Listbox(self.frame_list_changed_files)
-        for file in self.list_changed_files:
-            self.listbox_list_changed_files.insert(
-                tk.END,
-                file
-            )
         self.listbox_list_changed_files.grid(row=0, column=0, sticky=tk.NSEW)
 
         # creating vertical scrollbar
@@ -82,8 +79,53 @@ class DialogListChangedFiles(tk.Toplevel):
             xscrollcommand=self.scrollbar_list_changed_files_horizontal.set
         )
 
+        # the changed files are checked in the background thread after the dialog is shown
+        self.button_add_changed_files["state"] = tk.DISABLED
+        self.after_idle(self.check_changed_files)
+
+    def check_changed_files(self) -> None:
+        """
+        Checking the changed files in the background thread.
+        """
+        dlg = DialogScanProgress(
+            self,
+            "Check changed files",
+            lambda session, progress: check_changed_files(session, progress=progress),
+            self.show_changed_files
+        )
+        dlg.grab_set()
+
+    def show_changed_files(self, list_changed_files: t.List[str]) -> None:
+        """
+        Inserting the changed files to the listbox.
+
+        :param list_changed_files: The list of the changed files from the function check_changed_files()
+        """
+        self.list_changed_files = list_changed_files
+        for file in self.list_changed_files:
+            self.listbox_list_changed_files.insert(
+                tk.END,
+                file
+            )
+        self.button_add_changed_files["state"] = tk.NORMAL
+        self.grab_set()
+
     def add_changed_files(self) -> None:
-        list_changed_file = check_changed_files(db_session)
-        save_changed_files(db_session, list_changed_file)
+        """
+        Saving the changed files in the background thread.
+        """
+        list_changed_files = self.list_changed_files
+        dlg = DialogScanProgress(
+            self,
+            "Add changed files",
+            lambda session, progress: save_changed_files(session, list_changed_files, progress=progress),
+            lambda result: self.add_changed_files_done()
+        )
+        dlg.grab_set()
+
+    def add_changed_files_done(self) -> None:
+        """
+        Updating the list duplicate files after saving the changed files.
+        """
         self.parent.update_list_duplicate_files()
-        self.destroy()
\ No newline at end of file
+        self.destroy()
@@ -5,7 +5,8 @@ import tkinter.font as tkfont
 from tkinter import messagebox
 
 from core import db
-from core.sdfcore import db_session, save_files
+from core.sdfcore import db_session, delete_root_folders, save_files
+from gui.dialog_scan_progress import DialogScanProgress
 
 
 class DialogListRootFolders(tk.Toplevel):
@@ -134,11 +135,8 @@ class DialogListRootFolders(tk.Toplevel):
                         f"Do you want to delete all sub folders and insert your root folder?"
                     )
                     if insert_folder:
-                        origin_folders = db_session.query(db.RootFolder).filter(db.RootFolder.path.like(folder_path+"%")).all()
-                        for of in origin_folders:
-                            origin_folder = db_session.query(db.RootFolder).filter(db.RootFolder.path == of.path).one()
-                            db_session.delete(origin_folder)
-                            db_session.commit()
+                        origin_folders = db_session.query(db.RootFolder.id).filter(db.RootFolder.path.like(folder_path+"%"))
+                        delete_root_folders(db_session, [of.id for of in origin_folders])
 
                         # refresh listbox for list root folders
                         # delete listbox data
@@ -188,9 +186,7 @@ class DialogListRootFolders(tk.Toplevel):
             pk = self.root_folders_pk.get(listbox_index)
 
             # delete item from database
-            item = db_session.query(db.RootFolder).filter(db.RootFolder.id == pk).one()
-            db_session.delete(item)
-            db_session.commit()
+            delete_root_folders(db_session, [pk])
 
             # delete item from listbox
             self.root_folders_pk.pop(listbox_index)
@@ -218,12 +214,37 @@ class DialogListRootFolders(tk.Toplevel):
 
     def restore_list_files(self) -> None:
         """
-        Restoring searched files.
+        Restoring searched files. The files are searched in the background thread.
 
         :return: None
         """
-        list_folders = db_session.query(db.RootFolder).all()
-        for lf in list_folders:
-            save_files(db_session, lf.path)
+        list_folders = [lf.path for lf in db_session.query(db.RootFolder).all()]
+
+        def restore(session, progress):
+            # the missing or unmounted root folder does not stop the scan of the other root folders
+            errors = list()
+            for path in list_folders:
+                try:
+                    save_files(session, path, progress=progress)
+                except OSError as error:
+                    errors.append(str(error))
+            return errors
+
+        dlg = DialogScanProgress(self, "Restore list files", restore, self.restore_list_files_done)
+        dlg.grab_set()
+
+    def restore_list_files_done(self, errors: list) -> None:
+        """
+        Updating the list duplicate files after restoring searched files.
+
+        :param errors: The errors of the root folders which were not scanned.
+        :return: None
+        """
+        if errors:
+            messagebox.showwarning(
+                "Restore list files",
+                "These root folders were not scanned:\n" + "\n".join(errors),
+                parent=self
+            )
         self.parent.update_list_duplicate_files()
         self.destroy()
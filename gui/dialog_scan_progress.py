@@ -0,0 +1,138 @@
+import queue
+import threading
+import tkinter as tk
+from tkinter import messagebox, ttk
+import typing as t
+
+from sqlalchemy.orm import Session
+
+from core.progress import ProgressReport, ScanCancelled, ScanProgress
+from core.sdfcore import catalog, save_scan_run
+
+
+class DialogScanProgress(tk.Toplevel):
+    """
+    The dialog window for the scan running in the background thread.
+    The thread sends the progress through the queue and the dialog reads the queue in the main loop.
+    """
+    def __init__(
+            self,
+            parent,
+            title: str,
+            task: t.Callable[[Session, ScanProgress], t.Any],
+            on_done: t.Callable[[t.Any], None]
+    ) -> None:
+        """
+        Extend class tkinter.Toplevel
+        :param parent:
+        :param title: The title of the dialog.
+        :param task: The scan running in the background thread with its own database session.
+            The summary of the finished scan is saved to the database under the title.
+        :param on_done: The function called in the main loop with the result of the finished scan.
+        """
+        super().__init__(parent)
+        self.title(title)
+        # tkinter can not be called from the background thread
+        self.scan_name = title
+        self.parent = parent
+        self.task = task
+        self.on_done = on_done
+        self.messages = queue.Queue()
+        self.cancel = threading.Event()
+        self.protocol("WM_DELETE_WINDOW", self.cancel_scan)
+
+        # labels for the progress
+        self.label_stage = tk.Label(self, anchor="w", width=80)
+        self.label_stage.pack(fill=tk.X, padx=10, pady=(10, 0))
+
+        self.progressbar = ttk.Progressbar(self, orient=tk.HORIZONTAL, mode="determinate", maximum=1.0)
+        self.progressbar.pack(fill=tk.X, padx=10, pady=5)
+
+        self.label_throughput = tk.Label(self, anchor="w")
+        self.label_throughput.pack(fill=tk.X, padx=10)
+
+        self.label_current_path = tk.Label(self, anchor="w", width=80)
+        self.label_current_path.pack(fill=tk.X, padx=10)
+
+        # buttons
+        self.button_cancel = tk.Button(self)
+        self.button_cancel["text"] = "Cancel"
+        self.button_cancel["padx"] = 10
+        self.button_cancel["pady"] = 10
+        self.button_cancel["command"] = self.cancel_scan
+        self.button_cancel.pack(pady=10)
+
+        self.thread = threading.Thread(target=self.run_task, daemon=True)
+        self.thread.start()
+        self.after(100, self.read_messages)
+
+    def run_task(self) -> None:
+        """
+        Running the scan in the background thread. The results are sent to the queue.
+        """
+        session = catalog.create_session()
+        progress = ScanProgress(lambda report: self.messages.put(("progress", report)), self.cancel)
+        try:
+            result = self.task(session, progress)
+            save_scan_run(session, self.scan_name, progress.stats)
+            self.messages.put(("done", result))
+        except ScanCancelled:
+            session.rollback()
+            self.messages.put(("cancelled", None))
+        except Exception as error:
+            session.rollback()
+            self.messages.put(("error", error))
+        finally:
+            session.close()
+
+    def read_messages(self) -> None:
+        """
+        Reading the messages from the background thread in the main loop.
+        """
+        try:
+            while True:
+                message, value = self.messages.get_nowait()
+                if message == "progress":
+                    self.show_progress(value)
+                elif message == "done":
+                    self.destroy()
+                    self.on_done(value)
+                    return
+                elif message == "cancelled":
+                    self.destroy()
+                    return
+                elif message == "error":
+                    title = self.title()
+                    self.destroy()
+                    messagebox.showerror(title, str(value), parent=self.parent)
+                    return
+        except queue.Empty:
+            pass
+        self.after(100, self.read_messages)
+
+    def show_progress(self, report: ProgressReport) -> None:
+        """
+        Show the report of the progress in the dialog.
+
+        :param report: The snapshot of the progress from the background thread.
+        """
+        if report.files_total:
+            self.label_stage["text"] = f"{report.stage}: {report.files_done} / {report.files_total} files"
+            self.progressbar["value"] = report.files_done / report.files_total
+        else:
+            self.label_stage["text"] = f"{report.stage}: {report.files_done} files"
+            self.progressbar["value"] = 0
+
+        throughput = f"{report.files_per_second:.1f} files/s, {report.mb_per_second:.1f} MB/s"
+        if (eta := report.eta) is not None:
+            throughput += f", ETA {int(eta) // 3600}:{int(eta) % 3600 // 60:02d}:{int(eta) % 60:02d}"
+        self.label_throughput["text"] = throughput
+        self.label_current_path["text"] = report.current_path
+
+    def cancel_scan(self) -> None:
+        """
+        Cancel the scan. The dialog is closed after the background thread stops.
+        """
+        self.cancel.set()
+        self.button_cancel["state"] = tk.DISABLED
+        self.button_cancel["text"] = "Cancelling..."
@@ -1,8 +1,12 @@
 import tkinter as tk
 import tkinter.font as tkfont
 from tkinter import ttk
+import typing as t
+from collections import deque
 
-from core.sdfcore import load_duplicate_files, db_session
+import config
+from core.sdfcore import load_duplicate_page, load_scan_runs, db_session
+from core.stats import format_summary
 from gui.dialog_list_changed_files import DialogListChangedFiles
 from gui.dialog_list_root_folder import DialogListRootFolders
 
@@ -20,6 +24,20 @@ class SearchDuplicityFilesGUI(tk.Tk):
         self.font = tkfont.Font()
         self.width = 700
 
+        # the keys of the pages of the duplicate files (the key of the last group of the previous page),
+        # the first page has the key None
+        self.duplicate_page_keys: t.List[t.Optional[t.Tuple]] = [None]
+        # the number of the last page, None until it is loaded
+        self.duplicate_last_page: t.Optional[int] = None
+        # the pages in the treeview (the number of the page, IDs of the groups), at most config.GUI_LOADED_PAGES
+        self.duplicate_pages: t.Deque[t.Tuple[int, t.List[str]]] = deque()
+        self.duplicate_page_loading = False
+
+        # the files of the groups which are not expanded yet (id of the parent item: files)
+        self.lazy_children: t.Dict[str, t.List] = dict()
+        # the inodes of the first files of the groups which are not expanded yet (id of the parent item: inode)
+        self.lazy_inodes: t.Dict[str, t.Tuple[int, int]] = dict()
+
         # creating buttons frame
         self.frame_buttons = tk.Frame(self)
         self.frame_buttons.pack(side=tk.TOP)
@@ -66,7 +84,7 @@ class SearchDuplicityFilesGUI(tk.Tk):
 
         # creating treeview for duplicity files
         self.treeview_list_duplicity_files = ttk.Treeview(self.frame_treeview, show="tree")
-        self.update_list_duplicate_files()
+        self.treeview_list_duplicity_files.bind("<<TreeviewOpen>>", self.treeview_open)
 
         self.treeview_list_duplicity_files.grid(row=0, column=0, sticky=tk.NSEW)
 
@@ -88,50 +106,160 @@ class SearchDuplicityFilesGUI(tk.Tk):
 
         # adding scrollbars to list duplicity files (treeview)
         self.treeview_list_duplicity_files.configure(
-            yscrollcommand=self.scrollbar_list_duplicity_vertical.set,
+            yscrollcommand=self.treeview_scroll,
             xscrollcommand=self.scrollbar_list_duplicity_horizontal.set
         )
 
+        # create label for the summary of the last scan
+        self.label_last_scan = tk.Label(self, anchor="w", justify=tk.LEFT)
+        self.label_last_scan.pack(fill=tk.X, padx=5, pady=(0, 5))
+
+        self.update_list_duplicate_files()
+
     def dialog_root_folder_show(self) -> None:
         dlg = DialogListRootFolders(self)
         dlg.grab_set()
 
-    def insert_line(self, new_line: str, id: int) -> None:
+    def insert_lines(self, lines: t.List[t.Tuple[str, int]], parent: str = '', index: t.Optional[int] = None) -> None:
         """
-        The function inserts a new line to treeview and it customizes min-width of the treeview
+        The function inserts new lines to treeview and it customizes min-width of the treeview.
+        The width is measured only for the longest line.
 
-        :param new_line: Text of the item
-        :param id: ID of the item
+        :param lines: Text and ID of the items
+        :param parent: ID of the parent item
+        :param index: The position of the first new line, None means the end
         """
-        width = self.font.measure(new_line) + 40
+        if not lines:
+            return
+        width = self.font.measure(max((new_line for new_line, _ in lines), key=len)) + 40
         if width > self.width:
             self.treeview_list_duplicity_files.column("#0", minwidth=width)
             self.width = width
-        self.treeview_list_duplicity_files.insert(
-            '',
-            tk.END,
-            text=new_line,
-            iid=id,
-            open=False
-        )
+        for position, (new_line, id) in enumerate(lines):
+            self.treeview_list_duplicity_files.insert(
+                parent,
+                tk.END if index is None else index + position,
+                text=new_line,
+                iid=id,
+                open=False
+            )
 
     def update_list_duplicate_files(self) -> None:
         """
-        Updating the treeview of the list duplicate files
+        Updating the treeview of the list duplicate files.
+        Only the first page of the duplicate files is loaded, the next pages are loaded during scrolling.
         """
         self.treeview_list_duplicity_files.delete(*self.treeview_list_duplicity_files.get_children())
+        self.lazy_children = dict()
+        self.lazy_inodes = dict()
+        self.duplicate_page_keys = [None]
+        self.duplicate_last_page = None
+        self.duplicate_pages = deque()
+        self.show_duplicate_page(0)
+        self.show_last_scan()
+
+    def show_last_scan(self) -> None:
+        """
+        Show the summary of the last scan from the database.
+        """
+        scan_runs = load_scan_runs(db_session, 1)
+        if scan_runs:
+            scan_run = scan_runs[0]
+            summary = format_summary(scan_run.stats).splitlines()[:2]
+            self.label_last_scan["text"] = "\n".join(
+                [f"Last scan: {scan_run.command} ({scan_run.started:%Y-%m-%d %H:%M} UTC)", *summary]
+            )
+
+    def show_duplicate_page(self, page: int) -> None:
+        """
+        Loading the page of the duplicate files to the treeview. The page after the loaded pages is added
+        to the end and the page before them to the start. The treeview keeps at most config.GUI_LOADED_PAGES pages,
+        the page on the other side is removed and the visible rows stay in their place.
+        Only the first file of the group is inserted, the other files are inserted after expanding the group.
 
-        # list all duplicate files
-        list_duplicates = load_duplicate_files(db_session)
+        :param page: The number of the page.
+        """
+        self.duplicate_page_loading = False
+        treeview = self.treeview_list_duplicity_files
+        groups, next_key = load_duplicate_page(db_session, config.GUI_PAGE_SIZE, self.duplicate_page_keys[page])
+        if page + 1 == len(self.duplicate_page_keys):
+            if next_key is None:
+                self.duplicate_last_page = page
+            else:
+                self.duplicate_page_keys.append(next_key)
+
+        # the group at the top of the visible rows
+        top_item = treeview.identify_row(1)
+        if top_item and treeview.parent(top_item):
+            top_item = treeview.parent(top_item)
+
+        # create parent items
+        at_start = bool(self.duplicate_pages) and page < self.duplicate_pages[0][0]
+        self.insert_lines(
+            [(duplicate_files[0].filename, duplicate_files[0].id) for duplicate_files in groups],
+            index=0 if at_start else None
+        )
+        for duplicate_files in groups:
+            first_file = duplicate_files[0]
+            self.lazy_children[str(first_file.id)] = duplicate_files[1:]
+            if first_file.inode is not None:
+                self.lazy_inodes[str(first_file.id)] = (first_file.device, first_file.inode)
+            # the placeholder shows the button for expanding the group
+            treeview.insert(first_file.id, tk.END, iid=f"{first_file.id}-placeholder")
+        items = [str(duplicate_files[0].id) for duplicate_files in groups]
+        if at_start:
+            self.duplicate_pages.appendleft((page, items))
+        else:
+            self.duplicate_pages.append((page, items))
+
+        while len(self.duplicate_pages) > config.GUI_LOADED_PAGES:
+            _, removed_items = self.duplicate_pages.pop() if at_start else self.duplicate_pages.popleft()
+            treeview.delete(*removed_items)
+            for item in removed_items:
+                self.lazy_children.pop(item, None)
+                self.lazy_inodes.pop(item, None)
+        if top_item and treeview.exists(top_item):
+            children = treeview.get_children()
+            treeview.yview_moveto(treeview.index(top_item) / len(children))
+
+    def treeview_scroll(self, first: str, last: str) -> None:
+        """
+        Update the scrollbar and load the next or the previous page of the duplicate files
+        before the end or the start of the loaded pages is visible.
+
+        :param first: The position of the top of the visible part of the treeview (0.0 - 1.0)
+        :param last: The position of the bottom of the visible part of the treeview (0.0 - 1.0)
+        """
+        self.scrollbar_list_duplicity_vertical.set(first, last)
+        if self.duplicate_page_loading or not self.duplicate_pages:
+            return
+        first_page, last_page = self.duplicate_pages[0][0], self.duplicate_pages[-1][0]
+        if float(last) > 0.9 and last_page != self.duplicate_last_page:
+            page = last_page + 1
+        elif float(first) < 0.1 and first_page > 0:
+            page = first_page - 1
+        else:
+            return
+        self.duplicate_page_loading = True
+        self.after_idle(self.show_duplicate_page, page)
 
-        # create parent item
-        for duplicate_files in list_duplicates:
-            # create parent item
-            first_file = duplicate_files.pop(0)
-            self.insert_line(first_file.filename, first_file.id)
+    def treeview_open(self, event: tk.Event) -> None:
+        """
+        Insert the files of the expanded group to the treeview.
+
+        :param event: The event <<TreeviewOpen>>
+        """
+        parent = self.treeview_list_duplicity_files.focus()
+        if (duplicate_files := self.lazy_children.pop(parent, None)) is not None:
+            self.treeview_list_duplicity_files.delete(f"{parent}-placeholder")
+            # the hardlinks of the already listed file are marked, deleting them does not release the space
+            inodes = {self.lazy_inodes.pop(parent, None)}
+            lines = list()
             for file in duplicate_files:
-                self.insert_line(file.filename, file.id)
-                self.treeview_list_duplicity_files.move(file.id, first_file.id, file.id)
+                inode = (file.device, file.inode) if file.inode is not None else None
+                lines.append((f"{file.filename} (hardlink)" if inode in inodes - {None} else file.filename, file.id))
+                inodes.add(inode)
+            self.insert_lines(lines, parent)
 
     def dialog_changed_files_show(self) -> None:
         """
@@ -0,0 +1,384 @@
+"""
+Command-line interface of the application. It does not need tkinter, so it can run on the headless servers or from cron.
+
+Exit codes:
+    0 - success (the command check found no changed files)
+    1 - the command check found changed files
+    2 - wrong arguments or the error during the command
+    130 - the command was interrupted by Ctrl-C
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import typing as t
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from core import sdfcore
+from core.progress import ScanProgress
+from core.stats import ScanStats, format_summary, profile
+
+EXIT_OK = 0
+EXIT_CHANGED = 1
+EXIT_ERROR = 2
+EXIT_INTERRUPTED = 130
+
+
+def create_parser() -> argparse.ArgumentParser:
+    """
+    Creating the parser of the command-line arguments.
+
+    :return: The parser with the subcommands add-root, scan, check, watch, duplicates, similar, chunks, runs and jobs.
+    """
+    parser = argparse.ArgumentParser(description="Search duplicity files in the data storages.")
+    parser.add_argument("--db", help="Path to the SQLite database or the SQLAlchemy connection string.")
+    parser.add_argument("--progress", action="store_true", help="Print the progress of the scan to stderr.")
+    parser.add_argument("--stats", action="store_true", help="Print the summary of the scan to stderr.")
+    parser.add_argument(
+        "--profile", metavar="FILE", help="Save the cProfile statistics of the command (use --jobs 1 for the hashing)."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parser_add_root = subparsers.add_parser("add-root", help="Add the root folder for searching.")
+    parser_add_root.add_argument("path", help="Path to the root folder.")
+    parser_add_root.add_argument("--name", help="Custom name of the root folder.")
+
+    parser_scan = subparsers.add_parser("scan", help="Scan the root folders and detect the duplicate files.")
+    parser_scan.add_argument("paths", nargs="*", help="Paths to the root folders (all saved root folders by default).")
+    parser_scan.add_argument("--jobs", type=int, help="The number of the hashing threads.")
+    parser_scan.add_argument(
+        "--incremental", action="store_true", help="Do not list the directories with the same modification time."
+    )
+    parser_scan.add_argument(
+        "--restart", action="store_true", help="Start the interrupted scan again instead of resuming it."
+    )
+    parser_scan.add_argument(
+        "--allow-empty", action="store_true",
+        help="Remove the saved files of the empty root folder (it is refused as the unmounted disk by default)."
+    )
+
+    parser_check = subparsers.add_parser("check", help="List the changed files.")
+    parser_check.add_argument("--paranoid", action="store_true", help="Hash all files regardless of the metadata.")
+    parser_check.add_argument("--save", action="store_true", help="Save the changed files to the database.")
+    parser_check.add_argument("--jobs", type=int, help="The number of the hashing threads.")
+
+    parser_watch = subparsers.add_parser("watch", help="Keep the database current with the inotify events (Linux).")
+    parser_watch.add_argument("--jobs", type=int, help="The number of the hashing threads.")
+
+    parser_duplicates = subparsers.add_parser("duplicates", help="Print the groups of the duplicate files.")
+    parser_duplicates.add_argument("--format", choices=["jsonl", "csv"], default="jsonl", help="The output format.")
+    parser_duplicates.add_argument("--min-size", type=int, default=0, help="The minimal size of the file (bytes).")
+    parser_duplicates.add_argument(
+        "--sort", choices=["hash", "wasted"], default="hash", help="Sort the groups by the hash or the wasted bytes."
+    )
+
+    parser_similar = subparsers.add_parser(
+        "similar", help="Print the pairs of the similar images by the perceptual hashes (config.PERCEPTUAL_HASH)."
+    )
+    parser_similar.add_argument(
+        "--distance", type=int, help="The maximal Hamming distance of the hashes (config.PERCEPTUAL_MAX_DISTANCE by default)."
+    )
+
+    parser_chunks = subparsers.add_parser(
+        "chunks", help="Print the bytes reclaimable by the block-level deduplication and the files sharing the chunks."
+    )
+    parser_chunks.add_argument(
+        "--min-ratio", type=float, help="The minimal shared part of the larger file (config.CHUNK_PAIR_MIN_RATIO by default)."
+    )
+
+    parser_runs = subparsers.add_parser("runs", help="Print the summaries of the last scans.")
+    parser_runs.add_argument("--limit", type=int, default=20, help="The maximal number of the scans.")
+
+    parser_jobs = subparsers.add_parser("jobs", help="Print the state of the scans with the pending, done and failed counts.")
+    parser_jobs.add_argument("path", nargs="?", help="Path to the root folder (all root folders by default).")
+    return parser
+
+
+def print_progress(report) -> None:
+    """
+    Print the report of the progress to stderr.
+
+    :param report: ProgressReport from the file core/progress.py
+    """
+    eta = "" if report.eta is None else f", ETA {report.eta:.0f} s"
+    print(
+        f"{report.stage}: {report.files_done}/{report.files_total} files, "
+        f"{report.files_per_second:.1f} files/s, {report.mb_per_second:.1f} MB/s{eta}",
+        file=sys.stderr
+    )
+
+
+def write_duplicates(groups: t.Iterable[t.List], output_format: str, output: t.TextIO) -> None:
+    """
+    Writing the groups of the duplicate files to the output. The groups are written one by one as they are loaded.
+
+    :param groups: The groups from the function iter_duplicate_groups() from the file sdfcore.py
+    :param output_format: jsonl (one group on the line) or csv (one file on the line)
+    :param output: The output stream, for example sys.stdout
+    """
+    writer = csv.writer(output)
+    if output_format == "csv":
+        writer.writerow(["filehash", "filesize", "device", "inode", "filename"])
+    for group in groups:
+        if output_format == "csv":
+            for file in group:
+                writer.writerow([file.filehash, file.filesize, file.device, file.inode, file.filename])
+        else:
+            summary = sdfcore.summarize_duplicate_group(group)
+            output.write(json.dumps({
+                "filehash": summary.filehash,
+                "filesize": summary.filesize,
+                # the bytes released by deleting all copies except one, the hardlinks do not count
+                "wasted": summary.reclaimable,
+                "files": [file.filename for file in group],
+                # the hardlinks of the same copy are in one list
+                "copies": [[file.filename for file in copy] for copy in summary.copies]
+            }) + "\n")
+        output.flush()
+
+
+def write_similar_images(pairs: t.Iterable, output: t.TextIO) -> None:
+    """
+    Writing the pairs of the similar images to the output as JSON Lines.
+
+    :param pairs: The pairs from the function find_similar_images() from the file sdfcore.py
+    :param output: The output stream, for example sys.stdout
+    """
+    for pair in pairs:
+        output.write(json.dumps({
+            "distance": pair.distance,
+            "files": [pair.first.filename, pair.second.filename],
+            "filesizes": [pair.first.filesize, pair.second.filesize]
+        }) + "\n")
+    output.flush()
+
+
+def write_chunks(summary, pairs: t.Iterable, output: t.TextIO) -> None:
+    """
+    Writing the summary of the chunks and the pairs of the files sharing the chunks to the output as JSON Lines.
+    The pairs are written one by one as they are found.
+
+    :param summary: ChunkSummary from the function summarize_chunks() from the file sdfcore.py
+    :param pairs: The pairs from the function iter_chunk_pairs() from the file sdfcore.py
+    :param output: The output stream, for example sys.stdout
+    """
+    output.write(json.dumps(summary._asdict()) + "\n")
+    output.flush()
+    for pair in pairs:
+        output.write(json.dumps({
+            "files": [pair.first.filename, pair.second.filename],
+            "filesizes": [pair.first.filesize, pair.second.filesize],
+            "shared_bytes": pair.shared_bytes,
+            "ratio": round(pair.ratio, 4)
+        }) + "\n")
+        output.flush()
+
+
+def write_scan_runs(scan_runs: t.Iterable, output: t.TextIO) -> None:
+    """
+    Writing the summaries of the scans to the output as JSON Lines.
+
+    :param scan_runs: The scans from the function load_scan_runs() from the file sdfcore.py
+    :param output: The output stream, for example sys.stdout
+    """
+    for scan_run in scan_runs:
+        output.write(json.dumps({
+            "started": scan_run.started.isoformat(),
+            "command": scan_run.command,
+            "root_folder": scan_run.root_folder,
+            "duration": scan_run.duration,
+            "files_walked": scan_run.files_walked,
+            "bytes_read": scan_run.bytes_read,
+            "bytes_hashed": scan_run.bytes_hashed,
+            "rows_written": scan_run.rows_written,
+            "commits": scan_run.commits,
+            "stats": scan_run.stats
+        }) + "\n")
+    output.flush()
+
+
+def write_scan_jobs(scan_jobs: t.Iterable, output: t.TextIO) -> None:
+    """
+    Writing the state of the scan jobs to the output as JSON Lines.
+
+    :param scan_jobs: The jobs from the function load_scan_jobs() from the file sdfcore.py
+    :param output: The output stream, for example sys.stdout
+    """
+    for scan_job in scan_jobs:
+        output.write(json.dumps({
+            "path": scan_job.path,
+            "status": scan_job.status,
+            "stage": scan_job.stage,
+            "pending": scan_job.pending,
+            "done": scan_job.done,
+            "failed": scan_job.failed,
+            "error": scan_job.error,
+            "started": scan_job.started.isoformat(),
+            "updated": scan_job.updated.isoformat()
+        }) + "\n")
+    output.flush()
+
+
+def write_delta(delta, output: t.TextIO) -> None:
+    """
+    Writing the changes found by the scan to the output as JSON Lines.
+
+    :param delta: ScanDelta from the function save_files() from the file sdfcore.py
+    :param output: The output stream, for example sys.stdout
+    """
+    for change, files in delta._asdict().items():
+        for file in files:
+            output.write(json.dumps({"change": change, "filename": file}) + "\n")
+    output.flush()
+
+
+def main(argv: t.Optional[t.List[str]] = None) -> int:
+    """
+    Running the command from the command-line arguments.
+
+    :param argv: The command-line arguments without the name of the program.
+    :return: The exit code.
+    """
+    args = create_parser().parse_args(argv)
+    progress = ScanProgress(print_progress, interval=1.0) if args.progress else ScanProgress()
+
+    session = None
+    try:
+        if args.db:
+            sdfcore.catalog.open(args.db if "://" in args.db else f"sqlite:///{os.path.abspath(args.db)}")
+        # the database is opened and upgraded with the first use of the session
+        session = sdfcore.catalog.session
+        with profile(args.profile):
+            return run_command(args, session, progress)
+    except KeyboardInterrupt:
+        if session is not None:
+            session.rollback()
+        return EXIT_INTERRUPTED
+    except (OSError, SQLAlchemyError, ImportError, ValueError) as error:
+        # for example the missing folder of the database, the missing driver of the database or the wrong URL
+        print_error(error)
+        return EXIT_ERROR
+
+
+def print_error(error: Exception) -> None:
+    """
+    Print the first line of the error to stderr, the exit code is the return value of the function main().
+
+    :param error: The error of the command.
+    """
+    lines = str(error).splitlines() or [type(error).__name__]
+    print(f"Error: {lines[0]}", file=sys.stderr)
+
+
+def finish_scan(
+        args: argparse.Namespace,
+        session,
+        progress: ScanProgress,
+        command: str,
+        root_folder: t.Optional[str] = None
+) -> None:
+    """
+    Saving the summary of the finished scan to the database and printing it with the argument --stats.
+    The next scan gets the new timers and counters.
+
+    :param args: The parsed command-line arguments.
+    :param session: The database session.
+    :param progress: The progress of the finished scan.
+    :param command: The name of the scan.
+    :param root_folder: Full path to the scanned root folder.
+    """
+    summary = sdfcore.save_scan_run(session, command, progress.stats, root_folder)
+    if args.stats:
+        print(format_summary(summary), file=sys.stderr)
+    progress.stats = ScanStats()
+
+
+def run_command(args: argparse.Namespace, session, progress: ScanProgress) -> int:
+    """
+    Running the command from the parsed command-line arguments.
+
+    :param args: The parsed command-line arguments.
+    :param session: The database session.
+    :param progress: The progress of the scan.
+    :return: The exit code.
+    """
+    if args.command == "add-root":
+        path = os.path.abspath(args.path)
+        if not os.path.isdir(path):
+            print(f"The folder {path} does not exist.", file=sys.stderr)
+            return EXIT_ERROR
+        sdfcore.add_root_folder(session, path, args.name)
+
+    elif args.command == "scan":
+        paths = [os.path.abspath(path) for path in args.paths]
+        paths = paths or [root_folder.path for root_folder in session.query(sdfcore.db.RootFolder).all()]
+        # the missing or unmounted root folder does not stop the scan of the other root folders
+        failed = False
+        for path in paths:
+            if not os.path.isdir(path):
+                print(f"The folder {path} does not exist.", file=sys.stderr)
+                failed = True
+                continue
+            try:
+                delta = sdfcore.save_files(
+                    session, path, args.jobs, progress, args.incremental,
+                    resume=not args.restart, allow_empty=args.allow_empty
+                )
+            except OSError as error:
+                print_error(error)
+                failed = True
+                continue
+            write_delta(delta, sys.stdout)
+            finish_scan(args, session, progress, "scan", path)
+        if failed:
+            return EXIT_ERROR
+
+    elif args.command == "check":
+        changed_files = sdfcore.check_changed_files(session, args.paranoid, progress)
+        for file in changed_files:
+            print(file, flush=True)
+        if args.save:
+            sdfcore.save_changed_files(session, changed_files, args.jobs, progress)
+        finish_scan(args, session, progress, "check")
+        if changed_files:
+            return EXIT_CHANGED
+
+    elif args.command == "watch":
+        from core.watch import CatalogWatcher
+        watcher = CatalogWatcher(session, args.jobs, on_change=lambda delta: write_delta(delta, sys.stdout))
+        watcher.run()
+
+    elif args.command == "duplicates":
+        write_duplicates(
+            sdfcore.iter_duplicate_groups(session, order_by_wasted=args.sort == "wasted", min_size=args.min_size),
+            args.format,
+            sys.stdout
+        )
+
+    elif args.command == "similar":
+        try:
+            pairs = sdfcore.find_similar_images(session, args.distance)
+        except ValueError as error:
+            print(error, file=sys.stderr)
+            return EXIT_ERROR
+        write_similar_images(pairs, sys.stdout)
+
+    elif args.command == "chunks":
+        write_chunks(sdfcore.summarize_chunks(session), sdfcore.iter_chunk_pairs(session, args.min_ratio), sys.stdout)
+
+    elif args.command == "runs":
+        write_scan_runs(sdfcore.load_scan_runs(session, args.limit), sys.stdout)
+
+    elif args.command == "jobs":
+        write_scan_jobs(sdfcore.load_scan_jobs(session, args.path and os.path.abspath(args.path)), sys.stdout)
+
+    # the final state of the last stage
+    if progress.stage:
+        progress.report(force=True)
+    return EXIT_OK
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,3 +1,78 @@
 # database constants
 CONNECTION_STRING = "sqlite:///test_duplicates.sqlite"
 DEVELOP_MODE = True
+# the number of the rows written to the database in one transaction
+DB_BATCH_SIZE = 1000
+# the number of the duplicate groups loaded from the database in one query
+DUPLICATE_PAGE_SIZE = 1000
+# the maximal number of the batches waiting for the database writer thread
+DB_WRITER_QUEUE_SIZE = 4
+# the database writer thread stops after this time without the batches (seconds)
+DB_WRITER_IDLE_TIMEOUT = 5.0
+# the scan saves the checkpoint for the resume after this number of the files
+SCAN_CHECKPOINT_FILES = 10000
+
+# SQLite constants
+# the journal mode, WAL lets the readers work during the scan
+SQLITE_JOURNAL_MODE = "WAL"
+# the synchronous mode, NORMAL is safe with WAL and it does not sync each commit
+SQLITE_SYNCHRONOUS = "NORMAL"
+# the size of the page cache of one connection, the negative value is in KiB
+SQLITE_CACHE_SIZE = -65536
+# the size of the database file mapped to the memory (bytes), 0 means no mmap
+SQLITE_MMAP_SIZE = 256 * 1024 * 1024
+# the time of waiting for the lock of the database (milliseconds)
+SQLITE_BUSY_TIMEOUT = 30000
+
+# duplicate detection constants
+# the size of the first and the last block of the file for the partial hash (bytes)
+PARTIAL_HASH_SIZE = 4096
+
+# hashing constants
+# the hash algorithm of the files from core/hashers.py, the expected hashes of the test files are MD5
+HASH_ALGORITHM = "md5"
+# the size of the buffer for reading the file during hashing (bytes)
+HASH_BUFFER_SIZE = 1024 * 1024
+# the files larger than this size are hashed through mmap (bytes), 0 means hashing without mmap
+HASH_MMAP_THRESHOLD = 0
+# the number of the threads hashing files in parallel on one device, 0 means the number of CPUs
+HASH_WORKERS = 0
+# the number of the threads reading files from one rotational disk (HDD), the parallel reads move its heads
+HASH_WORKERS_ROTATIONAL = 1
+
+# perceptual hash constants
+# the perceptual hash of the images (ahash, dhash or phash) for finding the similar images, it needs the package Pillow,
+# None disables the stage
+PERCEPTUAL_HASH = None
+# the maximal Hamming distance of the perceptual hashes (of 64 bits) of the similar images
+PERCEPTUAL_MAX_DISTANCE = 6
+# the extensions of the image files for the perceptual hash
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".bmp", ".tif", ".tiff", ".webp")
+
+# content-defined chunking constants
+# the chunk index for the block-level duplicate analysis (the command chunks), it needs SQLite
+CHUNK_SCAN = False
+# only the files of at least this size are split to the chunks, the smaller files are compared by the hash
+CHUNK_MIN_FILE_SIZE = 64 * 1024
+# the chunk ends this number of bytes after its largest value, the chunks have at least this size
+# and about 1.7 times this size on average
+CHUNK_WINDOW_SIZE = 4 * 1024
+# the maximal size of the chunk in bytes
+CHUNK_MAX_SIZE = 16 * 1024
+# the minimal part of the larger file which is shared with another file in the report of the file pairs
+CHUNK_PAIR_MIN_RATIO = 0.5
+
+# GUI constants
+# the number of the duplicate groups loaded to the main window in one step
+GUI_PAGE_SIZE = 200
+# the maximal number of the pages in the main window, the pages far from the visible rows are removed
+GUI_LOADED_PAGES = 5
+
+# watch mode constants
+# the changes are saved after this time without the inotify events (seconds)
+WATCH_COALESCE_DELAY = 1.0
+# the maximal number of the waiting inotify events, the directory with the lost event is scanned again
+WATCH_QUEUE_SIZE = 100000
+# the directories which could not be watched (unreadable, the limit of the inotify watches) are tried again
+# and scanned after this time (seconds)
+WATCH_RESCAN_INTERVAL = 60.0
@@ -1,6 +1,7 @@
 import os
 import sys
 import pytest
+import sqlalchemy
 
 sys.path.append('../')
 import core.sdfcore as sdf
@@ -40,6 +41,16 @@ def test_load_files_all_files_exists_on_drive():
         assert os.path.exists(file)
 
 
+def test_tree_walker_returns_metadata_of_files():
+    entries = list(sdf.TreeWalker(os.path.abspath(ROOT_FOLDER)))
+    assert len(entries) == 17
+    for entry in entries:
+        file_stat = os.stat(entry.path)
+        assert (entry.size, entry.mtime_ns, entry.inode, entry.device) == (
+            file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino, file_stat.st_dev
+        )
+
+
 # relative paths of the files and their hash
 file_hash = [
     ('pes-seznamka-1.jpg', '0dd0742271cf37bc9b18965fc10dc9e4'),
@@ -58,12 +69,30 @@ def test_get_hash_returns_correct_hash_for_file(file, hash):
     assert sdf.get_hash(file) == hash
 
 
+@pytest.mark.parametrize('mmap_threshold', [0, 1], ids=['readinto', 'mmap'])
+@pytest.mark.parametrize('file,hash', file_hash_for_test, ids=file_ids)
+def test_get_hash_returns_correct_hash_for_small_buffer(monkeypatch, mmap_threshold, file, hash):
+    import config
+    monkeypatch.setattr(config, "HASH_BUFFER_SIZE", 1000)
+    monkeypatch.setattr(config, "HASH_MMAP_THRESHOLD", mmap_threshold)
+    assert sdf.get_hash(file) == hash
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_hash_files_returns_hashes_in_order_of_files(workers):
+    files = [(index, file) for index, (file, _) in enumerate(file_hash_for_test * 5)]
+    hashes = list(sdf.hash_files(files, sdf.get_hash, workers))
+    assert hashes == [(index, file_hash[index % len(file_hash)][1]) for index in range(len(files))]
+
+
 # helped function
 def basic_database_create():
     import config
     database_file = config.CONNECTION_STRING.split('/')[-1]
-    if os.path.isfile(database_file):
-        os.remove(database_file)
+    # the WAL journal of the removed database must not be applied to the new database
+    for file in (database_file, database_file + "-wal", database_file + "-shm"):
+        if os.path.isfile(file):
+            os.remove(file)
     engine = db.load_engine()
     db.create_db_structure(engine)
     session = db.create_session(engine)
@@ -94,6 +123,45 @@ def test_load_duplicate_files_all_files_are_in_output():
             assert file.filename in expected_files
 
 
+def test_load_duplicate_files_loads_all_groups_in_one_query():
+    session = basic_database_create()
+    # the groups loaded by one query for each duplicate hash like the older version
+    expected_groups = [
+        [file.id for file in session.query(db.File).filter(db.File.filehash == filehash).order_by(db.File.id)]
+        for filehash, in session.query(db.File.filehash).filter(db.File.filehash.is_not(None)).group_by(
+            db.File.filehash
+        ).having(sqlalchemy.func.count(sqlalchemy.distinct(db.inode_key())) > 1).order_by(db.File.filehash)
+    ]
+    assert expected_groups
+    session.expunge_all()
+
+    statements = list()
+
+    def record_statement(connection, cursor, statement, *args):
+        statements.append(statement)
+
+    engine = session.get_bind()
+    sqlalchemy.event.listen(engine, "before_cursor_execute", record_statement)
+    try:
+        groups = sdf.load_duplicate_files(session)
+    finally:
+        sqlalchemy.event.remove(engine, "before_cursor_execute", record_statement)
+    assert [[file.id for file in group] for group in groups] == expected_groups
+    assert len([statement for statement in statements if statement.lstrip().upper().startswith("SELECT")]) == 1
+
+
+def test_create_db_structure_adds_missing_indexes():
+    session = basic_database_create()
+    engine = session.get_bind()
+    session.close()
+    with engine.begin() as connection:
+        connection.exec_driver_sql("DROP INDEX ix_file_filehash")
+        connection.exec_driver_sql("DROP INDEX ix_file_root_folder_id")
+    db.create_db_structure(engine)
+    indexes = {index["name"] for index in sqlalchemy.inspect(engine).get_indexes("file")}
+    assert {"ix_file_filehash", "ix_file_root_folder_id", "ix_file_directory_id_name"} <= indexes
+
+
 # data for test of the function file_exists()
 names_of_files = [
     "African_Elephant_(188286877).jpeg",
@@ -137,3 +205,845 @@ def test_check_changed_files_detect_changed_file_during_test(file):
         fo.write(origin_file)
 
     assert changed_files == [file]
+
+
+def test_detect_duplicates_files_with_unique_size_are_not_hashed():
+    session = basic_database_create()
+    for file in session.query(db.File).all():
+        same_size = session.query(db.File).filter(db.File.filesize == file.filesize).count()
+        if same_size == 1:
+            assert file.hash_stage == db.HASH_STAGE_SIZE
+            assert file.partial_hash is None and file.filehash is None
+
+
+def test_detect_duplicates_duplicate_files_have_full_hash():
+    for set_files in sdf.load_duplicate_files(basic_database_create()):
+        for file in set_files:
+            assert file.hash_stage == db.HASH_STAGE_FULL
+            assert file.filehash == sdf.get_hash(file.filename)
+
+
+def test_check_changed_files_ignores_touched_file_with_same_content():
+    session = basic_database_create()
+    file = ROOT_FOLDER + "pes-duplicity.jpg"
+    file_stat = os.stat(file)
+    os.utime(file, ns=(file_stat.st_atime_ns, file_stat.st_mtime_ns + 10 ** 9))
+    try:
+        assert sdf.check_changed_files(session) == []
+        saved_file = session.query(db.File).filter(db.File.filename == file).one()
+        assert saved_file.mtime_ns == file_stat.st_mtime_ns + 10 ** 9
+    finally:
+        os.utime(file, ns=(file_stat.st_atime_ns, file_stat.st_mtime_ns))
+
+
+def test_check_changed_files_paranoid_detects_change_with_same_metadata():
+    session = basic_database_create()
+    file = ROOT_FOLDER + "pes-duplicity.jpg"
+    file_stat = os.stat(file)
+    with open(file, "rb") as f:
+        origin_file = f.read()
+    with open(file, "r+b") as f:
+        f.write(bytes([origin_file[0] ^ 0xff]))
+    os.utime(file, ns=(file_stat.st_atime_ns, file_stat.st_mtime_ns))
+    try:
+        assert sdf.check_changed_files(session) == []
+        assert sdf.check_changed_files(session, paranoid=True) == [file]
+    finally:
+        with open(file, "wb") as f:
+            f.write(origin_file)
+        os.utime(file, ns=(file_stat.st_atime_ns, file_stat.st_mtime_ns))
+
+
+def test_check_changed_files_detects_in_place_edit_of_unique_size_file(tmp_path):
+    session = basic_database_create()
+    file = tmp_path / "unique-size.txt"
+    file.write_text("original content of the unique size")
+    sdf.save_files(session, str(tmp_path))
+    saved_file = session.query(db.File).filter(sdf.path_condition(str(file))).one()
+    assert saved_file.filehash is None and saved_file.partial_hash is None
+
+    file_stat = os.stat(file)
+    file.write_text("modified content of the unique size")
+    os.utime(file, ns=(file_stat.st_atime_ns, file_stat.st_mtime_ns + 10 ** 9))
+    assert sdf.check_changed_files(session) == [str(file)]
+    assert sdf.check_changed_files(session, paranoid=True) == [str(file)]
+
+
+def test_check_changed_files_paranoid_hashes_file_without_hash(tmp_path):
+    session = basic_database_create()
+    file = tmp_path / "unique-size.txt"
+    file.write_text("content of the unique size")
+    sdf.save_files(session, str(tmp_path))
+
+    assert sdf.check_changed_files(session, paranoid=True) == []
+    saved_file = session.query(db.File).filter(sdf.path_condition(str(file))).one()
+    assert saved_file.filehash == sdf.get_hash(str(file))
+    assert saved_file.hash_stage == db.HASH_STAGE_FULL
+
+    # the same metadata, but the content differs from the saved hash
+    file_stat = os.stat(file)
+    file.write_text("CONTENT of the unique size")
+    os.utime(file, ns=(file_stat.st_atime_ns, file_stat.st_mtime_ns))
+    assert sdf.check_changed_files(session) == []
+    assert sdf.check_changed_files(session, paranoid=True) == [str(file)]
+
+
+def test_check_changed_files_paranoid_hashes_file_with_partial_hash(tmp_path, monkeypatch):
+    monkeypatch.setattr("config.PARTIAL_HASH_SIZE", 4)
+    session = basic_database_create()
+    file = tmp_path / "a.txt"
+    file.write_text("a: the middle of the file :a")
+    (tmp_path / "b.txt").write_text("b: the middle of the file :b")
+    sdf.save_files(session, str(tmp_path))
+    saved_file = session.query(db.File).filter(sdf.path_condition(str(file))).one()
+    assert saved_file.hash_stage == db.HASH_STAGE_PARTIAL
+
+    assert sdf.check_changed_files(session, paranoid=True) == []
+    session.refresh(saved_file)
+    assert saved_file.filehash == sdf.get_hash(str(file))
+
+    # the change after the first block keeps the partial hash and the metadata
+    file_stat = os.stat(file)
+    file.write_text("a: THE MIDDLE OF THE FILE :a")
+    os.utime(file, ns=(file_stat.st_atime_ns, file_stat.st_mtime_ns))
+    assert sdf.check_changed_files(session, paranoid=True) == [str(file)]
+
+
+def test_save_files_second_scan_does_not_add_rows():
+    session = basic_database_create()
+    sdf.save_files(session, ROOT_FOLDER)
+    assert session.query(db.File).count() == 17
+
+
+@pytest.mark.parametrize('batch_size', [1, 5, 1000])
+def test_execute_in_batches_writes_all_rows(monkeypatch, batch_size):
+    import config
+    monkeypatch.setattr(config, "DB_BATCH_SIZE", batch_size)
+    session = basic_database_create()
+    rows = [{"id": file.id, "hash_stage": db.HASH_STAGE_FULL} for file in session.query(db.File.id)]
+    assert sdf.execute_in_batches(session, sqlalchemy.update(db.File), rows) == 17
+    assert session.query(db.File).filter(db.File.hash_stage != db.HASH_STAGE_FULL).count() == 0
+
+
+@pytest.mark.parametrize('page_size', [1, 3, 1000])
+def test_iter_duplicate_groups_returns_same_groups_as_load_duplicate_files(page_size):
+    session = basic_database_create()
+    expected_groups = [[file.filename for file in files] for files in sdf.load_duplicate_files(session)]
+    groups = [[file.filename for file in files] for files in sdf.iter_duplicate_groups(session, page_size)]
+    assert groups == expected_groups
+
+
+def test_iter_duplicate_groups_order_by_wasted_bytes():
+    session = basic_database_create()
+    groups = list(sdf.iter_duplicate_groups(session, 1, order_by_wasted=True))
+    wasted = [(len(files) - 1) * files[0].filesize for files in groups]
+    assert len(groups) == 4
+    assert wasted == sorted(wasted, reverse=True)
+
+
+def test_duplicate_groups_by_wasted_bytes_follow_detection_and_deleting(tmp_path):
+    session = basic_database_create()
+    (tmp_path / "copy-1.bin").write_bytes(b"x" * 5000)
+    (tmp_path / "copy-2.bin").write_bytes(b"x" * 5000)
+    (tmp_path / "copy-3.bin").write_bytes(b"x" * 5000)
+    sdf.save_files(session, str(tmp_path))
+
+    def tmp_groups():
+        return [
+            sorted(os.path.basename(file.filename) for file in group)
+            for group in sdf.iter_duplicate_groups(session, 2, order_by_wasted=True)
+            if group[0].filename.startswith(str(tmp_path))
+        ]
+
+    assert tmp_groups() == [["copy-1.bin", "copy-2.bin", "copy-3.bin"]]
+    assert session.query(db.DuplicateGroup.wasted).filter(db.DuplicateGroup.filesize == 5000).scalar() == 2 * 5000
+
+    # the catalog of the older version gets the groups at the start
+    saved_groups = sorted(session.query(db.DuplicateGroup.filehash, db.DuplicateGroup.wasted).all())
+    engine = session.get_bind()
+    session.close()
+    with engine.begin() as connection:
+        connection.exec_driver_sql("DROP TABLE duplicate_group")
+    db.create_db_structure(engine)
+    assert sorted(session.query(db.DuplicateGroup.filehash, db.DuplicateGroup.wasted).all()) == saved_groups
+
+    root_folder_id = session.query(db.RootFolder.id).filter(db.RootFolder.path == str(tmp_path)).scalar()
+    sdf.delete_root_folders(session, [root_folder_id])
+    assert tmp_groups() == []
+    assert session.query(db.DuplicateGroup).filter(db.DuplicateGroup.filesize == 5000).count() == 0
+
+
+def test_save_files_reports_progress_of_all_stages():
+    from core.progress import ScanProgress
+    session = basic_database_create()
+    session.query(db.File).delete()
+    session.commit()
+    reports = list()
+    sdf.save_files(session, ROOT_FOLDER, progress=ScanProgress(reports.append, interval=0))
+    stages = [report.stage for report in reports]
+    assert stages[0] == "Reading metadata" and "Full hash" in stages
+    assert reports[-1].files_done == reports[-1].files_total
+
+
+def test_save_files_cancelled_scan_keeps_database_consistent():
+    import threading
+    from core.progress import ScanCancelled, ScanProgress
+    session = basic_database_create()
+    session.query(db.File).delete()
+    session.commit()
+    cancel = threading.Event()
+    cancel.set()
+    with pytest.raises(ScanCancelled):
+        sdf.save_files(session, ROOT_FOLDER, progress=ScanProgress(cancel=cancel))
+    assert session.query(db.File).count() == 0
+    sdf.save_files(session, ROOT_FOLDER)
+    assert len(sdf.load_duplicate_files(session)) == 4
+
+
+def test_import_sdfcore_does_not_open_database(tmp_path):
+    import subprocess
+    script = (
+        "import sys; import core.sdfcore as sdf; sdf.get_hash(sys.argv[1]); "
+        "assert 'sqlalchemy.orm' not in sys.modules"
+    )
+    environment = dict(os.environ, PYTHONPATH=os.path.abspath('../'))
+    subprocess.run([sys.executable, "-c", script, ROOT_FOLDER + "pes-seznamka-1.jpg"], cwd=tmp_path, env=environment, check=True)
+    assert os.listdir(tmp_path) == []
+
+
+def run_cli(tmp_path, *arguments):
+    import subprocess
+    environment = dict(os.environ, PYTHONPATH=os.path.abspath('../'))
+    return subprocess.run(
+        [sys.executable, os.path.abspath('../search_duplicity_files_cli.py'), "--db", str(tmp_path / "catalog.sqlite"),
+         *arguments],
+        cwd=tmp_path, env=environment, capture_output=True, text=True
+    )
+
+
+def test_cli_exit_codes_and_output_of_duplicates(tmp_path):
+    import csv
+    import json
+    (tmp_path / "files").mkdir()
+    (tmp_path / "files" / "a.txt").write_text("same content")
+    (tmp_path / "files" / "b.txt").write_text("same content")
+    (tmp_path / "files" / "c.txt").write_text("other")
+    assert run_cli(tmp_path, "add-root", str(tmp_path / "files")).returncode == 0
+    assert run_cli(tmp_path, "scan").returncode == 0
+    assert run_cli(tmp_path, "check").returncode == 0
+
+    result = run_cli(tmp_path, "duplicates", "--format", "jsonl")
+    assert result.returncode == 0
+    groups = [json.loads(line) for line in result.stdout.splitlines()]
+    assert len(groups) == 1
+    assert sorted(groups[0]["files"]) == [str(tmp_path / "files" / "a.txt"), str(tmp_path / "files" / "b.txt")]
+    assert groups[0]["wasted"] == len("same content")
+    assert "reclaimable" not in groups[0]
+
+    result = run_cli(tmp_path, "duplicates", "--format", "csv")
+    assert result.returncode == 0
+    rows = list(csv.DictReader(result.stdout.splitlines()))
+    assert sorted(row["filename"] for row in rows) == sorted(groups[0]["files"])
+    assert {row["filehash"] for row in rows} == {groups[0]["filehash"]}
+
+    (tmp_path / "files" / "c.txt").write_text("changed")
+    result = run_cli(tmp_path, "check")
+    assert result.returncode == 1
+    assert result.stdout.splitlines() == [str(tmp_path / "files" / "c.txt")]
+
+
+def test_cli_scan_continues_after_failed_root_folder(tmp_path):
+    import json
+    for folder in ("missing", "unmounted", "files"):
+        (tmp_path / folder).mkdir()
+        assert run_cli(tmp_path, "add-root", str(tmp_path / folder)).returncode == 0
+    (tmp_path / "unmounted" / "x.txt").write_text("x")
+    assert run_cli(tmp_path, "scan", str(tmp_path / "unmounted")).returncode == 0
+    (tmp_path / "unmounted" / "x.txt").unlink()
+    (tmp_path / "missing").rmdir()
+    (tmp_path / "files" / "a.txt").write_text("same content")
+    (tmp_path / "files" / "b.txt").write_text("same content")
+
+    result = run_cli(tmp_path, "scan")
+    assert result.returncode == 2
+    assert len(result.stderr.splitlines()) == 2
+    added = {json.loads(line)["filename"] for line in result.stdout.splitlines()}
+    assert added == {str(tmp_path / "files" / "a.txt"), str(tmp_path / "files" / "b.txt")}
+
+
+@pytest.mark.parametrize('database', ["nonexistent/dir/x.sqlite", "postgresql://localhost/x", "unknown://x"])
+def test_cli_errors_of_database_exit_with_code_2(tmp_path, database):
+    result = run_cli(tmp_path, "--db", database, "check")
+    assert result.returncode == 2
+    assert len(result.stderr.splitlines()) == 1
+
+
+def test_save_files_incremental_scan_returns_delta(tmp_path):
+    session = basic_database_create()
+    (tmp_path / "a").mkdir()
+    (tmp_path / "b").mkdir()
+    (tmp_path / "a" / "x.txt").write_text("x")
+    (tmp_path / "b" / "y.txt").write_text("y")
+    delta = sdf.save_files(session, str(tmp_path), incremental=True)
+    assert sorted(delta.added) == [str(tmp_path / "a" / "x.txt"), str(tmp_path / "b" / "y.txt")]
+    assert sdf.save_files(session, str(tmp_path), incremental=True) == sdf.ScanDelta([], [], [])
+
+    (tmp_path / "a" / "z.txt").write_text("z")
+    (tmp_path / "b" / "y.txt").unlink()
+    delta = sdf.save_files(session, str(tmp_path), incremental=True)
+    assert delta == sdf.ScanDelta([str(tmp_path / "a" / "z.txt")], [str(tmp_path / "b" / "y.txt")], [])
+
+
+def test_save_files_keeps_files_of_unmounted_root_folder(tmp_path):
+    session = basic_database_create()
+    (tmp_path / "a").mkdir()
+    (tmp_path / "a" / "x.txt").write_text("x")
+    sdf.save_files(session, str(tmp_path))
+    root_folder = session.query(db.RootFolder).filter(db.RootFolder.path == str(tmp_path)).one()
+    assert root_folder.device == os.stat(tmp_path).st_dev
+
+    def saved_files():
+        return session.query(db.File).filter(db.File.root_folder_id == root_folder.id).count()
+
+    # the empty mount point of the unmounted disk
+    (tmp_path / "a" / "x.txt").unlink()
+    (tmp_path / "a").rmdir()
+    with pytest.raises(OSError, match="not mounted"):
+        sdf.save_files(session, str(tmp_path))
+    assert saved_files() == 1
+
+    # the root folder which was really emptied
+    sdf.save_files(session, str(tmp_path), allow_empty=True)
+    assert saved_files() == 0
+    (tmp_path / "a.txt").write_text("a")
+    sdf.save_files(session, str(tmp_path))
+
+    # the mount point on another device than the disk
+    root_folder.device += 1
+    session.commit()
+    with pytest.raises(OSError, match="another device"):
+        sdf.save_files(session, str(tmp_path))
+    assert saved_files() == 1
+
+
+def test_save_files_incremental_scan_skips_unchanged_directories(tmp_path):
+    session = basic_database_create()
+    (tmp_path / "a").mkdir()
+    (tmp_path / "a" / "x.txt").write_text("x")
+    sdf.save_files(session, str(tmp_path), incremental=True)
+
+    # the modification of the existing file does not change the modification time of the directory
+    with open(tmp_path / "a" / "x.txt", "a") as f:
+        f.write("changed")
+    assert sdf.save_files(session, str(tmp_path), incremental=True).modified == []
+    assert sdf.save_files(session, str(tmp_path)).modified == [str(tmp_path / "a" / "x.txt")]
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="The watch mode needs Linux inotify.")
+def test_catalog_watcher_saves_new_and_removed_files(tmp_path):
+    import threading
+    import time
+    from core.watch import CatalogWatcher
+    session = basic_database_create()
+    (tmp_path / "a").mkdir()
+    (tmp_path / "a" / "x.txt").write_text("x")
+    sdf.save_files(session, str(tmp_path))
+
+    deltas = list()
+    watcher = CatalogWatcher(session, coalesce_delay=0.1, on_change=deltas.append)
+    thread = threading.Thread(target=watcher.run)
+    thread.start()
+    try:
+        (tmp_path / "a" / "y.txt").write_text("y")
+        (tmp_path / "a" / "x.txt").unlink()
+        (tmp_path / "b").mkdir()
+        (tmp_path / "b" / "z.txt").write_text("z")
+        names = {str(tmp_path / "a" / "y.txt"), str(tmp_path / "b" / "z.txt")}
+        # the session of the watcher can not be used in this thread
+        reader = db.create_session(session.get_bind())
+        for _ in range(50):
+            saved = {file.filename for file in reader.query(db.File).filter(db.File.filename.startswith(str(tmp_path)))}
+            if saved == names:
+                break
+            time.sleep(0.1)
+    finally:
+        watcher.stop()
+        thread.join()
+    assert saved == names
+    assert any(str(tmp_path / "a" / "x.txt") in delta.removed for delta in deltas)
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="The watch mode needs Linux inotify.")
+def test_catalog_watcher_rescans_directory_which_could_not_be_watched(tmp_path, monkeypatch):
+    import errno
+    import threading
+    import time
+    from core import watch
+    session = basic_database_create()
+    (tmp_path / "a").mkdir()
+    (tmp_path / "b" / "c").mkdir(parents=True)
+    sdf.save_files(session, str(tmp_path))
+
+    add_watch = watch.Inotify.add_watch
+
+    def add_watch_without_space(inotify, path, *args):
+        if path == str(tmp_path / "b"):
+            raise OSError(errno.ENOSPC, os.strerror(errno.ENOSPC), path)
+        return add_watch(inotify, path, *args)
+
+    monkeypatch.setattr(watch.Inotify, "add_watch", add_watch_without_space)
+    monkeypatch.setattr("config.WATCH_RESCAN_INTERVAL", 0.1)
+    watcher = watch.CatalogWatcher(session, coalesce_delay=0.1)
+    assert watcher.unwatched_subtrees == {str(tmp_path / "b")}
+    assert str(tmp_path / "a") in watcher.watches.values()
+
+    # the file changed in the watched directory runs the same stages as the scan
+    stages = list()
+    for stage in ("detect_duplicates", "detect_similar_images", "detect_chunks"):
+        monkeypatch.setattr(sdf, stage, lambda *args, stage=stage: stages.append(stage))
+    (tmp_path / "a" / "x.txt").write_text("x")
+    watcher.apply([(str(tmp_path / "a" / "x.txt"), watch.IN_CLOSE_WRITE)], set())
+    assert stages == ["detect_duplicates", "detect_similar_images", "detect_chunks"]
+    # the stages run once after the scans of all subtrees and the changed files
+    stages.clear()
+    (tmp_path / "z.txt").write_text("z")
+    watcher.apply([(str(tmp_path / "z.txt"), watch.IN_CLOSE_WRITE)], {str(tmp_path / "a"), str(tmp_path / "b")})
+    assert stages == ["detect_duplicates", "detect_similar_images", "detect_chunks"]
+
+    # the file in the unwatched directory is found by the periodic scan
+    (tmp_path / "b" / "c" / "y.txt").write_text("y")
+    monkeypatch.setattr(watch.Inotify, "add_watch", add_watch)
+    thread = threading.Thread(target=watcher.run)
+    thread.start()
+    try:
+        reader = db.create_session(session.get_bind())
+        for _ in range(50):
+            if reader.query(db.File).filter(db.File.filename == str(tmp_path / "b" / "c" / "y.txt")).count():
+                break
+            time.sleep(0.1)
+    finally:
+        watcher.stop()
+        thread.join()
+    assert reader.query(db.File).filter(db.File.filename == str(tmp_path / "b" / "c" / "y.txt")).count() == 1
+    assert watcher.unwatched_subtrees == set()
+    assert str(tmp_path / "b" / "c") in watcher.watches.values()
+
+
+def test_detect_duplicates_hardlinks_are_not_duplicates(tmp_path):
+    session = basic_database_create()
+    (tmp_path / "a.txt").write_text("same content")
+    os.link(tmp_path / "a.txt", tmp_path / "b.txt")
+    sdf.save_files(session, str(tmp_path))
+    files = session.query(db.File).filter(db.File.filename.startswith(str(tmp_path))).all()
+    # the single inode is not hashed, it cannot have a duplicate
+    assert [file.filehash for file in files] == [None, None]
+    assert all(str(tmp_path) not in file.filename for group in sdf.iter_duplicate_groups(session) for file in group)
+
+    (tmp_path / "c.txt").write_text("same content")
+    sdf.save_files(session, str(tmp_path))
+    group = next(
+        group for group in sdf.iter_duplicate_groups(session) if group[0].filename.startswith(str(tmp_path))
+    )
+    summary = sdf.summarize_duplicate_group(group)
+    assert len(group) == 3
+    assert sorted(len(copy) for copy in summary.copies) == [1, 2]
+    assert summary.reclaimable == len("same content")
+
+
+def test_save_scan_run_saves_counters_of_scan():
+    from core.progress import ScanProgress
+    session = basic_database_create()
+    progress = ScanProgress()
+    sdf.save_files(session, ROOT_FOLDER, progress=progress)
+    summary = sdf.save_scan_run(session, "scan", progress.stats, ROOT_FOLDER)
+    assert summary["counters"]["files_walked"] == 17
+    assert summary["counters"]["commits"] > 0
+    assert summary["timings"]["walk"]["count"] == summary["counters"]["directories_walked"]
+    assert set(summary["stages_s"]) == {"Reading metadata", "Partial hash", "Full hash"}
+
+    scan_run = sdf.load_scan_runs(session, 1)[0]
+    assert (scan_run.command, scan_run.root_folder, scan_run.files_walked) == ("scan", ROOT_FOLDER, 17)
+    assert scan_run.stats == summary
+
+
+def test_sqlite_connection_uses_wal_and_reads_during_write():
+    session = basic_database_create()
+    assert session.execute(sqlalchemy.text("PRAGMA journal_mode")).scalar() == "wal"
+
+    # the writer holds the open transaction, the reader in another session still sees the committed rows
+    engine = session.get_bind()
+    with engine.connect() as writer:
+        writer.execute(sqlalchemy.update(db.File).values(filehash=None))
+        reader = db.create_session(engine)
+        assert reader.query(db.File).filter(db.File.filehash.is_not(None)).count() > 0
+        reader.close()
+        writer.rollback()
+
+
+def test_execute_in_batches_writes_through_single_writer(monkeypatch):
+    import threading
+    from core import writer
+    monkeypatch.setattr("config.DB_BATCH_SIZE", 5)
+    session = basic_database_create()
+    threads = set()
+    original_write = writer.DatabaseWriter.write
+
+    def write(self, requests):
+        threads.add(threading.get_ident())
+        original_write(self, requests)
+
+    monkeypatch.setattr(writer.DatabaseWriter, "write", write)
+    rows = [{"id": file.id, "filehash": "00" * 16} for file in session.query(db.File).all()]
+    assert sdf.execute_in_batches(session, sqlalchemy.update(db.File), rows) == 17
+    assert threads and threading.get_ident() not in threads
+    assert {file.filehash for file in session.query(db.File).all()} == {"00" * 16}
+
+
+def test_database_writer_error_of_batch_reaches_only_its_caller():
+    from concurrent.futures import Future
+    from core import writer
+    from core.stats import ScanStats
+    session = basic_database_create()
+    database_writer = writer.DatabaseWriter(session.get_bind())
+    session.close()
+
+    # the batches waiting in the queue are written in one transaction
+    requests = [
+        writer.WriteRequest(sqlalchemy.insert(db.RootFolder), [{"name": "valid", "path": "/valid"}], 1, ScanStats(), Future()),
+        writer.WriteRequest(sqlalchemy.insert(db.RootFolder), [{"name": None, "path": "/failed"}], 1, ScanStats(), Future()),
+    ]
+    for request in requests:
+        database_writer.requests.put(request)
+    last_future = database_writer.execute(sqlalchemy.insert(db.RootFolder), [{"name": "last", "path": "/last"}])
+    database_writer.flush()
+
+    assert requests[0].future.result() == 1
+    with pytest.raises(sqlalchemy.exc.IntegrityError):
+        requests[1].future.result()
+    assert last_future.result() == 1
+    paths = {folder.path for folder in session.query(db.RootFolder)}
+    assert {"/valid", "/last"} <= paths and "/failed" not in paths
+
+
+def test_create_db_structure_upgrades_full_paths_to_directories(tmp_path):
+    import sqlite3
+    path = str(tmp_path / "legacy.sqlite")
+    connection = sqlite3.connect(path)
+    connection.executescript("""
+        CREATE TABLE root_folder (id INTEGER NOT NULL PRIMARY KEY, name VARCHAR(50) NOT NULL, path VARCHAR(1000) NOT NULL);
+        CREATE TABLE file (
+            id INTEGER NOT NULL PRIMARY KEY, filehash VARCHAR(255), filename VARCHAR(1000) NOT NULL,
+            root_folder_id INTEGER REFERENCES root_folder (id) ON DELETE CASCADE
+        );
+        INSERT INTO root_folder VALUES (1, 'photos', '/photos');
+        INSERT INTO file VALUES (1, '0123456789abcdef0123456789abcdef', '/photos/2020/a.jpg', 1);
+        INSERT INTO file VALUES (2, '0123456789abcdef0123456789abcdef', '/photos/2020/b.jpg', 1);
+        INSERT INTO file VALUES (3, NULL, '/photos/c.jpg', 1);
+    """)
+    connection.commit()
+    connection.close()
+
+    engine = sqlalchemy.create_engine(f"sqlite:///{path}")
+    db.create_db_structure(engine)
+    session = db.create_session(engine)
+    files = session.query(db.File).order_by(db.File.id).all()
+    assert [file.filename for file in files] == ["/photos/2020/a.jpg", "/photos/2020/b.jpg", "/photos/c.jpg"]
+    assert files[0].directory_id == files[1].directory_id != files[2].directory_id
+    assert files[0].filehash == "0123456789abcdef0123456789abcdef"
+    assert session.execute(sqlalchemy.text("SELECT typeof(filehash) FROM file WHERE id = 1")).scalar() == "blob"
+    assert [group[0].name for group in sdf.load_duplicate_files(session)] == ["a.jpg"]
+    session.close()
+    engine.dispose()
+
+
+def test_save_files_rescan_of_upgraded_catalog_keeps_md5_hashes(tmp_path):
+    import hashlib
+    import sqlite3
+    from core.progress import ScanProgress
+    (tmp_path / "files").mkdir()
+    contents = {"a.txt": b"same content", "b.txt": b"same content", "c.txt": b"other content"}
+    for name, content in contents.items():
+        (tmp_path / "files" / name).write_bytes(content)
+    # the catalog of the older version saved only the full path and the MD5 hash of each file
+    path = str(tmp_path / "legacy.sqlite")
+    connection = sqlite3.connect(path)
+    connection.executescript("""
+        CREATE TABLE root_folder (id INTEGER NOT NULL PRIMARY KEY, name VARCHAR(50) NOT NULL, path VARCHAR(1000) NOT NULL);
+        CREATE TABLE file (
+            id INTEGER NOT NULL PRIMARY KEY, filehash VARCHAR(255), filename VARCHAR(1000) NOT NULL,
+            root_folder_id INTEGER REFERENCES root_folder (id) ON DELETE CASCADE
+        );
+    """)
+    connection.execute("INSERT INTO root_folder VALUES (1, 'files', ?)", (str(tmp_path / "files"),))
+    connection.executemany("INSERT INTO file (filehash, filename, root_folder_id) VALUES (?, ?, 1)", [
+        (hashlib.md5(content).hexdigest(), str(tmp_path / "files" / name)) for name, content in contents.items()
+    ])
+    connection.commit()
+    connection.close()
+
+    engine = sqlalchemy.create_engine(f"sqlite:///{path}")
+    db.create_db_structure(engine)
+    session = db.create_session(engine)
+    progress = ScanProgress()
+    delta = sdf.save_files(session, str(tmp_path / "files"), progress=progress)
+    assert delta == sdf.ScanDelta([], [], [])
+    assert progress.stats.counters["files_hashed"] == progress.stats.counters["bytes_hashed"] == 0
+    assert session.query(db.File).filter(db.File.filesize.is_(None)).count() == 0
+    assert [sorted(file.name for file in group) for group in sdf.load_duplicate_files(session)] == [["a.txt", "b.txt"]]
+    session.close()
+    engine.dispose()
+
+
+def test_save_files_resumes_interrupted_scan_from_checkpoint(tmp_path, monkeypatch):
+    import threading
+    from core.progress import ScanCancelled, ScanProgress
+    monkeypatch.setattr("config.SCAN_CHECKPOINT_FILES", 2)
+    session = basic_database_create()
+    for directory in "abcd":
+        (tmp_path / directory).mkdir()
+        for index in range(2):
+            (tmp_path / directory / f"{index}.txt").write_text(f"content {index}")
+    saved_files = session.query(db.File).join(db.RootFolder).filter(db.RootFolder.path == str(tmp_path))
+
+    # the scan is cancelled during the second chunk of the walk, after the checkpoint of the first chunk
+    cancel = threading.Event()
+
+    def cancel_after_three_files(report):
+        if report.stage == "Reading metadata" and report.files_done >= 3:
+            cancel.set()
+
+    with pytest.raises(ScanCancelled):
+        sdf.save_files(session, str(tmp_path), progress=ScanProgress(cancel_after_three_files, cancel, interval=0))
+    job = sdf.load_scan_jobs(session, str(tmp_path))[0]
+    assert (job.status, job.stage, job.done) == (db.SCAN_JOB_INTERRUPTED, "Reading metadata", 1)
+    assert len(job.pending_directories) == job.pending == 4
+    saved_before = saved_files.count()
+    assert saved_before == 2
+
+    # the root folder listed before the interruption is not listed again and no file is saved twice
+    progress = ScanProgress()
+    delta = sdf.save_files(session, str(tmp_path), progress=progress)
+    assert progress.stats.counters["directories_walked"] == 4
+    assert len(delta.added) == 8 - saved_before
+    assert saved_files.count() == 8
+    assert sum(group[0].filename.startswith(str(tmp_path)) for group in sdf.load_duplicate_files(session)) == 2
+    job = sdf.load_scan_jobs(session, str(tmp_path))[0]
+    assert (job.status, job.pending, job.failed) == (db.SCAN_JOB_DONE, 0, 0)
+
+
+def test_get_hash_uses_configured_algorithm(monkeypatch):
+    import hashlib
+    from core import hashers
+    file = ROOT_FOLDER + "pes-seznamka-1.jpg"
+    with open(file, "rb") as f:
+        content = f.read()
+    monkeypatch.setattr("config.HASH_ALGORITHM", "blake2b-256")
+    assert sdf.get_hash(file) == hashlib.blake2b(content, digest_size=32).hexdigest()
+    assert sdf.get_hash(file, algorithm="sha1") == hashlib.sha1(content).hexdigest()
+    for algorithm in ("crc32", "blake2b-12", "md5-128"):
+        with pytest.raises(ValueError):
+            hashers.get_hasher(algorithm)
+
+
+def test_detect_duplicates_rehashes_files_of_previous_algorithm(monkeypatch):
+    session = basic_database_create()
+    monkeypatch.setattr("config.HASH_ALGORITHM", "sha1")
+    # the saved MD5 hashes are still compared by MD5
+    assert sdf.check_changed_files(session, paranoid=True) == []
+
+    sdf.save_files(session, ROOT_FOLDER)
+    groups = sdf.load_duplicate_files(session)
+    assert len(groups) == 4
+    assert {(file.hash_algorithm, len(file.filehash)) for group in groups for file in group} == {("sha1", 40)}
+
+
+def test_hamming_index_finds_same_pairs_as_comparing_all_pairs():
+    from core import perceptual
+    import random
+    rng = random.Random(0)
+    hashes = [rng.getrandbits(64) for _ in range(300)]
+    # the variants with a few changed bits
+    hashes += [value ^ (1 << rng.randrange(64)) ^ (1 << rng.randrange(64)) for value in hashes[:100]]
+    for max_distance in (0, 3, 6, 12):
+        expected = sorted(
+            (first, second, perceptual.hamming_distance(hashes[first], hashes[second]))
+            for second in range(len(hashes)) for first in range(second)
+            if perceptual.hamming_distance(hashes[first], hashes[second]) <= max_distance
+        )
+        assert sorted(perceptual.similar_pairs(enumerate(hashes), max_distance)) == expected
+
+
+def test_find_similar_images_skips_exact_duplicates(monkeypatch):
+    session = basic_database_create()
+    monkeypatch.setattr("config.PERCEPTUAL_HASH", "dhash")
+    # the hash with the highest bit is saved as the negative BIGINT
+    perceptual_hashes = {
+        'lavicka-duplicity.jpeg': 0xF0F0F0F0F0F0F0F0,
+        'rqhHrL.jpeg': 0xF0F0F0F0F0F0F0F0,
+        '02B_lavka02-e1602858635920.jpg': 0xF0F0F0F0F0F0F0F3,
+        'dog-gfb6b9f480_1280.jpg': 0x0123456789ABCDEF,
+    }
+    sdf.execute_in_batches(session, sqlalchemy.update(db.File), [
+        {
+            "id": session.query(db.File.id).filter(sdf.path_condition(ROOT_FOLDER + name)).scalar(),
+            "perceptual_hash": value,
+            "perceptual_algorithm": "dhash"
+        }
+        for name, value in perceptual_hashes.items()
+    ])
+    session.expire_all()
+
+    pairs = sdf.find_similar_images(session, max_distance=4)
+    # the byte-identical copies are listed only by load_duplicate_files()
+    assert sorted(
+        (sorted(os.path.basename(file.filename) for file in (pair.first, pair.second)), pair.distance) for pair in pairs
+    ) == [
+        (['02B_lavka02-e1602858635920.jpg', 'lavicka-duplicity.jpeg'], 2),
+        (['02B_lavka02-e1602858635920.jpg', 'rqhHrL.jpeg'], 2),
+    ]
+    assert {pair.first.perceptual_hash for pair in pairs} | {pair.second.perceptual_hash for pair in pairs} == {
+        0xF0F0F0F0F0F0F0F0, 0xF0F0F0F0F0F0F0F3
+    }
+
+
+def test_image_hash_of_resized_image_is_similar(tmp_path):
+    image_module = pytest.importorskip("PIL.Image")
+    from core import perceptual
+    original = ROOT_FOLDER + "lavicka-duplicity.jpeg"
+    with image_module.open(original) as image:
+        image.resize((image.width // 2, image.height // 2)).save(tmp_path / "small.jpeg", quality=70)
+    for algorithm in perceptual.ALGORITHMS:
+        distance = perceptual.hamming_distance(
+            perceptual.image_hash(original, algorithm), perceptual.image_hash(str(tmp_path / "small.jpeg"), algorithm)
+        )
+        assert distance <= 6
+    assert perceptual.image_hash(ROOT_FOLDER + "PUmFFwcN.html", "dhash") is None
+
+
+def test_iter_chunks_keeps_chunks_after_inserted_bytes():
+    import io
+    import random
+    from core import chunking
+    data = random.Random(0).randbytes(200_000)
+    edited = data[:50_000] + b"inserted bytes" + data[50_000:]
+    chunks = list(chunking.iter_chunks(io.BytesIO(data), 4096, 16384, buffer_size=1000))
+    edited_chunks = list(chunking.iter_chunks(io.BytesIO(edited), 4096, 16384))
+    assert sum(size for _, size in chunks) == len(data)
+    assert all(4096 <= size <= 16384 for _, size in chunks[:-1])
+    # only the chunks near the inserted bytes are changed
+    assert len(set(edited_chunks) - set(chunks)) <= 2
+
+
+def test_detect_chunks_reports_files_sharing_chunks(tmp_path, monkeypatch):
+    import random
+    monkeypatch.setattr("config.CHUNK_SCAN", True)
+    session = basic_database_create()
+    data = random.Random(0).randbytes(200_000)
+    (tmp_path / "disk.img").write_bytes(data)
+    (tmp_path / "disk-edited.img").write_bytes(data[:100_000] + b"patched" + data[100_000:])
+    (tmp_path / "other.img").write_bytes(random.Random(1).randbytes(100_000))
+    os.link(tmp_path / "disk.img", tmp_path / "disk-link.img")
+    sdf.save_files(session, str(tmp_path))
+
+    def tmp_pairs():
+        return [
+            (os.path.basename(pair.first.filename), os.path.basename(pair.second.filename), pair.ratio)
+            for pair in sdf.iter_chunk_pairs(session, 0.5) if pair.first.filename.startswith(str(tmp_path))
+        ]
+
+    # the hardlinks are split once
+    [(first, second, ratio)] = tmp_pairs()
+    assert "disk-edited.img" in (first, second)
+    assert ratio > 0.8
+    summary = sdf.summarize_chunks(session)
+    assert summary.reclaimable_bytes >= 0.8 * 200_000
+    assert summary.referenced_bytes - summary.stored_bytes == summary.reclaimable_bytes
+
+    # the chunks of the changed file are removed with their references
+    (tmp_path / "disk-edited.img").write_bytes(b"small")
+    sdf.save_files(session, str(tmp_path))
+    assert tmp_pairs() == []
+    assert sdf.summarize_chunks(session).reclaimable_bytes < summary.reclaimable_bytes - 0.8 * 200_000
+    assert session.query(db.Chunk).filter(db.Chunk.refcount <= 0).count() == 0
+
+
+def test_delete_root_folders_deletes_rows_of_root_folder_by_cascade(tmp_path, monkeypatch):
+    import random
+    monkeypatch.setattr("config.CHUNK_SCAN", True)
+    session = basic_database_create()
+    other_files = session.query(db.File).count()
+    data = random.Random(0).randbytes(100_000)
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "disk.img").write_bytes(data)
+    (tmp_path / "sub" / "disk-copy.img").write_bytes(data)
+    sdf.save_files(session, str(tmp_path))
+    root_folder_id = session.query(db.RootFolder.id).filter(db.RootFolder.path == str(tmp_path)).scalar()
+    file_ids = [file.id for file in session.query(db.File.id).filter(db.File.root_folder_id == root_folder_id)]
+    assert len(file_ids) == 2
+    assert session.query(db.FileChunk).filter(db.FileChunk.file_id.in_(file_ids)).count() > 0
+
+    assert sdf.delete_root_folders(session, [root_folder_id]) == 1
+    assert session.query(db.RootFolder).filter(db.RootFolder.id == root_folder_id).count() == 0
+    for model in (db.File, db.Directory, db.ScanJob):
+        assert session.query(model).filter(model.root_folder_id == root_folder_id).count() == 0
+    assert session.query(db.FileChunk).filter(db.FileChunk.file_id.in_(file_ids)).count() == 0
+    assert session.query(db.Chunk).filter(db.Chunk.refcount <= 0).count() == 0
+    assert session.query(db.File).count() == other_files
+
+
+def test_save_changed_files_updates_and_deletes_files_in_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr("config.DB_BATCH_SIZE", 2)
+    session = basic_database_create()
+    for index in range(5):
+        (tmp_path / f"file{index}.txt").write_text("content")
+    sdf.save_files(session, str(tmp_path))
+    (tmp_path / "file0.txt").write_text("changed content")
+    (tmp_path / "file1.txt").unlink()
+
+    sdf.save_changed_files(session, [str(tmp_path / "file0.txt"), str(tmp_path / "file1.txt")])
+    saved_files = {
+        os.path.basename(file.filename): file
+        for file in session.query(db.File).join(db.RootFolder).filter(db.RootFolder.path == str(tmp_path))
+    }
+    assert sorted(saved_files) == ["file0.txt", "file2.txt", "file3.txt", "file4.txt"]
+    assert saved_files["file0.txt"].filesize == len("changed content")
+    assert saved_files["file0.txt"].filehash == saved_files["file0.txt"].partial_hash is None
+
+
+def test_hash_files_by_location_reads_devices_in_parallel_in_order_of_inodes(monkeypatch):
+    import threading
+    import time
+    # the device 1 is the rotational disk, the device 2 is SSD
+    monkeypatch.setattr(sdf.scheduler, "is_rotational", lambda device: device == 1)
+    monkeypatch.setattr("config.HASH_WORKERS_ROTATIONAL", 1)
+    reads = list()
+
+    def read(path_file):
+        reads.append((path_file, threading.current_thread().name))
+        time.sleep(0.001)
+        return path_file.upper()
+
+    files = [((device, inode), f"file-{device}-{inode}") for inode in (5, 3, 9, 1) for device in (1, 2)]
+    hashes = list(sdf.hash_files(files, read, workers=3, location=lambda item: item))
+    assert sorted(hashes) == sorted((item, path_file.upper()) for item, path_file in files)
+    rotational_reads = [(path_file, thread) for path_file, thread in reads if path_file.startswith("file-1-")]
+    assert [path_file for path_file, _ in rotational_reads] == [f"file-1-{inode}" for inode in (1, 3, 5, 9)]
+    assert len({thread for _, thread in rotational_reads}) == 1
+    assert len({thread for path_file, thread in reads if path_file.startswith("file-2-")}) > 1
+
+
+def test_hash_files_by_location_stops_readers_when_consumer_stops():
+    import threading
+
+    def read(path_file):
+        if path_file == "failed":
+            raise ValueError(path_file)
+        return path_file
+
+    files = [((index % 2, index), str(index)) for index in range(1000)]
+    hashes = sdf.hash_files(files, read, workers=2, location=lambda item: item)
+    next(hashes)
+    hashes.close()
+    with pytest.raises(ValueError):
+        list(sdf.hash_files(files + [((0, 0), "failed")], read, workers=2, location=lambda item: item))
+    assert not [thread for thread in threading.enumerate() if thread.name.startswith("reader-")]